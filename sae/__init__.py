@@ -0,0 +1,139 @@
+"""Python tools accompanying the *Guidelines to Small Area Estimation for
+Poverty Mapping*.
+
+The book's worked examples are written in Stata. This package provides
+vectorized NumPy implementations of the computationally heavy steps so that
+the simulation experiments in the book can be run at census scale.
+"""
+
+from .accumulators import BiasMSEAccumulator
+from .aggregates import CensusAggregates, GroupColumn, census_aggregates
+from .boosting import (
+    BinnedFeatures,
+    HistGradientBoosting,
+    area_means,
+    bin_features,
+    boosting_mse,
+)
+from .bootstrap import bootstrap_mse
+from .calibration import CalibrationFit, calibrate, greg_estimates
+from .census import CensusDesign, CensusStore, import_census
+from .censuseb import EBSpec, censuseb, censuseb_many, eb_effects
+from .direct import direct_estimates
+from .fayherriot import FHData, FHFit, fh_data, fh_eblup, fhsae, fit_fh, fit_fh_batch
+from .fgt import (
+    FGTAccumulator,
+    PovertyLines,
+    fgt_contributions,
+    grouped_fgt,
+    grouped_fgt_lines,
+)
+from .fhmse import fh_bootstrap_mse, fh_mse
+from .henderson import H3Fit, H3Stats, fit_h3, h3, h3_stats
+from .index import AreaIndex, NestedIndex, nested_index
+from .nested_error import (
+    NestedErrorFit,
+    NestedErrorStats,
+    fit_reml,
+    reml,
+    sufficient_stats,
+)
+from .replicates import ReplicateDesign, replicate_estimates
+from .selection import backward_elimination, stepwise_vif
+from .streams import RandomStreams
+from .simulation import (
+    CensusEBBatch,
+    CensusEBEstimator,
+    ModelSimulation,
+    load_checkpoint,
+    save_checkpoint,
+)
+from .twofold import (
+    TwoFoldEffects,
+    TwoFoldFit,
+    TwoFoldStats,
+    censuseb_twofold,
+    fit_twofold,
+    reml_twofold,
+    twofold_effects,
+    twofold_stats,
+)
+from .validation import (
+    TwoStageSample,
+    TwoStageSampler,
+    design_validation,
+    true_values,
+)
+
+__all__ = [
+    "AreaIndex",
+    "BiasMSEAccumulator",
+    "BinnedFeatures",
+    "CalibrationFit",
+    "CensusAggregates",
+    "CensusDesign",
+    "CensusEBBatch",
+    "CensusEBEstimator",
+    "CensusStore",
+    "EBSpec",
+    "FGTAccumulator",
+    "FHData",
+    "FHFit",
+    "GroupColumn",
+    "H3Fit",
+    "H3Stats",
+    "HistGradientBoosting",
+    "ModelSimulation",
+    "NestedErrorFit",
+    "NestedErrorStats",
+    "NestedIndex",
+    "PovertyLines",
+    "RandomStreams",
+    "ReplicateDesign",
+    "TwoFoldEffects",
+    "TwoFoldFit",
+    "TwoFoldStats",
+    "TwoStageSample",
+    "TwoStageSampler",
+    "area_means",
+    "backward_elimination",
+    "bin_features",
+    "boosting_mse",
+    "bootstrap_mse",
+    "calibrate",
+    "census_aggregates",
+    "censuseb",
+    "censuseb_many",
+    "censuseb_twofold",
+    "design_validation",
+    "direct_estimates",
+    "eb_effects",
+    "fgt_contributions",
+    "fh_bootstrap_mse",
+    "fh_data",
+    "fh_eblup",
+    "fh_mse",
+    "fhsae",
+    "fit_fh",
+    "fit_fh_batch",
+    "fit_h3",
+    "fit_reml",
+    "fit_twofold",
+    "greg_estimates",
+    "grouped_fgt",
+    "grouped_fgt_lines",
+    "h3",
+    "h3_stats",
+    "import_census",
+    "load_checkpoint",
+    "nested_index",
+    "reml",
+    "reml_twofold",
+    "replicate_estimates",
+    "save_checkpoint",
+    "stepwise_vif",
+    "sufficient_stats",
+    "true_values",
+    "twofold_effects",
+    "twofold_stats",
+]
@@ -0,0 +1,73 @@
+"""Process pool for independent Monte Carlo replicates.
+
+The bootstrap and repeated-sampling routines (:mod:`sae.bootstrap`,
+:mod:`sae.fhmse`, :mod:`sae.boosting` and :mod:`sae.validation`) run many
+replicates that share one large read-only state. :func:`run_replicates`
+ships that state once to every worker through the pool initializer and
+hands each worker an interleaved chunk of replicate seeds. Replicate
+:math:`b` always draws from child :math:`b` of the root
+:class:`numpy.random.SeedSequence`, so results do not depend on the number
+of workers.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+_STATE = {}
+
+
+def _init_worker(fn, state):
+    _STATE.clear()
+    _STATE.update(state, _fn=fn)
+
+
+def _run_chunk(seeds):
+    return _STATE["_fn"](_STATE, seeds)
+
+
+def spawn(seed, n):
+    """Child seed sequences of ``seed`` (an int, ``None`` or a sequence) for ``n`` replicates."""
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(n)
+
+
+def n_workers(workers, n):
+    """Number of processes for ``n`` replicates; ``os.cpu_count()`` by default."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, n))
+
+
+def run_replicates(fn, state, seeds, workers=None):
+    """Run ``fn(state, chunk)`` over chunks of ``seeds``.
+
+    Parameters
+    ----------
+    fn : callable
+        Module-level function returning the partial result of a chunk of
+        seeds, e.g. a sum over its replicates.
+    state : dict
+        Read-only state shared by all replicates. It is pickled once per
+        worker when ``workers > 1``.
+    seeds : list of numpy.random.SeedSequence
+        One seed per replicate, from :func:`spawn`.
+    workers : int, optional
+        Number of worker processes, see :func:`n_workers`; ``1`` runs in the
+        current process.
+
+    Returns
+    -------
+    list
+        Partial results, one per worker.
+    """
+    workers = n_workers(workers, len(seeds))
+    if workers == 1:
+        return [fn(state, seeds)]
+    chunks = [seeds[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(fn, state)) as pool:
+        return list(pool.map(_run_chunk, chunks))
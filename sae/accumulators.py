@@ -0,0 +1,143 @@
+"""Running bias and MSE of simulation experiments.
+
+In the off-census chapter each iteration's bias and squared error are
+merged into a ``Stats`` tempfile and added with
+``replace i_bias_jT = i_bias_jT + i_bias_j`` for every method and indicator.
+:class:`BiasMSEAccumulator` keeps, for every (method, indicator) pair and
+every area, Welford running means and sums of squared deviations of the
+error :math:`d = \\hat\\theta - \\theta` and of :math:`d^2`. Updates are
+:math:`O(1)` per area, the Monte Carlo standard errors of the empirical bias
+and MSE come for free, and accumulators from different workers or from a
+checkpoint are combined exactly with the pairwise formulas of Chan, Golub
+and LeVeque (1979).
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+# Rows of the moments array of every key.
+_MEAN_D, _M2_D, _MEAN_S, _M2_S = range(4)
+
+
+class BiasMSEAccumulator:
+    """Welford accumulators of estimation errors keyed by method and indicator."""
+
+    def __init__(self):
+        self.n = {}
+        self.moments = {}
+
+    def __contains__(self, key):
+        return key in self.moments
+
+    def keys(self):
+        """``(method, indicator)`` pairs seen so far."""
+        return list(self.moments)
+
+    def update(self, method, indicator, estimate, truth):
+        """Add one iteration's area estimates and true values."""
+        d = np.asarray(estimate, dtype=np.float64) - np.asarray(truth, dtype=np.float64)
+        key = (method, indicator)
+        if key not in self.moments:
+            self.n[key] = 0
+            self.moments[key] = np.zeros((4,) + d.shape)
+        self.n[key] += 1
+        n = self.n[key]
+        m = self.moments[key]
+        for x, mean, m2 in ((d, _MEAN_D, _M2_D), (d * d, _MEAN_S, _M2_S)):
+            delta = x - m[mean]
+            m[mean] += delta / n
+            m[m2] += delta * (x - m[mean])
+        return self
+
+    def merge(self, other):
+        """Combine with an accumulator built on other iterations."""
+        for key, mb in other.moments.items():
+            nb = other.n[key]
+            if key not in self.moments:
+                self.n[key] = nb
+                self.moments[key] = mb.copy()
+                continue
+            na = self.n[key]
+            ma = self.moments[key]
+            n = na + nb
+            for mean, m2 in ((_MEAN_D, _M2_D), (_MEAN_S, _M2_S)):
+                delta = mb[mean] - ma[mean]
+                ma[m2] += mb[m2] + delta * delta * (na * nb / n)
+                ma[mean] += delta * (nb / n)
+            self.n[key] = n
+        return self
+
+    def bias(self, method, indicator):
+        """Empirical bias by area."""
+        return self.moments[method, indicator][_MEAN_D].copy()
+
+    def mse(self, method, indicator):
+        """Empirical MSE by area."""
+        return self.moments[method, indicator][_MEAN_S].copy()
+
+    def se_bias(self, method, indicator):
+        """Monte Carlo standard error of the empirical bias."""
+        return self._se(method, indicator, _M2_D)
+
+    def se_mse(self, method, indicator):
+        """Monte Carlo standard error of the empirical MSE."""
+        return self._se(method, indicator, _M2_S)
+
+    def _se(self, method, indicator, row):
+        n = self.n[method, indicator]
+        return np.sqrt(self.moments[method, indicator][row] / max(n - 1, 1) / n)
+
+    def result(self, labels=None):
+        """Flat dict in the layout of ``bias_in_mymodel.dta``.
+
+        Keys are ``"<method>_bias_<indicator>"``, ``"<method>_mse_<indicator>"``
+        and the same with an ``"_se"`` suffix for the Monte Carlo standard
+        errors, plus ``"area"`` if ``labels`` is given.
+        """
+        out = {} if labels is None else {"area": labels}
+        for method, indicator in self.moments:
+            out["%s_bias_%s" % (method, indicator)] = self.bias(method, indicator)
+            out["%s_mse_%s" % (method, indicator)] = self.mse(method, indicator)
+            out["%s_bias_%s_se" % (method, indicator)] = self.se_bias(method, indicator)
+            out["%s_mse_%s_se" % (method, indicator)] = self.se_mse(method, indicator)
+        return out
+
+    def state(self):
+        """Arrays describing the accumulator, for :func:`numpy.savez`.
+
+        The moments of the ``i``-th key are stored as ``acc_moments_<i>``,
+        since keys may differ in shape (e.g. ``(D, K)`` FGT over a grid of
+        poverty lines next to ``(D,)`` means).
+        """
+        keys = list(self.moments)
+        state = {
+            "acc_methods": np.array([k[0] for k in keys], dtype=str),
+            "acc_indicators": np.array([k[1] for k in keys], dtype=str),
+            "acc_n": np.array([self.n[k] for k in keys], dtype=np.int64),
+        }
+        for i, key in enumerate(keys):
+            state["acc_moments_%d" % i] = self.moments[key]
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild an accumulator from :meth:`state`."""
+        acc = cls()
+        for i, (method, indicator, n) in enumerate(
+            zip(state["acc_methods"], state["acc_indicators"], state["acc_n"])
+        ):
+            key = (str(method), str(indicator))
+            acc.n[key] = int(n)
+            acc.moments[key] = np.array(state["acc_moments_%d" % i], dtype=np.float64)
+        return acc
+
+    def save(self, path):
+        """Write the accumulator to a ``.npz`` checkpoint."""
+        np.savez(path, **self.state())
+
+    @classmethod
+    def load(cls, path):
+        """Read an accumulator written by :meth:`save`."""
+        with np.load(path) as f:
+            return cls.from_state(f)
@@ -0,0 +1,201 @@
+"""Census aggregates at every level of a geographic hierarchy.
+
+Unit-context models use area and PSU means of the census covariates, built
+in the book with ``groupfunction, mean(x*) merge by(area psu)`` or with one
+``collapse (mean) x*`` and one ``merge n:1`` per level, which creates
+``meanpsu_x*`` and ``meanarea_x*`` household variables.
+
+:func:`census_aggregates` sorts the identifiers of the hierarchy (e.g.
+state, municipality, PSU) once to code every household by its finest group,
+then makes a single pass over every variable, in census order, to total it
+by group. Coarser levels are reductions of those totals, so adding a level
+costs nothing per household. Results are brought back to households as
+:class:`GroupColumn` objects, which hold only the group values and one
+shared ``int32`` group code per household and are evaluated lazily: a
+household column is built, as a copy, only for the rows that are read.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+class GroupColumn:
+    """Household column holding a value of its group, evaluated lazily.
+
+    ``column[rows]`` returns a new array ``values[group[rows]]`` for those
+    rows only, and ``numpy.asarray(column)`` builds the full column. It is
+    not a view: nothing is shared with the census or between reads.
+    ``group`` maps every household, in the order of the census, to a
+    position in ``values`` and is shared by all columns of an aggregation.
+    """
+
+    def __init__(self, values, group):
+        self.values = values
+        self.group = group
+        self.shape = group.shape + values.shape[1:]
+        self.dtype = values.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        return self.values[self.group[rows]]
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.values[self.group]
+        return out if dtype is None else out.astype(dtype)
+
+
+class CensusAggregates:
+    """Counts, means and shares produced by :func:`census_aggregates`.
+
+    Levels are identified by the names given to :func:`census_aggregates`,
+    from the coarsest to the finest. Group arrays of a level are ordered by
+    the identifiers of the level and its ancestors.
+    """
+
+    def __init__(self, levels, keys, parent, group, count, weight, sums, shares, categories):
+        self.levels = list(levels)
+        self.keys = keys  # level -> {ancestor or level name: ids by group}
+        self.parent = parent  # level -> group of the level of every finest group
+        self.group = group  # finest group of every household, census order
+        self._count = count
+        self._weight = weight
+        self._sums = sums
+        self._shares = shares
+        self.categories = categories
+
+    def __len__(self):
+        return self.group.size
+
+    def count(self, level):
+        """Number of households of every group."""
+        return self._count[level]
+
+    def total_weight(self, level):
+        """Sum of the weights of every group (the count if unweighted)."""
+        return self._weight[level]
+
+    def mean(self, level, names):
+        """(Weighted) means of one variable ``(G,)`` or several ``(G, p)``."""
+        if isinstance(names, str):
+            return self._sums[level][names] / self._weight[level]
+        return np.column_stack([self.mean(level, name) for name in names])
+
+    def share(self, level, name):
+        """(Weighted) share of every category of a variable, ``(G, K)``.
+
+        Columns follow ``categories[name]``.
+        """
+        return self._shares[level][name] / self._weight[level][:, None]
+
+    def broadcast(self, level, values):
+        """Bring group values of ``level`` back to households."""
+        return GroupColumn(np.asarray(values)[self.parent[level]], self.group)
+
+    def columns(self, level, prefix=None):
+        """Household columns of every mean and share of ``level``.
+
+        Names follow the book's ``mean<level>_<var>`` (e.g. ``meanpsu_x1``)
+        and ``mean<level>_<var>_<category>`` for shares, unless another
+        ``prefix`` is given.
+        """
+        if prefix is None:
+            prefix = "mean%s_" % level
+        out = {}
+        for name in self._sums[level]:
+            out[prefix + name] = self.broadcast(level, self.mean(level, name))
+        for name in self._shares[level]:
+            share = self.share(level, name)
+            for k, cat in enumerate(self.categories[name]):
+                out["%s%s_%s" % (prefix, name, cat)] = self.broadcast(level, share[:, k])
+        return out
+
+
+def _reduce_groups(a, starts):
+    """Totals of consecutive groups of rows of ``a`` beginning at ``starts``."""
+    return np.add.reduceat(a, starts, axis=0)
+
+
+def census_aggregates(data, levels, variables=(), categorical=(), weights=None):
+    """Aggregate household variables at every level of a hierarchy.
+
+    Parameters
+    ----------
+    data : CensusStore or mapping of str to ndarray
+        Household variables, all of length ``N``.
+    levels : sequence of str
+        Identifier variables of the hierarchy from the coarsest to the
+        finest, e.g. ``("state", "mun", "psu")``. Identifiers need only be
+        unique within their parent.
+    variables : sequence of str
+        Variables whose (weighted) means are wanted.
+    categorical : sequence of str
+        Variables whose (weighted) category shares are wanted.
+    weights : str, optional
+        Household expansion factor (e.g. ``"hhsize"``).
+
+    Returns
+    -------
+    CensusAggregates
+    """
+    levels = list(levels)
+    ids = [np.asarray(data[name]) for name in levels]
+    n = ids[0].size
+    order = slice(None)
+    tie = np.ones(max(n - 1, 0), dtype=bool)
+    for x in ids:
+        if np.any(tie & (x[1:] < x[:-1])):
+            order = np.lexsort(ids[::-1])
+            break
+        tie &= x[1:] == x[:-1]
+    sorted_ids = [x[order] for x in ids]
+
+    # Finest groups, and where each level starts among them.
+    changes = []
+    change = np.zeros(n, dtype=bool)
+    if n:
+        change[0] = True
+    for x in sorted_ids:
+        change = change.copy()
+        change[1:] |= x[1:] != x[:-1]
+        changes.append(change)
+    starts = np.flatnonzero(changes[-1])
+    n_groups = starts.size
+    group = np.empty(n, dtype=np.int32)
+    group[order] = np.cumsum(changes[-1]) - 1
+
+    # Variables are read once, in census order, and totalled by group code.
+    w = None if weights is None else np.asarray(data[weights], dtype=np.float64)
+    count = np.diff(np.append(starts, n))
+    weight = count.astype(np.float64) if w is None else np.bincount(group, w, n_groups)
+    sums = {}
+    for name in variables:
+        x = np.asarray(data[name], dtype=np.float64)
+        sums[name] = np.bincount(group, x if w is None else x * w, n_groups)
+    shares, categories = {}, {}
+    for name in categorical:
+        categories[name], code = np.unique(np.asarray(data[name]), return_inverse=True)
+        K = categories[name].size
+        cell = group.astype(np.int64) * K + code
+        shares[name] = np.bincount(cell, w, n_groups * K).reshape(n_groups, K)
+
+    out_keys, out_parent, out_count, out_weight, out_sums, out_shares = {}, {}, {}, {}, {}, {}
+    for k, level in enumerate(levels):
+        first = changes[k][starts]
+        level_starts = np.flatnonzero(first)
+        out_parent[level] = np.cumsum(first) - 1
+        out_keys[level] = {
+            levels[j]: sorted_ids[j][starts[level_starts]] for j in range(k + 1)
+        }
+        out_count[level] = _reduce_groups(count, level_starts)
+        out_weight[level] = _reduce_groups(weight, level_starts)
+        out_sums[level] = {name: _reduce_groups(s, level_starts) for name, s in sums.items()}
+        out_shares[level] = {
+            name: _reduce_groups(s, level_starts) for name, s in shares.items()
+        }
+    return CensusAggregates(
+        levels, out_keys, out_parent, group, out_count, out_weight,
+        out_sums, out_shares, categories,
+    )
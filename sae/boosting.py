@@ -0,0 +1,449 @@
+"""Histogram gradient boosting for PSU- or area-level poverty models.
+
+Python counterpart of the gradient boosting approach of the off-census
+chapter: the target is the direct headcount of every sampled PSU (or
+municipality), the features are census aggregates at the same level, and
+area estimates are population-weighted means of the predictions for every
+census PSU.
+
+Features are binned once with :func:`bin_features`, for all census PSUs,
+into at most 256 quantile bins stored as ``uint8``. Training rows are
+positions into that matrix, so neither the model nor the bootstrap rebins
+anything. Trees are grown level by level. For every level the
+gradient and hessian histograms of all nodes are built with
+:func:`numpy.bincount`, which releases the GIL, over blocks of features on a
+thread pool. Split gains are then evaluated for every node, feature and
+bin at once from cumulative sums of the histograms.
+
+:func:`boosting_mse` estimates the MSE of the area predictions by a residual
+bootstrap. It follows the same idea as the parametric bootstrap of
+:mod:`sae.bootstrap`, and its replicates run on a process pool.
+"""
+
+from __future__ import annotations
+
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from ._pool import n_workers, run_replicates, spawn
+from .index import as_index
+
+
+class BinnedFeatures(NamedTuple):
+    """Feature matrix binned by :func:`bin_features`."""
+
+    codes: np.ndarray  # bin of every row and feature, (n, F) uint8
+    edges: tuple  # upper edge of every bin but the last, per feature
+
+    def bin(self, X):
+        """Bin new rows with the same edges."""
+        X = np.asarray(X, dtype=np.float64)
+        codes = np.empty(X.shape, dtype=np.uint8)
+        for j, edges in enumerate(self.edges):
+            codes[:, j] = np.searchsorted(edges, X[:, j], side="left")
+        return codes
+
+
+def bin_features(X, max_bins=256):
+    """Bin every column of ``X`` into at most ``max_bins`` quantile bins.
+
+    Columns with at most ``max_bins`` distinct values get one bin per value,
+    split at midpoints. Row ``i`` falls in bin ``k`` of feature ``j`` when
+    ``edges[j][k - 1] < X[i, j] <= edges[j][k]``.
+
+    Parameters
+    ----------
+    X : ndarray
+        Features ``(n, F)``, e.g. aggregates of every census PSU.
+    max_bins : int
+        Number of bins, at most 256.
+
+    Returns
+    -------
+    BinnedFeatures
+    """
+    if not 2 <= max_bins <= 256:
+        raise ValueError("max_bins must be between 2 and 256")
+    X = np.asarray(X, dtype=np.float64)
+    edges = []
+    for col in X.T:
+        values = np.unique(col)
+        if values.size <= max_bins:
+            cut = (values[1:] + values[:-1]) / 2.0
+        else:
+            cut = np.unique(np.quantile(col, np.linspace(0.0, 1.0, max_bins + 1)[1:-1]))
+        edges.append(cut)
+    binned = BinnedFeatures(np.empty(X.shape, dtype=np.uint8), tuple(edges))
+    binned.codes[:] = binned.bin(X)
+    return binned
+
+
+class _Tree(NamedTuple):
+    feature: np.ndarray  # -1 for leaves
+    bin: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    value: np.ndarray
+    depth: int
+
+    def predict(self, codes):
+        node = np.zeros(codes.shape[0], dtype=np.intp)
+        rows = np.arange(codes.shape[0])
+        for _ in range(self.depth):
+            f = self.feature[node]
+            go_left = codes[rows, np.maximum(f, 0)] <= self.bin[node]
+            node = np.where(f >= 0, np.where(go_left, self.left[node], self.right[node]), node)
+        return self.value[node]
+
+
+class HistGradientBoosting:
+    """Least-squares gradient boosting on binned features.
+
+    Parameters
+    ----------
+    learning_rate : float
+        Shrinkage applied to every tree.
+    max_iter : int
+        Maximum number of trees.
+    max_depth : int
+        Depth of every tree.
+    min_samples_leaf : int
+        Minimum number of training rows in a leaf.
+    l2_regularization : float
+        L2 penalty on leaf values.
+    early_stopping : bool
+        Hold out ``validation_fraction`` of the training rows and stop once
+        their weighted squared error has not improved by ``tol`` for
+        ``n_iter_no_change`` trees; the best number of trees is kept.
+    validation_fraction : float
+        Share of the rows held out for early stopping.
+    n_iter_no_change : int
+        Patience of early stopping.
+    tol : float
+        Minimum improvement of the validation loss.
+    n_threads : int, optional
+        Threads used to build histograms. Defaults to ``os.cpu_count()``.
+    seed : int, optional
+        Seed of the validation split.
+    """
+
+    def __init__(
+        self,
+        learning_rate=0.1,
+        max_iter=200,
+        max_depth=3,
+        min_samples_leaf=20,
+        l2_regularization=0.0,
+        early_stopping=True,
+        validation_fraction=0.1,
+        n_iter_no_change=10,
+        tol=1e-7,
+        n_threads=None,
+        seed=None,
+    ):
+        self.learning_rate = learning_rate
+        self.max_iter = max_iter
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.l2_regularization = l2_regularization
+        self.early_stopping = early_stopping
+        self.validation_fraction = validation_fraction
+        self.n_iter_no_change = n_iter_no_change
+        self.tol = tol
+        self.n_threads = n_threads
+        self.seed = seed
+
+    def params(self):
+        """Constructor arguments, to build an unfitted copy."""
+        names = inspect.signature(type(self)).parameters
+        return {name: getattr(self, name) for name in names}
+
+    def fit(self, features, y, sample_weight=None, rows=None):
+        """Fit the model.
+
+        Parameters
+        ----------
+        features : BinnedFeatures
+            Binned features, e.g. of every census PSU.
+        y : ndarray
+            Target of the training rows (e.g. PSU direct headcounts).
+        sample_weight : ndarray, optional
+            Weight of every training row.
+        rows : ndarray, optional
+            Positions of the training rows in ``features``; all by default.
+
+        Returns
+        -------
+        self
+        """
+        codes = features.codes if rows is None else features.codes[rows]
+        y = np.asarray(y, dtype=np.float64)
+        if sample_weight is None:
+            w = np.ones(y.size)
+        else:
+            w = np.asarray(sample_weight, dtype=np.float64)
+        n_bins = int(codes.max()) + 1 if codes.size else 1
+
+        fit_rows = np.arange(y.size)
+        val_rows = fit_rows[:0]
+        if self.early_stopping:
+            n_val = int(self.validation_fraction * y.size)
+            if n_val > 0 and y.size - n_val >= 2 * self.min_samples_leaf:
+                perm = np.random.default_rng(self.seed).permutation(y.size)
+                val_rows, fit_rows = np.sort(perm[:n_val]), np.sort(perm[n_val:])
+
+        codes_fit, y_fit, w_fit = codes[fit_rows], y[fit_rows], w[fit_rows]
+        self.baseline_ = float(w_fit @ y_fit / w_fit.sum())
+        pred_fit = np.full(y_fit.size, self.baseline_)
+        pred_val = np.full(val_rows.size, self.baseline_)
+        self.trees_ = []
+        self.validation_loss_ = []
+        best, best_iter = np.inf, 0
+        n_threads = self.n_threads or os.cpu_count() or 1
+        with ThreadPoolExecutor(n_threads) as pool:
+            for it in range(self.max_iter):
+                grad = w_fit * (pred_fit - y_fit)
+                tree = self._grow(codes_fit, grad, w_fit, n_bins, pool, n_threads)
+                self.trees_.append(tree)
+                pred_fit += tree.predict(codes_fit)
+                if val_rows.size:
+                    pred_val += tree.predict(codes[val_rows])
+                    r = pred_val - y[val_rows]
+                    loss = float(w[val_rows] @ (r * r) / w[val_rows].sum())
+                    self.validation_loss_.append(loss)
+                    if loss < best - self.tol:
+                        best, best_iter = loss, it
+                    elif it - best_iter >= self.n_iter_no_change:
+                        break
+        if val_rows.size:
+            del self.trees_[best_iter + 1 :]
+        self.n_iter_ = len(self.trees_)
+        return self
+
+    def predict(self, features, rows=None):
+        """Predictions for the rows of ``features`` (all by default)."""
+        codes = features.codes if rows is None else features.codes[rows]
+        pred = np.full(codes.shape[0], self.baseline_)
+        for tree in self.trees_:
+            pred += tree.predict(codes)
+        return pred
+
+    def _grow(self, codes, grad, hess, n_bins, pool, n_threads):
+        """Grow one tree level by level."""
+        lam = self.l2_regularization
+        min_leaf = self.min_samples_leaf
+        feature, split_bin, left, right, value = [-1], [0], [-1], [-1], [0.0]
+        active = np.zeros(1, dtype=np.intp)  # tree nodes of the current level
+        node = np.zeros(codes.shape[0], dtype=np.intp)  # position in active, -1 if done
+        depth = 0
+        for depth in range(self.max_depth + 1):
+            live = np.flatnonzero(node >= 0)
+            pos = node[live]
+            Gt = np.bincount(pos, grad[live], active.size)
+            Ht = np.bincount(pos, hess[live], active.size)
+            parent = Gt * Gt / (Ht + lam)
+            split = np.zeros(active.size, dtype=bool)
+            if depth < self.max_depth and n_bins > 1:
+                G, H, C = _histograms(
+                    codes[live], pos, grad[live], hess[live], active.size, n_bins, pool, n_threads
+                )
+                Ct = np.bincount(pos, minlength=active.size)[:, None, None]
+                GL = np.cumsum(G, axis=2)[:, :, :-1]
+                HL = np.cumsum(H, axis=2)[:, :, :-1]
+                CL = np.cumsum(C, axis=2)[:, :, :-1]
+                GR = Gt[:, None, None] - GL
+                HR = Ht[:, None, None] - HL
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    gain = GL * GL / (HL + lam) + GR * GR / (HR + lam)
+                gain[(CL < min_leaf) | (Ct - CL < min_leaf)] = -np.inf
+                gain = gain.reshape(active.size, -1)
+                best = gain.argmax(axis=1)
+                best_gain = gain[np.arange(active.size), best] - parent
+                split = best_gain > 1e-12 * np.maximum(np.abs(parent), 1.0)
+                best_f, best_b = np.divmod(best, n_bins - 1)
+
+            children = np.full(active.size, -1, dtype=np.intp)
+            for a in range(active.size):
+                t = active[a]
+                if split[a]:
+                    feature[t], split_bin[t] = int(best_f[a]), int(best_b[a])
+                    left[t], right[t] = len(feature), len(feature) + 1
+                    children[a] = 2 * int(split[:a].sum())
+                    feature += [-1, -1]
+                    split_bin += [0, 0]
+                    left += [-1, -1]
+                    right += [-1, -1]
+                    value += [0.0, 0.0]
+                else:
+                    value[t] = -self.learning_rate * Gt[a] / (Ht[a] + lam)
+            if not split.any():
+                break
+            go_right = codes[live, best_f[pos]] > best_b[pos]
+            node[live] = np.where(split[pos], children[pos] + go_right, -1)
+            parents = active[split]
+            active = np.stack([np.take(left, parents), np.take(right, parents)], axis=1).ravel()
+        return _Tree(
+            np.asarray(feature), np.asarray(split_bin), np.asarray(left),
+            np.asarray(right), np.asarray(value), depth,
+        )
+
+
+def _histograms(codes, node, grad, hess, n_nodes, n_bins, pool, n_threads):
+    """Gradient, hessian and count histograms, ``(n_nodes, F, n_bins)`` each."""
+    n, F = codes.shape
+    blocks = [b for b in np.array_split(np.arange(F), n_threads) if b.size]
+
+    def one(block):
+        k = block.size
+        key = (node[:, None] * k + np.arange(k)) * n_bins + codes[:, block]
+        key = key.ravel()
+        size = n_nodes * k * n_bins
+        shape = (n_nodes, k, n_bins)
+        return (
+            np.bincount(key, np.repeat(grad, k), size).reshape(shape),
+            np.bincount(key, np.repeat(hess, k), size).reshape(shape),
+            np.bincount(key, minlength=size).reshape(shape),
+        )
+
+    parts = list(pool.map(one, blocks)) if len(blocks) > 1 else [one(blocks[0])]
+    return tuple(np.concatenate(p, axis=1) for p in zip(*parts))
+
+
+def area_means(pred, area, size=None):
+    """Area (size-weighted) means of PSU predictions.
+
+    Returns
+    -------
+    labels, means : ndarray
+    """
+    index = as_index(area)
+    size = None if size is None else index.sort(size)
+    return index.labels, index.mean(index.sort(pred), size)
+
+
+def _replicate(s, seed):
+    """Squared error of the area predictions for one bootstrap population."""
+    rng = np.random.default_rng(seed)
+    u = rng.choice(s["ubar"], s["n_areas"])
+    e = rng.choice(s["within"], s["rows"].size)
+    true = s["fit_area"] + u
+    y = s["fit_rows"] + u[s["row_area"]] + e
+    params = dict(s["params"], seed=int(rng.integers(2 ** 31)))
+    model = HistGradientBoosting(**params).fit(s["features"], y, s["weights"], s["rows"])
+    _, est = area_means(model.predict(s["features"]), s["index"], s["size"])
+    return (est - true) ** 2
+
+
+def _run_chunk(state, seeds):
+    total = 0.0
+    for seed in seeds:
+        total = total + _replicate(state, seed)
+    return total
+
+
+def boosting_mse(
+    model,
+    features,
+    rows,
+    y,
+    area,
+    size=None,
+    sample_weight=None,
+    bsrep=100,
+    seed=None,
+    workers=None,
+):
+    """Residual bootstrap MSE of gradient boosting area predictions.
+
+    With :math:`\\hat f_p` the fitted value of census PSU :math:`p` and
+    :math:`r_p = y_p - \\hat f_p` the residuals of the sampled PSUs, split
+    into centered area means :math:`\\bar r_c` and within-area deviations
+    :math:`r_p - \\bar r_c`, every replicate
+
+    1. draws an area effect :math:`u^*_c` for every census area from the
+       :math:`\\bar r_c`, and takes :math:`\\bar f_c + u^*_c` as the true
+       area value;
+    2. draws a PSU error :math:`e^*_p` for every sampled PSU from the
+       within-area deviations and refits the model to
+       :math:`y^*_p = \\hat f_p + u^*_c + e^*_p`;
+    3. accumulates the squared difference between the refitted area
+       predictions and the true values.
+
+    The binned features are shared by all replicates.
+
+    Parameters
+    ----------
+    model : HistGradientBoosting
+        Model fitted to the original sample; its parameters are reused.
+    features : BinnedFeatures
+        Binned features of every census PSU.
+    rows : ndarray
+        Positions of the sampled PSUs in ``features``.
+    y : ndarray
+        Target of the sampled PSUs.
+    area : ndarray
+        Area of every census PSU.
+    size : ndarray, optional
+        Population of every census PSU, to weight area means.
+    sample_weight : ndarray, optional
+        Weights of the sampled PSUs.
+    bsrep : int
+        Number of bootstrap replicates.
+    seed : int or numpy.random.SeedSequence, optional
+        Root seed; replicate :math:`b` always uses the same child stream.
+    workers : int, optional
+        Number of worker processes. Defaults to ``os.cpu_count()``; ``1``
+        runs in the current process. Each worker trains on one thread.
+
+    Returns
+    -------
+    dict
+        ``"area"`` and ``"mse"`` by area.
+    """
+    index = as_index(area)
+    rows = np.asarray(rows)
+    y = np.asarray(y, dtype=np.float64)
+    fitted = model.predict(features)
+    labels, fit_area = area_means(fitted, index, size)
+
+    # Residuals split into area means and within-area deviations.
+    row_area = index.lookup(np.asarray(area)[rows])
+    if sample_weight is None:
+        w = np.ones(rows.size)
+    else:
+        w = np.asarray(sample_weight, dtype=np.float64)
+    r = y - fitted[rows]
+    sampled = np.unique(row_area)
+    rbar = np.zeros(len(index))
+    rbar[sampled] = (
+        np.bincount(row_area, w * r, len(index))[sampled]
+        / np.bincount(row_area, w, len(index))[sampled]
+    )
+    ubar = rbar[sampled]
+    within = r - rbar[row_area]
+
+    workers = n_workers(workers, bsrep)
+    params = model.params()
+    if workers > 1:
+        params["n_threads"] = 1
+    state = {
+        "params": params,
+        "features": features,
+        "rows": rows,
+        "weights": sample_weight,
+        "index": index,
+        "size": size,
+        "n_areas": len(index),
+        "row_area": row_area,
+        "fit_rows": fitted[rows],
+        "fit_area": fit_area,
+        "ubar": ubar - ubar.mean(),
+        "within": within,
+    }
+
+    total = sum(run_replicates(_run_chunk, state, spawn(seed, bsrep), workers))
+    return {"area": labels, "mse": total / bsrep}
@@ -0,0 +1,162 @@
+"""Parametric bootstrap MSE of CensusEB estimates.
+
+Implements the bootstrap of González-Manteiga et al. (2008) described in the
+unit-level chapter. For every replicate :math:`b`:
+
+1. Location effects :math:`\\eta_c^{*(b)} \\sim N(0, \\hat\\sigma^2_\\eta)` are
+   drawn for every census area and a bootstrap census
+   :math:`y^{*(b)} = x'\\hat\\beta + \\eta^{*(b)} + e^{*(b)}` is generated; its
+   area FGT indicators are the *true* values for the replicate.
+2. The sample welfare is regenerated with the same location effects, the
+   model is refit and CensusEB estimates are obtained for the census.
+3. The squared difference between CensusEB and true values is accumulated.
+
+The MSE estimate is the average of the squared differences over the
+:math:`B` replicates. Replicates are independent, so they are spread over a
+process pool.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from ._pool import run_replicates, spawn
+from .censuseb import censuseb, eb_effects
+from .fgt import ALPHAS, grouped_fgt
+from .index import AreaIndex, as_index
+from .nested_error import reml
+
+
+def _replicate(s, seed):
+    """Squared differences between CensusEB and true FGT for one replicate."""
+    rng = np.random.default_rng(seed)
+    index = s["index"]
+    eta = rng.normal(0.0, np.sqrt(s["sigma_eta2"]), len(index))
+    sd_e = np.sqrt(s["sigma_e2"])
+
+    y_pop = s["xb"] + index.expand(eta) + rng.normal(0.0, sd_e, s["xb"].size)
+    true = grouped_fgt(
+        s["transform"](y_pop), s["povline"], index.starts, s["weights"], s["alphas"]
+    )
+    del y_pop
+
+    y_s = s["xb_s"] + eta[s["sample_pos"]] + rng.normal(0.0, sd_e, s["xb_s"].size)
+    fit = s["fit"](y_s, s["X_s"], s["area_s"])
+    _, eta_hat, var_eta = eb_effects(
+        y_s - s["X_s"] @ fit.beta, s["area_s"], fit.sigma_eta2, fit.sigma_e2,
+        areas=index,
+    )
+    est = censuseb(
+        s["X"] @ fit.beta, index, eta_hat, var_eta, fit.sigma_e2, s["povline"],
+        mcrep=s["mcrep"], weights=s["weights"], transform=s["transform"],
+        alphas=s["alphas"], seed=rng,
+    )
+    est = np.array([est["fgt%d" % a] for a in s["alphas"]])
+    return (est - true) ** 2
+
+
+def _run_chunk(state, seeds):
+    total = 0.0
+    for seed in seeds:
+        total = total + _replicate(state, seed)
+    return total
+
+
+def bootstrap_mse(
+    X,
+    area,
+    X_s,
+    area_s,
+    beta,
+    sigma_eta2,
+    sigma_e2,
+    povline,
+    fit=reml,
+    bsrep=200,
+    mcrep=50,
+    weights=None,
+    transform=np.exp,
+    alphas=ALPHAS,
+    seed=None,
+    workers=None,
+):
+    """Parametric bootstrap MSE of CensusEB area FGT estimates.
+
+    Parameters
+    ----------
+    X : ndarray or CensusDesign
+        Census design matrix ``(N, p)``, including the constant. A
+        :class:`~sae.census.CensusDesign` over an area-sorted
+        :class:`~sae.census.CensusStore` is passed to the workers by path,
+        so they share the memory-mapped census.
+    area : ndarray or AreaIndex
+        Census area identifier, or its index (e.g. ``CensusStore.index``).
+    X_s, area_s : ndarray
+        Sample design matrix and area identifier. Every sampled area must
+        be present in the census, or ``ValueError`` is raised.
+    beta, sigma_eta2, sigma_e2
+        Parameters of the model fitted to the original sample.
+    povline : float or PovertyLines
+        Poverty line, or a grid of lines.
+    fit : callable
+        ``fit(y, X, area)`` returning an object with attributes ``beta``,
+        ``sigma_eta2`` and ``sigma_e2``, applied to each bootstrap sample.
+        Defaults to :func:`~sae.nested_error.reml`. It must be picklable (a
+        module-level function) when ``workers > 1``.
+    bsrep : int
+        Number of bootstrap replicates :math:`B`.
+    mcrep : int
+        Monte Carlo replicates used for CensusEB within each bootstrap.
+    weights : ndarray, optional
+        Census household expansion factors.
+    transform : callable
+        Back-transformation of the simulated welfare.
+    alphas : sequence of int
+        FGT parameters.
+    seed : int or numpy.random.SeedSequence, optional
+        Root seed; replicate :math:`b` always uses the same child stream.
+    workers : int, optional
+        Number of worker processes. Defaults to ``os.cpu_count()``; ``1``
+        runs in the current process.
+
+    Returns
+    -------
+    dict
+        ``"area"`` and ``"mse_fgt<a>"`` for every :math:`\\alpha`.
+    """
+    index = as_index(area)
+    if not index.is_sorted:
+        X = index.sort(np.asarray(X, dtype=np.float64))
+        index = AreaIndex(index.labels, index.offsets)
+    if weights is not None:
+        weights = np.asarray(index.sort(weights), dtype=np.float64)
+    X_s = np.asarray(X_s, dtype=np.float64)
+    area_s = np.asarray(area_s)
+    sample_pos = index.lookup(area_s)
+    if (sample_pos < 0).any():
+        missing = np.unique(area_s[sample_pos < 0])
+        raise ValueError("sampled areas not in the census: %s" % missing[:10])
+    state = {
+        "X": X,
+        "xb": X @ beta,
+        "index": index,
+        "weights": weights,
+        "X_s": X_s,
+        "xb_s": X_s @ beta,
+        "area_s": area_s,
+        "sample_pos": sample_pos,
+        "sigma_eta2": sigma_eta2,
+        "sigma_e2": sigma_e2,
+        "povline": povline,
+        "fit": fit,
+        "mcrep": mcrep,
+        "transform": transform,
+        "alphas": tuple(alphas),
+    }
+
+    total = sum(run_replicates(_run_chunk, state, spawn(seed, bsrep), workers))
+    mse = total / bsrep
+    out = {"area": index.labels}
+    for k, a in enumerate(alphas):
+        out["mse_fgt%d" % a] = mse[k]
+    return out
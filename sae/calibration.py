@@ -0,0 +1,208 @@
+"""Calibration and GREG estimators.
+
+Estimators of the direct-estimation chapter that use population totals or
+means of auxiliary variables :math:`x`. Calibration replaces the sampling
+weights :math:`d_i` by :math:`w_i = d_i F(x_i'\\lambda)`, closest to
+:math:`d_i` for a distance whose derivative is inverted by :math:`F`, such
+that the weighted totals of :math:`x` hit known totals :math:`X`:
+
+* ``"linear"``: :math:`F(u) = 1 + u` (chi-square distance; the GREG
+  weights);
+* ``"raking"``: :math:`F(u) = e^u` (multiplicative raking, ``survey``'s
+  ``calfun="raking"``);
+* ``"truncated"``: :math:`F(u) = \\min(\\max(1 + u, L), U)`, linear
+  calibration with the ratios :math:`w_i / d_i` kept in :math:`[L, U]`.
+
+:func:`calibrate` solves :math:`\\sum_i d_i F(x_i'\\lambda) x_i = X` by
+Newton's method on the :math:`p \\times p` system. With a ``domain`` every
+domain gets its own :math:`\\lambda_d` and the Newton steps of all domains
+are taken together: every iteration builds the Jacobians of all domains at
+once, with one grouped sum over the sample for each of the :math:`p(p+1)/2`
+entries of their upper triangles, and solves them as one stacked array.
+
+:func:`greg_estimates` computes the GREG estimator of every domain from a
+single weighted least squares fit of :math:`y` on :math:`x` over the whole
+sample,
+
+.. math::
+
+    \\hat Y_d^{GREG} = X_d'\\hat\\beta + \\sum_{i \\in s_d} d_i e_i,
+    \\quad e_i = y_i - x_i'\\hat\\beta,
+
+so that the domain estimates are the synthetic totals plus grouped sums of
+the weighted residuals.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .direct import _cells, _codes, _design, _linearized_var
+
+
+class CalibrationFit(NamedTuple):
+    """Calibrated weights."""
+
+    weights: np.ndarray  # calibrated weights w_i, (n,)
+    g: np.ndarray  # calibration factors w_i / d_i, (n,)
+    lam: np.ndarray  # Lagrange multipliers by domain, (D, p)
+    converged: np.ndarray  # by domain, (D,)
+    n_iter: int
+
+
+def _distance(method, bounds):
+    """Calibration function :math:`F` and its derivative."""
+    if method == "linear":
+        return lambda u: 1.0 + u, lambda u: np.ones_like(u)
+    if method == "raking":
+        return np.exp, np.exp
+    if method == "truncated":
+        if bounds is None:
+            raise ValueError("truncated calibration requires bounds")
+        lo, hi = bounds
+        return (
+            lambda u: np.clip(1.0 + u, lo, hi),
+            lambda u: ((1.0 + u > lo) & (1.0 + u < hi)).astype(np.float64),
+        )
+    raise ValueError("unknown calibration method %r" % method)
+
+
+def calibrate(
+    X,
+    weights,
+    totals,
+    domain=None,
+    method="linear",
+    bounds=None,
+    tol=1e-10,
+    max_iter=50,
+):
+    """Calibrate sampling weights to known totals.
+
+    Parameters
+    ----------
+    X : ndarray
+        Auxiliary variables, ``(n, p)``.
+    weights : ndarray
+        Sampling weights :math:`d_i`.
+    totals : ndarray
+        Population totals of the columns of ``X``, ``(p,)``, or with a
+        ``domain``, ``(D, p)`` aligned to the sorted domain labels (e.g.
+        ``N`` times the census means of
+        :meth:`~sae.aggregates.CensusAggregates.mean`).
+    domain : ndarray, optional
+        Domain of every household; each domain is calibrated to its own
+        totals.
+    method : {"linear", "raking", "truncated"}
+        Calibration function.
+    bounds : tuple of float, optional
+        Bounds :math:`(L, U)` of :math:`w_i / d_i` for ``"truncated"``.
+    tol : float
+        Convergence tolerance on the calibration equations, relative to the
+        totals.
+    max_iter : int
+        Maximum number of Newton iterations.
+
+    Returns
+    -------
+    CalibrationFit
+        Domains that did not converge (e.g. infeasible bounds) are flagged
+        in ``converged``.
+    """
+    F, dF = _distance(method, bounds)
+    X = np.asarray(X, dtype=np.float64)
+    d = np.asarray(weights, dtype=np.float64)
+    n, p = X.shape
+    if domain is None:
+        code, D = np.zeros(n, dtype=np.intp), 1
+    else:
+        labels, code = _codes(domain)
+        D = labels.size
+    totals = np.asarray(totals, dtype=np.float64).reshape(D, p)
+    scale = np.maximum(np.abs(totals), 1.0)
+    upper = np.triu_indices(p)
+
+    def grouped(v):
+        return np.column_stack([np.bincount(code, v * x, D) for x in X.T])
+
+    lam = np.zeros((D, p))
+    converged = np.zeros(D, dtype=bool)
+    for n_iter in range(1, max_iter + 1):
+        u = np.einsum("ij,ij->i", X, lam[code])
+        resid = totals - grouped(d * F(u))
+        converged = np.all(np.abs(resid) <= tol * scale, axis=1)
+        if converged.all():
+            break
+        v = d * dF(u)
+        J = np.empty((D, p, p))
+        for j, k in zip(*upper):
+            J[:, j, k] = J[:, k, j] = np.bincount(code, v * X[:, j] * X[:, k], D)
+        lam += (np.linalg.pinv(J) @ resid[:, :, None])[:, :, 0]
+    g = F(np.einsum("ij,ij->i", X, lam[code]))
+    return CalibrationFit(d * g, g, lam, converged, n_iter)
+
+
+def greg_estimates(y, X, domain, weights, X_mean, N, strata=None, psu=None, fpc=None):
+    """GREG estimates of domain totals and means.
+
+    Parameters
+    ----------
+    y : ndarray
+        Variable to estimate, ``(n,)`` or ``(n, k)``.
+    X : ndarray
+        Auxiliary variables of the sample, ``(n, p)``.
+    domain : ndarray
+        Domain of every sampled household.
+    weights : ndarray
+        Sampling weights.
+    X_mean : ndarray
+        Population means of the auxiliary variables of every domain,
+        ``(D, p)``, aligned to the sorted domain labels.
+    N : ndarray
+        Population size of every domain, ``(D,)``.
+    strata, psu, fpc : ndarray, optional
+        Design, as in :func:`~sae.direct.direct_estimates`, for the
+        linearized variances.
+
+    Returns
+    -------
+    dict
+        ``"domain"``, ``"n"``, ``"total"`` and ``"total_var"``, ``"mean"``
+        and ``"mean_var"``. Variances are the linearized variances of the
+        weighted residuals.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    w = np.asarray(weights, dtype=np.float64)
+    N = np.asarray(N, dtype=np.float64)
+    labels, d = _codes(domain)
+    D = labels.size
+    n = y.shape[0]
+    cols = y.reshape(n, -1)
+
+    Xw = X * w[:, None]
+    beta = np.linalg.lstsq(Xw.T @ X, Xw.T @ cols, rcond=None)[0]
+    resid = cols - X @ beta
+    synthetic = (np.asarray(X_mean, dtype=np.float64) @ beta) * N[:, None]
+    cells = _cells(d, D, *_design(n, strata, psu, fpc))
+
+    total = np.empty((D, cols.shape[1]))
+    total_var = np.empty_like(total)
+    for j, e in enumerate(resid.T):
+        total[:, j] = synthetic[:, j] + np.bincount(d, w * e, D)
+        total_var[:, j] = _linearized_var(w * e, cells)
+    size = N[:, None]
+    out = {
+        "domain": labels,
+        "n": np.bincount(d, minlength=D),
+        "total": total,
+        "total_var": total_var,
+        "mean": total / size,
+        "mean_var": total_var / (size * size),
+    }
+    if y.ndim == 1:
+        for key in ("total", "total_var", "mean", "mean_var"):
+            out[key] = out[key][:, 0]
+    return out
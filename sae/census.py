@@ -0,0 +1,188 @@
+"""Columnar on-disk census store.
+
+Replaces ``sae data import, datain() varlist() area() uniqid() dataout()``,
+which converts the census into a Mata file before every simulation. The
+census is written once as a directory holding one typed ``.npy`` array per
+variable, with households sorted by area (and by the unique identifier within
+area, for replicability) and an offsets array marking where each area starts::
+
+    census/
+        meta.json      variables, dtypes and number of households
+        _area.npy      area of every household (sorted)
+        _labels.npy    area labels, (D,)
+        _offsets.npy   first household of each area plus N, (D + 1,)
+        x1.npy, ...    one array per variable
+
+Arrays are opened with ``numpy.load(..., mmap_mode="r")``, so loading is
+immediate regardless of the census size, and worker processes that open the
+same store share the operating system's page cache instead of holding a copy
+each. Stores and designs pickle as their path, so passing them to a process
+pool does not serialize the data.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .index import AreaIndex
+
+_META = "meta.json"
+
+
+def import_census(dataout, area, variables, uniqid=None, overwrite=False):
+    """Write a census to a columnar store.
+
+    Parameters
+    ----------
+    dataout : str or path-like
+        Directory to create. A non-empty directory raises
+        ``FileExistsError`` unless ``overwrite`` is set.
+    area : ndarray
+        Area identifier of every household.
+    variables : mapping of str to ndarray
+        Variables to store (``varlist()``), each of length ``N``. Dtypes are
+        preserved.
+    uniqid : ndarray, optional
+        Household identifier; households are ordered by it within area and
+        it is stored as variable ``"_uniqid"``.
+    overwrite : bool
+        Replace the census store in ``dataout``. The directory is removed
+        first, with variables that are no longer imported and results
+        cached alongside the census; a directory that does not hold a
+        store is never removed.
+
+    Returns
+    -------
+    CensusStore
+    """
+    area = np.asarray(area)
+    if uniqid is None:
+        order = np.argsort(area, kind="stable")
+    else:
+        uniqid = np.asarray(uniqid)
+        order = np.lexsort((uniqid, area))
+    sorted_area = area[order]
+    index = AreaIndex.from_area(sorted_area)
+
+    _clear(dataout, overwrite)
+    np.save(os.path.join(dataout, "_area.npy"), sorted_area)
+    np.save(os.path.join(dataout, "_labels.npy"), index.labels)
+    np.save(os.path.join(dataout, "_offsets.npy"), index.offsets)
+    dtypes = {}
+    columns = dict(variables)
+    if uniqid is not None:
+        columns["_uniqid"] = uniqid
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if values.shape != area.shape:
+            raise ValueError(
+                "variable %r has %d rows, expected %d" % (name, values.size, area.size)
+            )
+        np.save(os.path.join(dataout, name + ".npy"), values[order])
+        dtypes[name] = values.dtype.str
+    with open(os.path.join(dataout, _META), "w") as f:
+        json.dump({"n": int(area.size), "variables": dtypes}, f, indent=1)
+    return CensusStore(dataout)
+
+
+def _clear(dataout, overwrite):
+    """Create the empty directory ``dataout``, removing an old store."""
+    if os.path.isdir(dataout) and os.listdir(dataout):
+        if not overwrite:
+            raise FileExistsError(
+                "%s is not empty; pass overwrite=True to replace the census" % dataout
+            )
+        if not os.path.isfile(os.path.join(dataout, _META)):
+            raise FileExistsError("%s is not empty and does not hold a census store" % dataout)
+        shutil.rmtree(dataout)
+    os.makedirs(dataout, exist_ok=True)
+
+
+class CensusStore:
+    """Memory-mapped census written by :func:`import_census`.
+
+    Variables are accessed as ``store["x1"]``, which returns a read-only
+    memory map in area-sorted order. ``store.index`` is the
+    :class:`~sae.index.AreaIndex` of the stored households.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with open(os.path.join(self.path, _META)) as f:
+            meta = json.load(f)
+        self.n = meta["n"]
+        self.variables = list(meta["variables"])
+        self.area = self._load("_area")
+        self.labels = self._load("_labels")
+        self.offsets = self._load("_offsets")
+        self.index = AreaIndex(self.labels, self.offsets)
+        self._cache = {}
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+
+    def __reduce__(self):
+        return (CensusStore, (self.path,))
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, name):
+        return name in self.variables
+
+    def __getitem__(self, name):
+        if name not in self.variables:
+            raise KeyError(name)
+        if name not in self._cache:
+            self._cache[name] = self._load(name)
+        return self._cache[name]
+
+    def design(self, names, constant=True):
+        """Lazy census design matrix over the stored variables."""
+        return CensusDesign(self, names, constant)
+
+
+class CensusDesign:
+    """Design matrix backed by a :class:`CensusStore`.
+
+    Supports ``design @ beta``, computed column by column in chunks, so the
+    ``(N, p)`` matrix is never formed. The constant, if requested, is the
+    first column.
+    """
+
+    chunk = 1 << 20
+
+    def __init__(self, store, names, constant=True):
+        self.store = store
+        self.names = list(names)
+        self.constant = constant
+        self.shape = (store.n, len(self.names) + int(constant))
+
+    def __reduce__(self):
+        return (CensusDesign, (self.store, self.names, self.constant))
+
+    def __matmul__(self, beta):
+        beta = np.asarray(beta, dtype=np.float64)
+        if beta.shape != (self.shape[1],):
+            raise ValueError(
+                "matmul: beta of shape %s does not match a design with %d columns"
+                % (beta.shape, self.shape[1])
+            )
+        coef = beta[1:] if self.constant else beta
+        out = np.full(self.shape[0], beta[0] if self.constant else 0.0)
+        for lo in range(0, self.shape[0], self.chunk):
+            hi = min(lo + self.chunk, self.shape[0])
+            view = out[lo:hi]
+            for b, name in zip(coef, self.names):
+                view += b * self.store[name][lo:hi]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        cols = [self.store[name] for name in self.names]
+        if self.constant:
+            cols.insert(0, np.ones(self.shape[0]))
+        return np.column_stack(cols).astype(dtype or np.float64)
@@ -0,0 +1,147 @@
+"""Direct estimates and linearized variances for many domains.
+
+Python counterpart of ``svy: proportion fgt0, over(HID_mun)`` (or ``svy:
+mean``) in the area-level chapter, followed by the Mata lines that keep the
+second half of ``e(b)`` and the diagonal of ``e(V)``. Stata builds the full
+covariance matrix of all domain estimates, of size :math:`2D \\times 2D`,
+only for its diagonal to be extracted.
+
+:func:`direct_estimates` computes the Horvitz-Thompson total and the Hájek
+mean of every domain, and their Taylor-linearized variances under a
+stratified cluster design with PSUs sampled with replacement (Stata's
+default variance estimator), directly. For domain :math:`d` with linearized
+scores :math:`z_{hpi}` (:math:`w_{hpi} y_{hpi}` for the total,
+:math:`w_{hpi}(y_{hpi} - \\hat R_d) / \\hat N_d` for the mean, zero outside
+the domain),
+
+.. math::
+
+    \\hat V_d = \\sum_h (1 - f_h) \\frac{n_h}{n_h - 1} \\sum_{p=1}^{n_h}
+    (z_{hp} - \\bar z_h)^2
+    = \\sum_h (1 - f_h) \\frac{n_h}{n_h - 1}
+    \\left(\\sum_p z_{hp}^2 - \\frac{(\\sum_p z_{hp})^2}{n_h}\\right),
+
+where :math:`z_{hp}` are PSU totals and :math:`n_h` counts every sampled
+PSU of the stratum, including those without households in the domain. Only
+the non-zero (domain, PSU) totals enter the sums, so the cost is linear in
+the number of households whatever the number of domains.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+def _codes(x):
+    """Sorted unique labels and the code of every element."""
+    return np.unique(np.asarray(x), return_inverse=True)
+
+
+def _design(n, strata=None, psu=None, fpc=None):
+    """PSU of every household, stratum of every PSU, :math:`n_h` and variance scale."""
+    stratum = np.zeros(n, dtype=np.intp) if strata is None else _codes(strata)[1]
+    n_strata = int(stratum.max()) + 1 if n else 0
+    if psu is None:
+        unit = np.arange(n)
+    else:
+        psu_code = _codes(psu)[1]
+        unit = _codes(stratum * (int(psu_code.max()) + 1) + psu_code)[1]
+    psu_stratum = np.zeros(int(unit.max()) + 1 if n else 0, dtype=np.intp)
+    psu_stratum[unit] = stratum
+    n_h = np.bincount(psu_stratum, minlength=n_strata).astype(np.float64)
+    f_h = np.zeros(n_strata)
+    if fpc is not None:
+        f_h[stratum] = np.asarray(fpc, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(n_h > 1, (1.0 - f_h) * n_h / (n_h - 1.0), 0.0)
+    return unit, psu_stratum, n_h, scale
+
+
+def _cells(domain, n_domains, psu, stratum, n_h, scale):
+    """(domain, PSU) cells of the households and their (domain, stratum) groups.
+
+    Computed once per design and shared by every score.
+    """
+    n_psu = int(psu.max()) + 1
+    cell, cell_of = np.unique(domain * n_psu + psu, return_inverse=True)
+    n_strata = n_h.size
+    cell_group = (cell // n_psu) * n_strata + stratum[cell % n_psu]
+    group, group_of = np.unique(cell_group, return_inverse=True)
+    h = group % n_strata
+    return cell_of, cell.size, group_of, group.size, group // n_strata, n_domains, n_h[h], scale[h]
+
+
+def _linearized_var(z, cells):
+    """Linearized variance of the domain totals of the scores ``z``."""
+    cell_of, n_cells, group_of, n_groups, group_domain, n_domains, n_h, scale = cells
+    z_cell = np.bincount(cell_of, z, n_cells)
+    s1 = np.bincount(group_of, z_cell, n_groups)
+    s2 = np.bincount(group_of, z_cell * z_cell, n_groups)
+    return np.bincount(group_domain, scale * (s2 - s1 * s1 / n_h), n_domains)
+
+
+def direct_estimates(y, domain, weights, strata=None, psu=None, fpc=None, N=None):
+    """Horvitz-Thompson and Hájek direct estimates by domain.
+
+    Parameters
+    ----------
+    y : ndarray
+        Variable to estimate, ``(n,)`` or ``(n, k)`` (e.g. ``fgt0`` for the
+        headcount, as in ``svy: proportion``).
+    domain : ndarray
+        Domain of every sampled household (``over(HID_mun)``).
+    weights : ndarray
+        Sampling weights (``pweight``).
+    strata : ndarray, optional
+        Stratum identifier; a single stratum if omitted.
+    psu : ndarray, optional
+        PSU identifier, unique within stratum; every household is its own
+        PSU if omitted.
+    fpc : ndarray, optional
+        Sampling fraction of PSUs of every household's stratum, :math:`f_h`;
+        sampling with replacement if omitted.
+    N : ndarray, optional
+        Known population size of every domain (aligned to the sorted domain
+        labels), for the Horvitz-Thompson mean :math:`\\hat T_d / N_d`.
+
+    Returns
+    -------
+    dict
+        ``"domain"`` (sorted labels), ``"n"`` (households), ``"N_hat"``
+        (sum of weights), ``"total"`` and ``"total_var"``, ``"mean"`` and
+        ``"mean_var"`` (Hájek), and with ``N`` also ``"ht_mean"`` and
+        ``"ht_mean_var"``. Singleton strata (:math:`n_h = 1`) add nothing to
+        the variances.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    w = np.asarray(weights, dtype=np.float64)
+    labels, d = _codes(domain)
+    D = labels.size
+    n = y.shape[0]
+    cells = _cells(d, D, *_design(n, strata, psu, fpc))
+    cols = y.reshape(n, -1)
+    N_hat = np.bincount(d, w, D)
+    out = {
+        "domain": labels,
+        "n": np.bincount(d, minlength=D),
+        "N_hat": N_hat,
+    }
+    results = {key: [] for key in ("total", "total_var", "mean", "mean_var")}
+    for col in cols.T:
+        total = np.bincount(d, w * col, D)
+        mean = total / N_hat
+        results["total"].append(total)
+        results["total_var"].append(_linearized_var(w * col, cells))
+        results["mean"].append(mean)
+        score = w * (col - mean[d]) / N_hat[d]
+        results["mean_var"].append(_linearized_var(score, cells))
+    squeeze = y.ndim == 1
+    for key, value in results.items():
+        value = np.column_stack(value)
+        out[key] = value[:, 0] if squeeze else value
+    if N is not None:
+        N = np.asarray(N, dtype=np.float64)
+        size = N if squeeze else N[:, None]
+        out["ht_mean"] = out["total"] / size
+        out["ht_mean_var"] = out["total_var"] / (size * size)
+    return out
@@ -0,0 +1,256 @@
+"""Fay-Herriot area-level model.
+
+Python counterpart of ``fhsae y x, revar(psi) method(fh | ml | reml)`` for
+the model
+
+.. math::
+
+    \\hat\\tau_d = x_d'\\beta + u_d + e_d, \\quad
+    u_d \\sim N(0, \\sigma^2_u), \\quad e_d \\sim N(0, \\psi_d),
+
+with known sampling variances :math:`\\psi_d`. For a given
+:math:`\\sigma^2_u` the GLS coefficients use the weights
+:math:`w_d = 1 / (\\sigma^2_u + \\psi_d)`, and :math:`\\sigma^2_u` solves one
+equation :math:`g(\\sigma^2_u) = 0`:
+
+* ``"fh"``, the Fay-Herriot moment estimator: :math:`\\sum_d w_d r_d^2 -
+  (D - p)`, where :math:`r_d` are the GLS residuals;
+* ``"ml"``: the score :math:`\\frac12 (\\sum_d w_d^2 r_d^2 - \\sum_d w_d)`;
+* ``"reml"``: the restricted score :math:`\\frac12 (\\sum_d w_d^2 r_d^2 -
+  \\mathrm{tr}\\, P)`, with :math:`P = W - WX(X'WX)^{-1}X'W`.
+
+The equation is solved by Newton's method (Fisher scoring for ML and REML)
+safeguarded by a bracket: a step that leaves the current bracket is
+replaced by bisection, and :math:`\\sigma^2_u = 0` when :math:`g(0) \\le 0`.
+
+The model selection loops of the area-level chapter refit the model once per
+threshold and candidate covariate. :func:`fh_data` keeps the
+:math:`D \\times p` design of every candidate covariate, and
+:func:`fit_fh_batch` fits any number of covariate subsets together: the
+designs are stacked, with unused columns padded by zeros (and ones on the
+diagonal of :math:`X'WX`), so that every Newton iteration of every subset
+is one set of array operations. :func:`fit_fh` fits a single subset and can
+be passed to :func:`~sae.selection.backward_elimination`.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+
+class FHData(NamedTuple):
+    """Direct estimates, sampling variances and candidate covariates."""
+
+    y: np.ndarray  # direct estimates of the observed areas, (D,)
+    X: np.ndarray  # covariates of the observed areas, (D, p)
+    psi: np.ndarray  # sampling variances of the observed areas, (D,)
+    observed: np.ndarray  # areas with a direct estimate, (M,)
+    X_all: np.ndarray  # covariates of every area, (M, p)
+    labels: np.ndarray
+
+
+class FHFit(NamedTuple):
+    """Estimates of the Fay-Herriot model."""
+
+    beta: np.ndarray
+    sigma_u2: float
+    vcov: np.ndarray
+    gamma: np.ndarray  # shrinkage factors of the observed areas
+    loglik: float
+    converged: bool
+    method: str
+
+
+_METHODS = ("fh", "ml", "reml")
+
+
+def fh_data(y, X, psi, labels=None):
+    """Cache the data of a Fay-Herriot model.
+
+    Parameters
+    ----------
+    y : ndarray
+        Direct estimates, ``(M,)``; ``nan`` for areas without a sample.
+    X : ndarray
+        Area-level covariates ``(M, p)`` holding every candidate covariate
+        and the constant.
+    psi : ndarray
+        Sampling variances of the direct estimates (``revar()``).
+    labels : ndarray, optional
+        Area labels; ``0, ..., M - 1`` by default.
+
+    Returns
+    -------
+    FHData
+    """
+    y = np.asarray(y, dtype=np.float64)
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    psi = np.asarray(psi, dtype=np.float64)
+    observed = np.isfinite(y) & np.isfinite(psi) & (psi > 0)
+    return FHData(
+        y=y[observed],
+        X=np.ascontiguousarray(X[observed]),
+        psi=psi[observed],
+        observed=observed,
+        X_all=X,
+        labels=np.arange(y.size) if labels is None else np.asarray(labels),
+    )
+
+
+def _cross(X, w):
+    """Stacked weighted cross-products :math:`X'\\mathrm{diag}(w)X`."""
+    return (X * w[:, :, None]).transpose(0, 2, 1) @ X
+
+
+def _gls(X, y, w, eye):
+    """Stacked GLS fits: :math:`(X'WX)^{-1}`, coefficients and residuals.
+
+    ``X`` is ``(K, D, P)`` and ``y`` is ``(K, D)``; either may have a
+    leading axis of length one shared by every fit.
+    """
+    XtW = (X * w[:, :, None]).transpose(0, 2, 1)
+    Q = np.linalg.inv(XtW @ X + eye)
+    beta = (Q @ (XtW @ y[:, :, None]))[:, :, 0]
+    return Q, beta, y - (X @ beta[:, :, None])[:, :, 0]
+
+
+def _equation(method, X, y, psi, p, eye, A):
+    """:math:`g(\\sigma^2_u)` and its slope for stacked designs."""
+    w = 1.0 / (A[:, None] + psi)
+    Q, beta, r = _gls(X, y, w, eye)
+    w2 = w * w
+    if method == "fh":
+        return (w * r * r).sum(1) - (psi.size - p), -(w2 * r * r).sum(1)
+    if method == "ml":
+        return 0.5 * ((w2 * r * r).sum(1) - w.sum(1)), -0.5 * w2.sum(1)
+    QB = Q @ _cross(X, w2)
+    trace_p = w.sum(1) - np.einsum("kpp->k", QB)
+    trace_p2 = (
+        w2.sum(1)
+        - 2.0 * np.einsum("kpq,kqp->k", Q, _cross(X, w2 * w))
+        + np.einsum("kpq,kqp->k", QB, QB)
+    )
+    return 0.5 * ((w2 * r * r).sum(1) - trace_p), -0.5 * trace_p2
+
+
+def _solve(X, y, psi, p, eye, method, tol, max_iter):
+    """Safeguarded Newton solution of :math:`g(\\sigma^2_u) = 0` for stacked fits.
+
+    Returns :math:`\\hat\\sigma^2_u`, the convergence flags and the final
+    GLS fits.
+    """
+    K = max(X.shape[0], y.shape[0])
+
+    def equation(A):
+        return _equation(method, X, y, psi, p, eye, A)
+
+    A = np.zeros(K)
+    g, slope = equation(A)
+    done = g <= 0.0
+    lo = np.zeros(K)
+    hi = np.full(K, np.inf)
+    for _ in range(max_iter):
+        if done.all():
+            break
+        lo = np.where(g > 0.0, A, lo)
+        hi = np.where(g > 0.0, hi, A)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = A - g / slope
+        bisect = (step <= lo) | (step >= hi)
+        step = np.where(bisect, np.where(np.isfinite(hi), 0.5 * (lo + hi), 2.0 * A + 1.0), step)
+        new = np.where(done, A, step)
+        done |= np.abs(new - A) <= tol * (1.0 + A)
+        A = new
+        g, slope = equation(A)
+    w = 1.0 / (A[:, None] + psi)
+    return (A, done, w) + _gls(X, y, w, eye)
+
+
+def fit_fh_batch(data, subsets, method="reml", tol=1e-10, max_iter=100):
+    """Fit the Fay-Herriot model on several covariate subsets at once.
+
+    Parameters
+    ----------
+    data : FHData
+        Output of :func:`fh_data`.
+    subsets : sequence of sequence of int
+        Columns of ``X`` of every model.
+    method : {"fh", "ml", "reml"}
+        Estimator of :math:`\\sigma^2_u` (``method()``).
+    tol : float
+        Relative tolerance on :math:`\\sigma^2_u`.
+    max_iter : int
+        Maximum number of Newton iterations.
+
+    Returns
+    -------
+    list of FHFit
+        One fit per subset, in order.
+    """
+    if method not in _METHODS:
+        raise ValueError("method must be one of %s" % (_METHODS,))
+    subsets = [np.asarray(c, dtype=np.intp).ravel() for c in subsets]
+    K = len(subsets)
+    p = np.array([c.size for c in subsets])
+    P = int(p.max())
+    cols = np.zeros((K, P), dtype=np.intp)
+    mask = np.zeros((K, P))
+    for k, c in enumerate(subsets):
+        cols[k, : c.size] = c
+        mask[k, : c.size] = 1.0
+    X = data.X[:, cols].transpose(1, 0, 2) * mask[:, None, :]
+    eye = np.eye(P) * (1.0 - mask)[:, :, None]
+    A, done, w, Q, beta, r = _solve(
+        X, data.y[None], data.psi, p, eye, method, tol, max_iter
+    )
+    loglik = -0.5 * (np.log(2.0 * np.pi / w).sum(1) + (w * r * r).sum(1))
+    if method == "reml":
+        loglik += 0.5 * (p * np.log(2.0 * np.pi) + np.linalg.slogdet(Q)[1])
+    return [
+        FHFit(
+            beta=beta[k, : p[k]],
+            sigma_u2=float(A[k]),
+            vcov=Q[k, : p[k], : p[k]],
+            gamma=A[k] * w[k],
+            loglik=float(loglik[k]),
+            converged=bool(done[k]),
+            method=method,
+        )
+        for k in range(K)
+    ]
+
+
+def fit_fh(data, cols=None, method="reml", tol=1e-10, max_iter=100):
+    """Fit the Fay-Herriot model on the columns ``cols`` (all by default)."""
+    if cols is None:
+        cols = np.arange(data.X.shape[1])
+    return fit_fh_batch(data, [cols], method, tol, max_iter)[0]
+
+
+def fh_eblup(data, fit, cols=None):
+    """EBLUP of every area under a fitted Fay-Herriot model.
+
+    :math:`\\hat\\tau_d = \\hat\\gamma_d \\hat\\tau_d^{DIR} + (1 -
+    \\hat\\gamma_d) x_d'\\hat\\beta`, and the synthetic estimate
+    :math:`x_d'\\hat\\beta` for areas without a direct estimate.
+
+    Returns
+    -------
+    dict
+        ``"area"``, ``"eblup"``, ``"synthetic"`` and ``"gamma"``, for every
+        area.
+    """
+    X = data.X_all if cols is None else data.X_all[:, cols]
+    synthetic = X @ fit.beta
+    gamma = np.zeros(synthetic.size)
+    gamma[data.observed] = fit.gamma
+    eblup = synthetic.copy()
+    eblup[data.observed] += fit.gamma * (data.y - synthetic[data.observed])
+    return {"area": data.labels, "eblup": eblup, "synthetic": synthetic, "gamma": gamma}
+
+
+def fhsae(y, X, psi, method="reml"):
+    """Fay-Herriot fit, ``fhsae y X, revar(psi) method(method)``."""
+    return fit_fh(fh_data(y, X, psi), method=method)
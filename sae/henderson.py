@@ -0,0 +1,199 @@
+"""Henderson's method III with survey weights and GLS.
+
+Python counterpart of ``sae model h3 y x [aw=w], area(area)``. The variance
+components of the nested-error model are estimated by Henderson's method III
+(as in ELL and the Stata ``sae`` package) and :math:`\\beta` is then obtained
+by GLS.
+
+With weights normalized to sum to :math:`N`, :math:`\\hat w_{ch}`:
+
+* :math:`\\hat\\sigma^2_e` comes from the within-area (weighted demeaned)
+  regression, :math:`\\hat\\sigma^2_e = \\tilde u'\\hat W \\tilde u /
+  (N - D - \\tilde p)` where :math:`\\tilde p` is the rank of the demeaned
+  design.
+* :math:`\\hat\\sigma^2_\\eta` solves :math:`E[u'\\hat Wu] = \\sigma^2_e
+  \\mathrm{tr}(M) + \\sigma^2_\\eta \\mathrm{tr}(MZZ')` for the weighted OLS
+  residuals :math:`u`, with :math:`M = \\hat W - \\hat WX(X'\\hat WX)^{-1}X'\\hat W`,
+  truncated at zero.
+* GLS uses :math:`\\Omega_c = \\hat W_c - \\frac{\\gamma_c}{S_c} \\hat w_c
+  \\hat w_c'`, :math:`S_c = \\sum_h \\hat w_{ch}`, :math:`\\gamma_c =
+  \\sigma^2_\\eta / (\\sigma^2_\\eta + \\sigma^2_e \\sum_h \\hat w_{ch}^2 / S_c^2)`.
+
+Without weights these are exactly the unweighted Henderson III and GLS
+estimators. Every term above is a function of the weighted totals
+:math:`X'\\hat WX`, :math:`X'\\hat W^2X`, :math:`X'\\hat Wy`, :math:`y'\\hat Wy`
+and of the weighted area sums of :math:`x` and :math:`y`. :func:`h3_stats`
+computes them once for every candidate covariate, and :func:`fit_h3` refits
+any subset of columns by slicing those caches, without going back to the
+households.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .index import as_index
+
+
+class H3Stats(NamedTuple):
+    """Weighted cross-products cached for Henderson III fits."""
+
+    n: np.ndarray  # households by area, (D,)
+    wsum: np.ndarray  # sum of weights by area, (D,)
+    w2sum: np.ndarray  # sum of squared weights by area, (D,)
+    xsum: np.ndarray  # weighted area sums of x, (D, p)
+    ysum: np.ndarray  # weighted area sums of y, (D,)
+    XtWX: np.ndarray  # (p, p)
+    XtW2X: np.ndarray  # (p, p)
+    XtWy: np.ndarray  # (p,)
+    ytWy: float
+    labels: np.ndarray
+
+    def subset(self, cols):
+        """Statistics for a subset of the columns of ``X``."""
+        cols = np.asarray(cols)
+        ix = np.ix_(cols, cols)
+        return self._replace(
+            xsum=self.xsum[:, cols],
+            XtWX=self.XtWX[ix],
+            XtW2X=self.XtW2X[ix],
+            XtWy=self.XtWy[cols],
+        )
+
+    def with_y(self, y, X, area, weights=None):
+        """Statistics for a new dependent variable on the same design.
+
+        Only the terms involving ``y`` are recomputed, an :math:`O(Np)` pass
+        instead of the :math:`O(Np^2)` of :func:`h3_stats`. ``X``, ``area``
+        and ``weights`` must be those the statistics were built from.
+        """
+        y = np.asarray(y, dtype=np.float64)
+        wy = _normalized_weights(weights, y.size) * y
+        index = as_index(area)
+        return self._replace(
+            ysum=index.sum(index.sort(wy)),
+            XtWy=np.asarray(X, dtype=np.float64).T @ wy,
+            ytWy=float(wy @ y),
+        )
+
+
+class H3Fit(NamedTuple):
+    """Henderson III variance components and GLS coefficients."""
+
+    beta: np.ndarray
+    sigma_eta2: float
+    sigma_e2: float
+    vcov: np.ndarray
+    beta_ols: np.ndarray
+
+
+def _normalized_weights(weights, n):
+    """Weights rescaled to sum to ``n``; ones if ``weights`` is None."""
+    if weights is None:
+        return np.ones(n)
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights * (n / weights.sum())
+
+
+def h3_stats(y, X, area, weights=None):
+    """Compute the weighted caches used by :func:`fit_h3` in one pass.
+
+    Parameters
+    ----------
+    y : ndarray
+        Dependent variable, length ``N``.
+    X : ndarray
+        Design matrix ``(N, p)`` holding every candidate covariate and the
+        constant.
+    area : ndarray or AreaIndex
+        Area identifier.
+    weights : ndarray, optional
+        Analytic weights (``[aw=Whh]``); normalized to sum to ``N``.
+
+    Returns
+    -------
+    H3Stats
+    """
+    y = np.asarray(y, dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    w = _normalized_weights(weights, y.size)
+    index = as_index(area)
+    Xw = X * w[:, None]
+    return H3Stats(
+        n=index.counts.astype(np.float64),
+        wsum=index.sum(index.sort(w)),
+        w2sum=index.sum(index.sort(w * w)),
+        xsum=index.sum(index.sort(Xw)),
+        ysum=index.sum(index.sort(w * y)),
+        XtWX=Xw.T @ X,
+        XtW2X=Xw.T @ Xw,
+        XtWy=Xw.T @ y,
+        ytWy=float((w * y) @ y),
+        labels=index.labels,
+    )
+
+
+def _lstsq_normal(A, b, rtol=1e-10):
+    """Minimum-norm solution of ``A x = b`` for symmetric PSD ``A`` and its rank."""
+    vals, vecs = np.linalg.eigh(A)
+    keep = vals > rtol * max(vals.max(), 0.0)
+    x = vecs[:, keep] @ ((vecs[:, keep].T @ b) / vals[keep])
+    return x, int(keep.sum())
+
+
+def fit_h3(stats, cols=None):
+    """Henderson III GLS fit from cached statistics.
+
+    Parameters
+    ----------
+    stats : H3Stats
+        Output of :func:`h3_stats`.
+    cols : array_like, optional
+        Columns of ``X`` to include; all by default.
+
+    Returns
+    -------
+    H3Fit
+    """
+    if cols is not None:
+        stats = stats.subset(cols)
+    N = stats.n.sum()
+    D = stats.n.size
+    S = stats.wsum
+
+    # Within-area regression: sigma_e2
+    Aw = stats.XtWX - (stats.xsum / S[:, None]).T @ stats.xsum
+    bw = stats.XtWy - (stats.xsum / S[:, None]).T @ stats.ysum
+    cw = stats.ytWy - (stats.ysum / S) @ stats.ysum
+    beta_w, rank_w = _lstsq_normal(Aw, bw)
+    sigma_e2 = (cw - beta_w @ bw) / (N - D - rank_w)
+
+    # Weighted OLS: sigma_eta2 by the method of moments
+    A = stats.XtWX
+    Ainv = np.linalg.inv(A)
+    beta_ols = Ainv @ stats.XtWy
+    sse = stats.ytWy - beta_ols @ stats.XtWy
+    tr_m = N - np.trace(Ainv @ stats.XtW2X)
+    tr_mzz = N - np.einsum("dp,pq,dq->", stats.xsum, Ainv, stats.xsum)
+    sigma_eta2 = max((sse - sigma_e2 * tr_m) / tr_mzz, 0.0)
+
+    # GLS
+    gamma = sigma_eta2 / (sigma_eta2 + sigma_e2 * stats.w2sum / (S * S))
+    g = gamma / S
+    G = stats.XtWX - (stats.xsum * g[:, None]).T @ stats.xsum
+    h = stats.XtWy - (stats.xsum * g[:, None]).T @ stats.ysum
+    Ginv = np.linalg.inv(G)
+    return H3Fit(
+        beta=Ginv @ h,
+        sigma_eta2=sigma_eta2,
+        sigma_e2=sigma_e2,
+        vcov=sigma_e2 * Ginv,
+        beta_ols=beta_ols,
+    )
+
+
+def h3(y, X, area, weights=None):
+    """Henderson III GLS fit, ``sae model h3 y X [aw=weights], area(area)``."""
+    return fit_h3(h3_stats(y, X, area, weights))
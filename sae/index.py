@@ -0,0 +1,155 @@
+"""Area-sorted layout shared by the simulation, FGT and merging stages.
+
+Most blocks in the book aggregate with ``groupfunction ..., by(area)`` or
+``collapse ..., by(area)`` and bring area quantities back to households with
+``merge m:1 area using ...``. Once households are sorted by area these are
+contiguous-slice operations described by a CSR-style offsets array:
+households of area ``d`` occupy ``offsets[d]:offsets[d + 1]``. Area totals
+are :func:`numpy.add.reduceat` over the ``starts`` and household expansion
+of area values is :func:`numpy.repeat` over the ``counts``, so no hashing or
+sorting happens inside a Monte Carlo loop.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+
+class AreaIndex:
+    """Offsets of every area in area-sorted household order.
+
+    Parameters
+    ----------
+    labels : ndarray
+        Sorted area labels, ``(D,)``.
+    offsets : ndarray
+        First household of each area followed by ``N``, ``(D + 1,)``.
+    order : ndarray or slice
+        Permutation that sorts the original households by area, or
+        ``slice(None)`` if they already are.
+    """
+
+    def __init__(self, labels, offsets, order=slice(None)):
+        self.labels = np.asarray(labels)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.order = order
+        self.starts = self.offsets[:-1]
+        self.counts = np.diff(self.offsets)
+
+    @classmethod
+    def from_area(cls, area):
+        """Build the index for a household area identifier.
+
+        If ``area`` is already sorted no permutation is stored and
+        :meth:`sort` returns views.
+        """
+        area = np.asarray(area)
+        if area.size and np.all(area[1:] >= area[:-1]):
+            order = slice(None)
+            sorted_area = area
+        else:
+            order = np.argsort(area, kind="stable")
+            sorted_area = area[order]
+        starts = np.flatnonzero(np.r_[True, sorted_area[1:] != sorted_area[:-1]])
+        return cls(sorted_area[starts], np.append(starts, area.size), order)
+
+    def __len__(self):
+        return self.labels.size
+
+    @property
+    def n(self):
+        """Number of households."""
+        return int(self.offsets[-1])
+
+    @property
+    def is_sorted(self):
+        """Whether the original households are already in area order."""
+        return isinstance(self.order, slice)
+
+    def sort(self, x):
+        """Put household data in area order (a view if already sorted)."""
+        return np.asarray(x)[self.order]
+
+    def sum(self, x):
+        """Area totals of area-sorted household data along the first axis."""
+        return np.add.reduceat(np.asarray(x), self.starts, axis=0)
+
+    def mean(self, x, weights=None):
+        """Area (weighted) means of area-sorted household data."""
+        x = np.asarray(x, dtype=np.float64)
+        if weights is None:
+            total = self.sum(x)
+            size = self.counts
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            total = self.sum(x * weights.reshape((-1,) + (1,) * (x.ndim - 1)))
+            size = self.sum(weights)
+        return total / size.reshape((-1,) + (1,) * (x.ndim - 1))
+
+    def expand(self, values):
+        """Broadcast area values to area-sorted households (``merge m:1``)."""
+        return np.repeat(np.asarray(values), self.counts, axis=0)
+
+    def lookup(self, labels):
+        """Position of each label in this index, ``-1`` if absent."""
+        labels = np.asarray(labels)
+        pos = np.minimum(np.searchsorted(self.labels, labels), self.labels.size - 1)
+        return np.where(self.labels[pos] == labels, pos, -1)
+
+
+def as_index(area):
+    """Return ``area`` if it is an :class:`AreaIndex`, else index it."""
+    return area if isinstance(area, AreaIndex) else AreaIndex.from_area(area)
+
+
+class NestedIndex(NamedTuple):
+    """Area and PSU offsets of households sorted by area and PSU within area.
+
+    ``area`` and ``psu`` share the same household order, so values drawn for
+    areas and for PSUs can both be broadcast onto one sorted household
+    array. PSU labels need only be unique within area; ``psu.labels`` is not
+    searchable with :meth:`AreaIndex.lookup` and PSUs are identified by
+    position instead.
+    """
+
+    area: AreaIndex
+    psu: AreaIndex
+    psu_area: np.ndarray  # area position of every PSU, (P,)
+
+    @property
+    def n(self):
+        """Number of households."""
+        return self.area.n
+
+    def sort(self, x):
+        """Put household data in area and PSU order."""
+        return self.area.sort(x)
+
+
+def nested_index(area, psu=None):
+    """Build the :class:`NestedIndex` of households nested in PSUs and areas.
+
+    ``area`` may already be a :class:`NestedIndex`, which is returned as is.
+    """
+    if isinstance(area, NestedIndex):
+        return area
+    area = np.asarray(area)
+    psu = np.asarray(psu)
+    same = area[1:] == area[:-1]
+    if area.size and np.all((area[1:] > area[:-1]) | (same & (psu[1:] >= psu[:-1]))):
+        order = slice(None)
+    else:
+        order = np.lexsort((psu, area))
+        area, psu = area[order], psu[order]
+        same = area[1:] == area[:-1]
+    new_area = np.r_[True, ~same]
+    area_starts = np.flatnonzero(new_area)
+    psu_starts = np.flatnonzero(new_area | np.r_[True, psu[1:] != psu[:-1]])
+    n = np.int64(area.size)
+    return NestedIndex(
+        area=AreaIndex(area[area_starts], np.append(area_starts, n), order),
+        psu=AreaIndex(psu[psu_starts], np.append(psu_starts, n), order),
+        psu_area=np.cumsum(new_area[psu_starts]) - 1,
+    )
@@ -0,0 +1,173 @@
+"""REML estimation of the one-fold nested-error model.
+
+Equivalent to ``mixed y x1 x2 || area:, reml`` for the model
+
+.. math::
+
+    y_{ch} = x_{ch}'\\beta + \\eta_c + e_{ch}, \\quad
+    \\eta_c \\sim N(0, \\sigma^2_\\eta), \\quad e_{ch} \\sim N(0, \\sigma^2_e).
+
+The covariance matrix is block diagonal with blocks
+:math:`\\sigma^2_e (I_{n_c} + \\lambda 1 1')`, :math:`\\lambda =
+\\sigma^2_\\eta / \\sigma^2_e`, whose inverse is
+:math:`\\sigma^{-2}_e (I_{n_c} - \\frac{\\gamma_c}{n_c} 1 1')` with
+:math:`\\gamma_c = \\lambda n_c / (1 + \\lambda n_c)`. Every quantity in the
+restricted likelihood can therefore be written in terms of the totals
+:math:`X'X`, :math:`X'y`, :math:`y'y` and the area sums of :math:`x` and
+:math:`y`. These are gathered in one :math:`O(Np^2)` pass by
+:func:`sufficient_stats`, after which each evaluation of the likelihood
+costs :math:`O(Dp^2)` for :math:`D` areas. :math:`\\sigma^2_e` is profiled
+out and the likelihood is maximized over the intra-class correlation
+:math:`\\rho = \\sigma^2_\\eta / (\\sigma^2_\\eta + \\sigma^2_e) \\in [0, 1)`.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .index import as_index
+
+_GOLDEN = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+class NestedErrorStats(NamedTuple):
+    """Sufficient statistics of the nested-error model."""
+
+    n: np.ndarray  # households by area, (D,)
+    xsum: np.ndarray  # area sums of x, (D, p)
+    ysum: np.ndarray  # area sums of y, (D,)
+    XtX: np.ndarray  # (p, p)
+    Xty: np.ndarray  # (p,)
+    yty: float
+    labels: np.ndarray
+
+    def subset(self, cols):
+        """Statistics for a subset of the columns of ``X``."""
+        cols = np.asarray(cols)
+        return self._replace(
+            xsum=self.xsum[:, cols],
+            XtX=self.XtX[np.ix_(cols, cols)],
+            Xty=self.Xty[cols],
+        )
+
+
+class NestedErrorFit(NamedTuple):
+    """Estimates of the nested-error model."""
+
+    beta: np.ndarray
+    sigma_eta2: float
+    sigma_e2: float
+    vcov: np.ndarray
+    loglik: float
+
+
+def sufficient_stats(y, X, area):
+    """Gather the sufficient statistics of the model in one pass.
+
+    Parameters
+    ----------
+    y : ndarray
+        Dependent variable, length ``N``.
+    X : ndarray
+        Design matrix ``(N, p)``, including the constant.
+    area : ndarray or AreaIndex
+        Area identifier.
+
+    Returns
+    -------
+    NestedErrorStats
+    """
+    y = np.asarray(y, dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    index = as_index(area)
+    return NestedErrorStats(
+        n=index.counts.astype(np.float64),
+        xsum=index.sum(index.sort(X)),
+        ysum=index.sum(index.sort(y)),
+        XtX=X.T @ X,
+        Xty=X.T @ y,
+        yty=float(y @ y),
+        labels=index.labels,
+    )
+
+
+def _profile(stats, rho):
+    """GLS quantities for a given intra-class correlation ``rho``.
+
+    Returns the minus twice restricted log-likelihood (up to a constant),
+    the GLS coefficients, :math:`\\hat\\sigma^2_e` and :math:`X'H^{-1}X`.
+    """
+    lam = rho / (1.0 - rho)
+    n = stats.n
+    w = lam / (1.0 + lam * n)  # gamma_c / n_c
+    wx = stats.xsum * w[:, None]
+    A = stats.XtX - stats.xsum.T @ wx
+    b = stats.Xty - wx.T @ stats.ysum
+    c = stats.yty - (w * stats.ysum) @ stats.ysum
+    L = np.linalg.cholesky(A)
+    z = np.linalg.solve(L, b)
+    beta = np.linalg.solve(L.T, z)
+    dof = n.sum() - A.shape[0]
+    sigma_e2 = (c - z @ z) / dof
+    logdet_A = 2.0 * np.log(np.diag(L)).sum()
+    m2ll = dof * np.log(sigma_e2) + np.log1p(lam * n).sum() + logdet_A
+    return m2ll, beta, sigma_e2, A
+
+
+def _minimize(f, lo, hi, tol=1e-10, maxiter=200):
+    """Golden-section search for the minimum of ``f`` on ``[lo, hi]``."""
+    a, b = lo, hi
+    x1 = b - _GOLDEN * (b - a)
+    x2 = a + _GOLDEN * (b - a)
+    f1, f2 = f(x1), f(x2)
+    for _ in range(maxiter):
+        if b - a < tol:
+            break
+        if f1 <= f2:
+            b, x2, f2 = x2, x1, f1
+            x1 = b - _GOLDEN * (b - a)
+            f1 = f(x1)
+        else:
+            a, x1, f1 = x1, x2, f2
+            x2 = a + _GOLDEN * (b - a)
+            f2 = f(x2)
+    x = (a + b) / 2.0
+    # The boundary rho = 0 (no area effect) is a valid solution.
+    return lo if f(lo) <= f(x) else x
+
+
+def fit_reml(stats, cols=None):
+    """REML fit of the nested-error model from sufficient statistics.
+
+    Parameters
+    ----------
+    stats : NestedErrorStats
+        Output of :func:`sufficient_stats`.
+    cols : array_like, optional
+        Columns of ``X`` to include; all by default. Refitting on a
+        different subset does not touch the household data again.
+
+    Returns
+    -------
+    NestedErrorFit
+    """
+    if cols is not None:
+        stats = stats.subset(cols)
+    rho = _minimize(lambda r: _profile(stats, r)[0], 0.0, 1.0 - 1e-8)
+    m2ll, beta, sigma_e2, A = _profile(stats, rho)
+    dof = stats.n.sum() - A.shape[0]
+    loglik = -0.5 * (m2ll + dof * (1.0 + np.log(2.0 * np.pi)))
+    return NestedErrorFit(
+        beta=beta,
+        sigma_eta2=sigma_e2 * rho / (1.0 - rho),
+        sigma_e2=sigma_e2,
+        vcov=sigma_e2 * np.linalg.inv(A),
+        loglik=loglik,
+    )
+
+
+def reml(y, X, area):
+    """REML fit of the nested-error model, ``mixed y X || area:, reml``."""
+    return fit_reml(sufficient_stats(y, X, area))
@@ -0,0 +1,320 @@
+"""Replicate-weight variance estimation for direct estimates.
+
+Alternative to the linearized variances of :mod:`sae.direct` for designs
+declared with ``svyset [pw=w], strata() vce(jackknife | brr | bootstrap)``.
+A :class:`ReplicateDesign` describes the replicate weights of the
+delete-one-PSU jackknife, balanced repeated replication (with optional Fay
+adjustment) or the Rao-Wu rescaled bootstrap, built once per sample. The
+weight of household :math:`i` in replicate :math:`r` is
+:math:`w_i a_{p(i)r}` for PSU factors :math:`a_{pr}`.
+
+For BRR and the bootstrap every factor may differ from one, and replicate
+domain totals are products of the sparse :math:`D \\times P` matrix of
+(domain, PSU) weighted totals with the dense :math:`P \\times R` factor
+matrix, evaluated over the non-zero (domain, PSU) cells only as a gather of
+factor rows followed by :func:`numpy.add.reduceat` over the domain-sorted
+cells.
+
+A jackknife replicate differs from the full sample in one stratum only. If
+replicate :math:`r` drops PSU :math:`q` of stratum :math:`h`, the total of
+domain :math:`d` is
+
+.. math::
+
+    \\hat T_d^{(r)} = \\hat T_d - \\hat T_{dh}
+    + \\frac{n_h}{n_h - 1} (\\hat T_{dh} - z_{dq}),
+
+where :math:`\\hat T_{dh}` is the total of the domain in the stratum and
+:math:`z_{dq}` that of the PSU. It differs from :math:`\\hat T_d` only for
+the :math:`n_h` replicates of the strata where the domain has households,
+so the jackknife never builds a factor matrix: its replicate estimates are
+kept as sparse deviations from the full-sample estimates, computed from
+the non-zero (domain, PSU) cells, and the variances of
+:func:`replicate_estimates` are sums over those deviations.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from .direct import _codes, _design
+
+
+class ReplicateDesign:
+    """Replicate factors of a stratified cluster sample.
+
+    Use the constructors :meth:`jackknife`, :meth:`brr` and
+    :meth:`bootstrap`.
+
+    Parameters
+    ----------
+    unit : ndarray
+        PSU code of every household, ``(n,)``.
+    factors : ndarray or None
+        Replicate factors of every PSU, ``(P, R)``; ``None`` for the
+        jackknife, whose replicates are derived from ``psu_stratum``.
+    coef : ndarray
+        Multiplier of the squared deviation of every replicate, ``(R,)``.
+    method : str
+        Name of the replication method.
+    psu_stratum : ndarray
+        Stratum code of every PSU, ``(P,)``.
+    """
+
+    def __init__(self, unit, factors, coef, method, psu_stratum):
+        self.unit = unit
+        self.factors = factors
+        self.coef = coef
+        self.method = method
+        self.psu_stratum = psu_stratum
+
+    @property
+    def n_replicates(self):
+        return self.coef.size
+
+    @staticmethod
+    def _layout(strata, psu, n):
+        """PSU code of every household and stratum code of every PSU."""
+        return _design(n, strata, psu)[:2]
+
+    @classmethod
+    def jackknife(cls, strata, psu):
+        """Delete-one-PSU jackknife (JKn).
+
+        Replicate :math:`r` drops PSU :math:`r` of stratum :math:`h` and
+        multiplies the weights of the other PSUs of the stratum by
+        :math:`n_h / (n_h - 1)`; the variance is
+        :math:`\\sum_r \\frac{n_h - 1}{n_h} (\\hat\\theta_r - \\hat\\theta)^2`.
+        Strata with a single PSU get no replicate.
+        """
+        n = np.asarray(psu if psu is not None else strata).shape[0]
+        unit, psu_stratum = cls._layout(strata, psu, n)
+        n_h = np.bincount(psu_stratum).astype(np.float64)
+        h = psu_stratum[n_h[psu_stratum] > 1]
+        return cls(unit, None, (n_h[h] - 1.0) / n_h[h], "jackknife", psu_stratum)
+
+    @classmethod
+    def brr(cls, strata, psu, fay=0.0):
+        """Balanced repeated replication with Fay's adjustment ``fay``.
+
+        Every stratum must have exactly two PSUs. Half-samples follow the
+        columns of a Sylvester Hadamard matrix; the PSU kept in a replicate
+        gets factor :math:`2 - \\rho` and the other :math:`\\rho`, and the
+        variance is :math:`\\sum_r (\\hat\\theta_r - \\hat\\theta)^2 /
+        (R (1 - \\rho)^2)`.
+        """
+        unit, psu_stratum = cls._layout(strata, psu, np.asarray(psu).shape[0])
+        n_h = np.bincount(psu_stratum)
+        if np.any(n_h != 2):
+            raise ValueError("BRR requires exactly two PSUs per stratum")
+        H = n_h.size
+        R = 4
+        while R < H + 1:
+            R *= 2
+        hadamard = np.ones((1, 1))
+        while hadamard.shape[0] < R:
+            hadamard = np.block([[hadamard, hadamard], [hadamard, -hadamard]])
+        # Row 0 is constant; strata use rows 1..H.
+        sign = hadamard[1 : H + 1]
+        first = np.r_[True, psu_stratum[1:] != psu_stratum[:-1]]
+        keep = np.where(first[:, None], sign[psu_stratum] > 0, sign[psu_stratum] < 0)
+        factors = np.where(keep, 2.0 - fay, fay)
+        coef = np.full(R, 1.0 / (R * (1.0 - fay) ** 2))
+        return cls(unit, factors, coef, "brr", psu_stratum)
+
+    @classmethod
+    def bootstrap(cls, strata, psu, n_rep=200, seed=None):
+        """Rao-Wu rescaled bootstrap with :math:`n_h - 1` PSUs per stratum.
+
+        Each replicate draws :math:`n_h - 1` PSUs with replacement in every
+        stratum; a PSU drawn :math:`m` times gets factor
+        :math:`m\\, n_h / (n_h - 1)`. The variance is
+        :math:`\\sum_r (\\hat\\theta_r - \\hat\\theta)^2 / R`.
+        """
+        rng = np.random.default_rng(seed)
+        n = np.asarray(psu if psu is not None else strata).shape[0]
+        unit, psu_stratum = cls._layout(strata, psu, n)
+        P = psu_stratum.size
+        n_h = np.bincount(psu_stratum)
+        first = np.r_[0, np.cumsum(n_h)[:-1]]
+        draws_h = np.maximum(n_h - 1, 0)
+        stratum = np.repeat(np.arange(n_h.size), draws_h)
+        offset = rng.random((stratum.size, n_rep)) * n_h[stratum][:, None]
+        pick = first[stratum][:, None] + offset.astype(np.intp)
+        counts = np.bincount((pick * n_rep + np.arange(n_rep)).ravel(), minlength=P * n_rep)
+        scale = (n_h / np.maximum(n_h - 1.0, 1.0))[psu_stratum]
+        factors = counts.reshape(P, n_rep) * scale[:, None]
+        factors[n_h[psu_stratum] == 1] = 1.0
+        return cls(unit, factors, np.full(n_rep, 1.0 / n_rep), "bootstrap", psu_stratum)
+
+    def _deviations(self, z, domain):
+        """Domain totals of the columns of ``z`` and their replicate deviations.
+
+        Returns the sorted domain labels, the totals ``(D, k)`` and the
+        non-zero deviations :math:`\\hat T_d^{(r)} - \\hat T_d` as
+        ``(domain, replicate, deviation)`` triplets, with deviations
+        ``(m, k)``.
+        """
+        labels, d = _codes(domain)
+        D = labels.size
+        P = self.psu_stratum.size
+        cols = z.reshape(z.shape[0], -1)
+        cell, cell_of = np.unique(d * P + self.unit, return_inverse=True)
+        cell_domain, cell_psu = cell // P, cell % P
+        total = np.empty((D, cols.shape[1]))
+
+        if self.factors is not None:
+            R = self.n_replicates
+            cell_starts = np.flatnonzero(np.r_[True, cell_domain[1:] != cell_domain[:-1]])
+            gathered = self.factors[cell_psu]
+            dev = np.empty((D, R, cols.shape[1]))
+            for j, col in enumerate(cols.T):
+                z_cell = np.bincount(cell_of, col, cell.size)
+                total[:, j] = np.add.reduceat(z_cell, cell_starts)
+                reps = np.add.reduceat(z_cell[:, None] * gathered, cell_starts, axis=0)
+                dev[:, :, j] = reps - total[:, j, None]
+            return (
+                labels, total, np.repeat(np.arange(D), R), np.tile(np.arange(R), D),
+                dev.reshape(D * R, -1),
+            )
+
+        # Jackknife: (domain, stratum) groups of the cells, and one deviation
+        # per group and PSU of its stratum when the stratum has replicates.
+        n_h = np.bincount(self.psu_stratum)
+        H = n_h.size
+        multi = n_h > 1
+        first_psu = np.r_[0, np.cumsum(n_h)[:-1]]
+        first_rep = np.r_[0, np.cumsum(np.where(multi, n_h, 0))[:-1]]
+        cell_h = self.psu_stratum[cell_psu]
+        group, group_of = np.unique(cell_domain * H + cell_h, return_inverse=True)
+        group_domain, group_h = group // H, group % H
+        size = np.where(multi[group_h], n_h[group_h], 0)
+        pair_start = np.r_[0, np.cumsum(size)[:-1]]
+        pair_group = np.repeat(np.arange(group.size), size)
+        offset = np.arange(pair_group.size) - pair_start[pair_group]
+        rep = first_rep[group_h[pair_group]] + offset
+        in_pair = multi[cell_h]
+        cell_pair = pair_start[group_of[in_pair]] + cell_psu[in_pair] - first_psu[cell_h[in_pair]]
+        inflate = (n_h / np.maximum(n_h - 1.0, 1.0))[cell_h[in_pair]]
+        share = 1.0 / np.maximum(n_h[group_h[pair_group]] - 1.0, 1.0)
+
+        dev = np.empty((pair_group.size, cols.shape[1]))
+        for j, col in enumerate(cols.T):
+            z_cell = np.bincount(cell_of, col, cell.size)
+            total[:, j] = np.bincount(cell_domain, z_cell, D)
+            dev[:, j] = np.bincount(group_of, z_cell, group.size)[pair_group] * share
+            dev[cell_pair, j] -= inflate * z_cell[in_pair]
+        return labels, total, group_domain[pair_group], rep, dev
+
+    def replicate_totals(self, z, domain):
+        """Full-sample and replicate domain totals of ``z``.
+
+        The replicates are returned densely; :func:`replicate_estimates`
+        computes variances without them.
+
+        Parameters
+        ----------
+        z : ndarray
+            Weighted values :math:`w_i y_i`, ``(n,)`` or ``(n, k)``.
+        domain : ndarray
+            Domain of every household.
+
+        Returns
+        -------
+        labels : ndarray
+            Sorted domain labels, ``(D,)``.
+        total : ndarray
+            ``(D,)`` or ``(D, k)``.
+        replicates : ndarray
+            ``(D, R)`` or ``(D, k, R)``.
+        """
+        z = np.asarray(z, dtype=np.float64)
+        labels, total, dom, rep, dev = self._deviations(z, domain)
+        reps = np.repeat(total[:, :, None], self.n_replicates, axis=2)
+        reps[dom, :, rep] += dev
+        if z.ndim == 1:
+            return labels, total[:, 0], reps[:, 0]
+        return labels, total, reps
+
+    def variance(self, estimate, replicates):
+        """Replication variance of ``estimate`` given its ``replicates``.
+
+        ``replicates`` has the shape of ``estimate`` plus a trailing axis of
+        length :math:`R`. Deviations are taken from the full-sample
+        estimate.
+        """
+        dev = replicates - np.asarray(estimate)[..., None]
+        return (dev * dev) @ self.coef
+
+
+def _sum_squares(dom, coef, dev, D):
+    """:math:`\\sum_r c_r \\delta_{dr}^2` of sparse deviations, ``(D, k)``."""
+    return np.column_stack([np.bincount(dom, coef * x * x, D) for x in dev.T])
+
+
+def replicate_estimates(design, y, domain, weights):
+    """Direct estimates by domain with replication variances.
+
+    Parameters
+    ----------
+    design : ReplicateDesign
+        Replicate factors of the sample.
+    y : ndarray
+        Variable(s) to estimate, ``(n,)`` or ``(n, k)``.
+    domain : ndarray
+        Domain of every household.
+    weights : ndarray
+        Sampling weights.
+
+    Returns
+    -------
+    dict
+        ``"domain"``, ``"N_hat"``, ``"total"`` and ``"total_var"``,
+        ``"mean"`` and ``"mean_var"`` (Hájek), as in
+        :func:`~sae.direct.direct_estimates`, and ``"n_replicates"``, the
+        number of replicates in ``"mean_var"`` of every domain.
+
+    Notes
+    -----
+    As in Stata's ``svy jackknife`` and ``svy bootstrap``, a replicate that
+    leaves a domain without weight, e.g. the jackknife replicate dropping
+    the only PSU where the domain has households, has no mean for the
+    domain and is left out of its ``"mean_var"``. BRR and bootstrap
+    replicates share one coefficient, so their ``"mean_var"`` is rescaled
+    to average over the replicates used; jackknife coefficients belong to
+    the strata and are kept. A domain that no replicate keeps gets a NaN
+    ``"mean_var"``.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    w = np.asarray(weights, dtype=np.float64)
+    z = y * (w if y.ndim == 1 else w[:, None])
+    zw = np.column_stack([w, z.reshape(w.size, -1)])
+    labels, total, dom, rep, dev = design._deviations(zw, domain)
+    D = labels.size
+    coef = design.coef[rep]
+    N_hat, total = total[:, 0], total[:, 1:]
+    mean = total / N_hat[:, None]
+    # Replicate weights are zero or at least one household's weight times
+    # its factor, so the tolerance only absorbs rounding in the deviations.
+    N_rep = N_hat[dom] + dev[:, 0]
+    kept = N_rep > 1e-10 * N_hat[dom]
+    mean_dev = (total[dom[kept]] + dev[kept, 1:]) / N_rep[kept, None] - mean[dom[kept]]
+    n_rep = design.n_replicates - np.bincount(dom[~kept], minlength=D)
+    mean_var = _sum_squares(dom[kept], coef[kept], mean_dev, D)
+    if design.factors is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_var *= (design.n_replicates / n_rep)[:, None]
+    mean_var[n_rep == 0] = np.nan
+    out = {
+        "domain": labels,
+        "N_hat": N_hat,
+        "total": total,
+        "total_var": _sum_squares(dom, coef, dev[:, 1:], D),
+        "mean": mean,
+        "mean_var": mean_var,
+        "n_replicates": n_rep,
+    }
+    if y.ndim == 1:
+        for key in ("total", "total_var", "mean", "mean_var"):
+            out[key] = out[key][:, 0]
+    return out
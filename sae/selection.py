@@ -0,0 +1,195 @@
+"""Model selection loops used in the book's applications.
+
+:func:`backward_elimination` reproduces the Stata loop used throughout the
+area-level, unit-level and diagnostics chapters::
+
+    forval z= 0.5(-0.05)0.05{
+        qui:sae model h3 y `hhvars' [aw=Whh], area(area)
+        ...  exit if every coefficient is significant at level z
+        foreach x of varlist `hhvars'{
+            qui: sae model h3 y `hhvars' [aw=Whh], area(area)
+            qui: test `x'
+            if (r(p)>`z') remove x from hhvars
+        }
+    }
+
+In Stata the model is refit once per candidate variable and threshold, even
+though the estimates only change when a variable is removed. Here the fit is
+kept until the covariate set changes, and fits are computed from cached
+sufficient statistics (:func:`~sae.henderson.h3_stats`,
+:func:`~sae.nested_error.sufficient_stats`), so the households are never
+scanned again. With ``update_variance=False`` the variance components are
+held at their initial values and a removal becomes an :math:`O(p^2)`
+downdate of the GLS coefficients and their covariance.
+
+:func:`stepwise_vif` replaces ``mata: ds = _f_stepvif(vars, w, 3, touse)``,
+which drops the covariate with the largest variance inflation factor until
+every VIF is below the threshold.
+"""
+
+from __future__ import annotations
+
+from math import erfc, sqrt
+
+import numpy as np
+
+from .henderson import fit_h3
+
+#: Significance thresholds of ``forval z= 0.5(-0.05)0.05``.
+THRESHOLDS = tuple(np.linspace(0.5, 0.05, 10).round(2))
+
+
+def _pvalue(beta, vcov, k):
+    """Two-sided Wald test p-value of coefficient ``k``."""
+    return erfc(abs(beta[k]) / sqrt(vcov[k, k]) / sqrt(2.0))
+
+
+def _drop(beta, vcov, k):
+    """GLS estimates after removing coefficient ``k``, variances held fixed.
+
+    .. math::
+
+        \\beta_{-k} - V_{-k,k} \\beta_k / V_{kk}, \\qquad
+        V_{-k,-k} - V_{-k,k} V_{k,-k} / V_{kk}
+    """
+    keep = np.arange(beta.size) != k
+    v = vcov[keep, k]
+    return (
+        beta[keep] - v * (beta[k] / vcov[k, k]),
+        vcov[np.ix_(keep, keep)] - np.outer(v, v) / vcov[k, k],
+    )
+
+
+def backward_elimination(
+    stats,
+    cols,
+    fit=fit_h3,
+    thresholds=THRESHOLDS,
+    keep=(0,),
+    update_variance=True,
+):
+    """Sequential removal of non-significant covariates.
+
+    Parameters
+    ----------
+    stats
+        Cached statistics accepted by ``fit``, e.g. the output of
+        :func:`~sae.henderson.h3_stats`.
+    cols : sequence of int
+        Candidate columns of ``X``, in the order they are tested.
+    fit : callable
+        ``fit(stats, cols)`` returning an object with ``beta`` and ``vcov``,
+        such as :func:`~sae.henderson.fit_h3` or
+        :func:`~sae.nested_error.fit_reml`.
+    thresholds : sequence of float
+        Decreasing significance levels.
+    keep : sequence of int
+        Columns always in the model and never tested, by default the
+        constant in column 0. They do enter the stopping rule, as ``_cons``
+        does in ``e(b_gls)``.
+    update_variance : bool
+        Re-estimate the variance components after every removal. This
+        gives the same covariates as the Stata loop. If ``False`` the
+        initial variance components are reused and removals are rank-one
+        downdates; a final refit is done on the selected covariates.
+
+    Returns
+    -------
+    selected : list of int
+        Retained candidate columns (``$postsign``).
+    result
+        Fit on ``keep`` plus the selected columns.
+    """
+    keep = list(keep)
+    current = [c for c in cols if c not in keep]
+    res = fit(stats, keep + current)
+    beta, vcov = res.beta, res.vcov
+    for z in thresholds:
+        se = np.sqrt(np.diag(vcov))
+        if erfc(np.min(np.abs(beta / se)) / sqrt(2.0)) < z:
+            break
+        for x in list(current):
+            k = len(keep) + current.index(x)
+            if _pvalue(beta, vcov, k) <= z:
+                continue
+            current.remove(x)
+            if update_variance:
+                res = fit(stats, keep + current)
+                beta, vcov = res.beta, res.vcov
+            else:
+                beta, vcov = _drop(beta, vcov, k)
+    if not update_variance:
+        res = fit(stats, keep + current)
+    return current, res
+
+
+def _sweep(B, k, reverse=False):
+    """Sweep (or reverse sweep) symmetric matrix ``B`` in place on pivot ``k``."""
+    d = B[k, k]
+    col = B[:, k].copy()
+    B -= np.outer(col, col) / d
+    sign = -1.0 if reverse else 1.0
+    B[:, k] = sign * col / d
+    B[k, :] = sign * col / d
+    B[k, k] = -1.0 / d
+
+
+def stepwise_vif(X, weights=None, threshold=3.0, cols=None, tol=1e-10):
+    """Stepwise removal of collinear covariates by variance inflation factor.
+
+    The VIF of covariate :math:`j` is :math:`[R^{-1}]_{jj}`, where :math:`R`
+    is the weighted correlation matrix of the covariates, so every VIF is
+    read off the diagonal of a single inverse instead of running one
+    auxiliary regression per covariate. The inverse is built with the sweep
+    operator, and removing a covariate is a reverse sweep on its pivot, an
+    :math:`O(p^2)` update. Covariates that are exactly collinear with the
+    ones already swept have an infinite VIF; they are swept in as soon as a
+    removal makes them estimable again.
+
+    Parameters
+    ----------
+    X : ndarray
+        Data matrix ``(N, k)``.
+    weights : ndarray, optional
+        Analytic weights.
+    threshold : float
+        Maximum VIF allowed.
+    cols : sequence of int, optional
+        Columns of ``X`` to consider, in order. All by default.
+    tol : float
+        Pivot below which a covariate is treated as collinear.
+
+    Returns
+    -------
+    list of int
+        Retained columns (``$postvif``).
+    """
+    cols = list(range(np.shape(X)[1])) if cols is None else list(cols)
+    X = np.asarray(X, dtype=np.float64)[:, cols]
+    w = np.ones(X.shape[0]) if weights is None else np.asarray(weights, dtype=np.float64)
+    w = w / w.sum()
+    Xc = X - w @ X
+    cov = (Xc * w[:, None]).T @ Xc
+    sd = np.sqrt(np.diag(cov))
+    ok = sd > 0
+    B = np.zeros_like(cov)
+    B[np.ix_(ok, ok)] = cov[np.ix_(ok, ok)] / np.outer(sd[ok], sd[ok])
+
+    p = len(cols)
+    active = np.ones(p, dtype=bool)
+    swept = np.zeros(p, dtype=bool)
+    while True:
+        for k in np.flatnonzero(active & ~swept):
+            if B[k, k] > tol:
+                _sweep(B, k)
+                swept[k] = True
+        vif = np.where(swept, -np.diag(B), np.inf)
+        vif[~active] = -np.inf
+        j = int(np.argmax(vif))
+        if not active.any() or vif[j] <= threshold:
+            break
+        active[j] = False
+        if swept[j]:
+            _sweep(B, j, reverse=True)
+            swept[j] = False
+    return [c for c, a in zip(cols, active) if a]
@@ -0,0 +1,527 @@
+"""Model-based simulation experiments.
+
+Python counterpart of *Simulation Experiment 1* in the off-census chapter.
+There, each of the 5,000 iterations reloads ``popX.dta``, draws area, PSU
+and household errors, saves the population and the true values to tempfiles,
+calls ``sae sim h3`` once per method, and merges everything back to update
+the bias and MSE.
+
+:class:`ModelSimulation` keeps the population covariates and :math:`X\\beta`
+in memory, sorted by area and PSU, and each iteration only draws the three
+error vectors. Area and PSU effects are drawn at their own level and
+broadcast to households through offsets rather than forward-filled. True
+values and every estimator are computed on the in-memory arrays, so no
+iteration touches the disk.
+
+Long experiments can write a checkpoint every few iterations, holding the
+accumulated bias and MSE, the number of completed iterations and the state
+of the random number generator; :meth:`ModelSimulation.run` resumes from it
+and ends with the same results as an uninterrupted run.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+
+from .accumulators import BiasMSEAccumulator
+from .censuseb import EBSpec, censuseb, censuseb_many, eb_effects
+from .fgt import ALPHAS, PovertyLines, grouped_fgt
+from .henderson import fit_h3, h3_stats
+from .index import AreaIndex, as_index, nested_index
+from .streams import AREA, HOUSEHOLD, PSU, IterationGenerator, RandomStreams
+
+
+class ModelSimulation:
+    """Population generator following the nested-error model.
+
+    .. math::
+
+        Y_{cph} = x_{cph}'\\beta + \\eta_c + \\eta_{cp} + e_{cph}
+
+    Parameters
+    ----------
+    xb : ndarray
+        Linear fit :math:`x'\\beta` of every household.
+    area : ndarray
+        Area identifier.
+    sigma_eta2 : float
+        Variance of the area effect.
+    sigma_e2 : float
+        Variance of the household error.
+    psu : ndarray, optional
+        PSU identifier (nested within area); if omitted there is no PSU
+        effect.
+    sigma_psu2 : float
+        Variance of the PSU effect.
+    weights : ndarray, optional
+        Household expansion factors (``hhsize``).
+    transform : callable
+        Maps :math:`Y` to welfare, ``numpy.exp`` by default.
+
+    Notes
+    -----
+    Households are stored sorted by area and PSU. Use :meth:`sort` to put
+    any other household variable (e.g. the covariates given to an
+    estimator) in the same order.
+    """
+
+    def __init__(
+        self,
+        xb,
+        area,
+        sigma_eta2,
+        sigma_e2,
+        psu=None,
+        sigma_psu2=0.0,
+        weights=None,
+        transform=np.exp,
+    ):
+        # Indexes of the sorted households, whose order is the identity.
+        if psu is None:
+            index = as_index(area)
+            self.psu_index = None
+        else:
+            nested = nested_index(area, psu)
+            index = nested.area
+            self.psu_index = AreaIndex(nested.psu.labels, nested.psu.offsets)
+        self.order = index.order
+        self.index = AreaIndex(index.labels, index.offsets)
+        self.xb = self.sort(xb).astype(np.float64)
+        self.weights = None if weights is None else self.sort(weights).astype(np.float64)
+        self.sigma_eta2 = sigma_eta2
+        self.sigma_psu2 = sigma_psu2
+        self.sigma_e2 = sigma_e2
+        self.transform = transform
+
+    def sort(self, x):
+        """Put household data in the simulation's area and PSU order."""
+        return np.asarray(x)[self.order]
+
+    def population(self, rng):
+        """Draw one population's :math:`Y`, in sorted household order."""
+        y = self.xb + rng.normal(0.0, np.sqrt(self.sigma_e2), self.xb.size)
+        y += self.index.expand(rng.normal(0.0, np.sqrt(self.sigma_eta2), len(self.index)))
+        if self.psu_index is not None:
+            n_psu = len(self.psu_index)
+            y += self.psu_index.expand(rng.normal(0.0, np.sqrt(self.sigma_psu2), n_psu))
+        return y
+
+    def population_at(self, streams, iteration, areas=None):
+        """:math:`Y` of population ``iteration`` drawn from keyed streams.
+
+        Area, PSU and household errors are read at their positions in the
+        sorted areas, PSUs and households of streams ``(iteration, 0, AREA)``,
+        ``(iteration, 0, PSU)`` and ``(iteration, 0, HOUSEHOLD)`` of
+        ``streams``, so the population does not depend on which iterations
+        ran before, and any subset of areas can be regenerated alone.
+
+        Parameters
+        ----------
+        streams : RandomStreams
+            Keyed random streams of the experiment.
+        iteration : int
+            Population number.
+        areas : array_like of int, optional
+            Positions of the areas to draw; all by default. The households
+            of those areas are returned in sorted order.
+
+        Returns
+        -------
+        ndarray
+        """
+
+        def draw(stream, starts, counts):
+            key = (int(iteration), 0, stream)
+            return np.concatenate(
+                [streams.normal(key, s, c) for s, c in zip(starts, counts)]
+            )
+
+        if areas is None:
+            eta = draw(AREA, [0], [len(self.index)])
+            y = draw(HOUSEHOLD, [0], [self.xb.size]) * np.sqrt(self.sigma_e2)
+            y += self.xb
+            y += self.index.expand(np.sqrt(self.sigma_eta2) * eta)
+            if self.psu_index is not None:
+                psu = draw(PSU, [0], [len(self.psu_index)])
+                y += self.psu_index.expand(np.sqrt(self.sigma_psu2) * psu)
+            return y
+
+        areas = np.asarray(areas)
+        starts, counts = self.index.starts[areas], self.index.counts[areas]
+        eta = draw(AREA, areas, np.ones_like(areas))
+        y = draw(HOUSEHOLD, starts, counts) * np.sqrt(self.sigma_e2)
+        y += self.xb[np.concatenate([np.arange(s, s + c) for s, c in zip(starts, counts)])]
+        y += np.repeat(np.sqrt(self.sigma_eta2) * eta, counts)
+        if self.psu_index is not None:
+            first, last = np.searchsorted(self.psu_index.starts, [starts, starts + counts])
+            psu = draw(PSU, first, last - first)
+            sizes = np.concatenate([self.psu_index.counts[f:l] for f, l in zip(first, last)])
+            y += np.repeat(np.sqrt(self.sigma_psu2) * psu, sizes)
+        return y
+
+    def truth(self, y, povline, alphas=ALPHAS):
+        """True area FGT on the welfare scale, mean welfare and mean ``Y``."""
+        welfare = self.transform(y)
+        stats = grouped_fgt(welfare, povline, self.index.starts, self.weights, alphas)
+        out = {"fgt%d" % a: stats[k] for k, a in enumerate(alphas)}
+        out["mean"] = self.index.mean(welfare, self.weights)
+        out["Y"] = self.index.mean(y, self.weights)
+        return out
+
+    def run(
+        self,
+        estimators,
+        n_sim,
+        povline,
+        seed=None,
+        alphas=ALPHAS,
+        accumulator=None,
+        checkpoint=None,
+        every=100,
+    ):
+        """Empirical bias and MSE of several estimators.
+
+        Parameters
+        ----------
+        estimators : mapping of str to callable
+            ``estimator(y, rng)`` receives the simulated :math:`Y` in sorted
+            household order and returns a dict of area estimates keyed
+            like :meth:`truth` (``"fgt0"``, ..., ``"mean"`` or ``"Y"``). A
+            :class:`CensusEBBatch` may be given under any name; its members
+            are reported under their own names.
+        n_sim : int
+            Number of simulated populations.
+        povline : float or PovertyLines
+            Poverty line on the welfare scale, for the true values. With a
+            grid of lines (e.g. :meth:`PovertyLines.percentiles` of the
+            census welfare) every FGT bias and MSE has shape ``(areas, K)``,
+            and averaging over areas gives curves across the lines.
+        seed : int, numpy.random.Generator or RandomStreams, optional
+            Seed for replicability. With :class:`~sae.streams.RandomStreams`,
+            population ``i`` is :meth:`population_at` ``(streams, i)`` and
+            estimators receive the
+            :class:`~sae.streams.IterationGenerator` of iteration ``i``, so
+            every iteration can be reproduced on its own. CensusEB
+            estimators draw Monte Carlo replicate ``r`` from streams keyed
+            by ``(i, r)``, so a single replicate can be reproduced as well.
+        alphas : sequence of int
+            FGT parameters for the true values.
+        accumulator : BiasMSEAccumulator, optional
+            Accumulator to update in place, e.g. one holding earlier
+            iterations. A new one is used by default. When resuming from a
+            checkpoint its contents are replaced by the checkpoint's, which
+            already include whatever it held when the run started.
+        checkpoint : str or path-like, optional
+            File to which progress is written every ``every`` iterations
+            and at the end (see :func:`save_checkpoint`). If it exists, the
+            run resumes after its last completed iteration, with the same
+            generator state, instead of starting over. A checkpoint written
+            with another ``n_sim``, kind of seed (generator or
+            :class:`~sae.streams.RandomStreams`), known seed, poverty line
+            or set of estimator names raises ``ValueError``.
+        every : int
+            Iterations between checkpoints.
+
+        Returns
+        -------
+        dict
+            ``"area"`` and ``"<method>_bias_<indicator>"`` and
+            ``"<method>_mse_<indicator>"`` for every estimator and every
+            indicator it returns, as in ``bias_in_mymodel.dta``, together
+            with their Monte Carlo standard errors (``"_se"`` suffix).
+        """
+        streams = seed if isinstance(seed, RandomStreams) else None
+        rng = None if streams is not None else np.random.default_rng(seed)
+        acc = BiasMSEAccumulator() if accumulator is None else accumulator
+        methods = _method_names(estimators)
+        start = 0
+        if checkpoint is not None and os.path.exists(checkpoint):
+            done, start, rng_state, run = load_checkpoint(checkpoint)
+            _check_run(run, n_sim, seed, povline, methods, checkpoint)
+            acc.n, acc.moments = done.n, done.moments
+            if streams is None:
+                rng.bit_generator.state = rng_state
+
+        def save(iteration):
+            save_checkpoint(
+                checkpoint, acc, iteration, None if streams else rng, n_sim=n_sim,
+                seed=seed, povline=povline, estimators=methods,
+            )
+
+        for i in range(start, n_sim):
+            if checkpoint is not None and i > start and i % every == 0:
+                save(i)
+            if streams is None:
+                y = self.population(rng)
+            else:
+                y = self.population_at(streams, i)
+                rng = IterationGenerator(streams, i)
+            true = self.truth(y, povline, alphas)
+            for name, estimator in estimators.items():
+                if isinstance(estimator, CensusEBBatch):
+                    results = estimator(y, rng)
+                else:
+                    results = {name: estimator(y, rng)}
+                for method, out in results.items():
+                    for key, est in out.items():
+                        acc.update(method, key, est, true[key])
+        if checkpoint is not None:
+            save(max(n_sim, start))
+        return acc.result(self.index.labels)
+
+
+def _seed_id(seed):
+    """Kind of seed of a run and, when it is known, its value."""
+    if isinstance(seed, RandomStreams):
+        return "streams", "%d/%d" % (seed.seed, seed.experiment)
+    if isinstance(seed, (int, np.integer)):
+        return "generator", str(int(seed))
+    return "generator", ""
+
+
+def _method_names(estimators):
+    """Sorted names under which ``estimators`` report their results."""
+    names = []
+    for name, estimator in estimators.items():
+        if isinstance(estimator, CensusEBBatch):
+            names.extend(estimator.estimators)
+        else:
+            names.append(name)
+    return sorted(names)
+
+
+def _lines(povline):
+    """Poverty lines of a run as a flat float array."""
+    if isinstance(povline, PovertyLines):
+        povline = povline.values
+    return np.asarray(povline, dtype=np.float64).ravel()
+
+
+def _check_run(run, n_sim, seed, povline, methods, path):
+    """Reject a checkpoint written by a different run."""
+    kind, value = _seed_id(seed)
+    if run["n_sim"] is not None and run["n_sim"] != n_sim:
+        raise ValueError("checkpoint %s is for n_sim=%d, not %d" % (path, run["n_sim"], n_sim))
+    if run["seed_kind"] is not None and run["seed_kind"] != kind:
+        raise ValueError("checkpoint %s was written with a %s seed" % (path, run["seed_kind"]))
+    if run["seed"] and value and run["seed"] != value:
+        raise ValueError("checkpoint %s was written with seed %s" % (path, run["seed"]))
+    if run["povline"] is not None and not np.array_equal(run["povline"], _lines(povline)):
+        raise ValueError(
+            "checkpoint %s was written with poverty lines %s" % (path, run["povline"].tolist())
+        )
+    if run["estimators"] is not None and run["estimators"] != list(methods):
+        raise ValueError(
+            "checkpoint %s was written with estimators %s" % (path, run["estimators"])
+        )
+
+
+def save_checkpoint(
+    path, accumulator, iteration, rng=None, n_sim=None, seed=None, povline=None, estimators=None
+):
+    """Write the progress of a simulation to a compact ``.npz`` file.
+
+    The file holds :meth:`BiasMSEAccumulator.state`, the number of
+    completed iterations, the state of ``rng``'s bit generator and, to
+    identify the run, ``n_sim``, the kind and value of ``seed``, the
+    poverty lines and the sorted estimator names. It is written to a
+    temporary file first and then renamed, so a crash while writing leaves
+    the previous checkpoint intact.
+    """
+    state = accumulator.state()
+    state["iteration"] = np.int64(iteration)
+    rng_state = "" if rng is None else json.dumps(rng.bit_generator.state, default=_encode)
+    state["rng_state"] = np.array(rng_state)
+    kind, value = _seed_id(seed)
+    state["n_sim"] = np.int64(-1 if n_sim is None else n_sim)
+    state["seed_kind"] = np.array(kind)
+    state["seed"] = np.array(value)
+    if povline is not None:
+        state["povline"] = _lines(povline)
+    if estimators is not None:
+        state["estimators"] = np.array(sorted(estimators), dtype=str)
+    path = os.fspath(path)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **state)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """Read a file written by :func:`save_checkpoint`.
+
+    Returns
+    -------
+    accumulator : BiasMSEAccumulator
+    iteration : int
+        Number of completed iterations.
+    rng_state : dict or None
+        Bit generator state, to assign to ``rng.bit_generator.state``.
+    run : dict
+        ``"n_sim"``, ``"seed_kind"``, ``"seed"``, ``"povline"`` and
+        ``"estimators"`` of the run that wrote the file (``None`` or ``""``
+        when unknown).
+    """
+    with np.load(path) as f:
+        accumulator = BiasMSEAccumulator.from_state(f)
+        iteration = int(f["iteration"])
+        rng_state = str(f["rng_state"])
+        n_sim = int(f["n_sim"]) if "n_sim" in f else -1
+        run = {
+            "n_sim": None if n_sim < 0 else n_sim,
+            "seed_kind": str(f["seed_kind"]) if "seed_kind" in f else None,
+            "seed": str(f["seed"]) if "seed" in f else "",
+            "povline": f["povline"] if "povline" in f else None,
+            "estimators": f["estimators"].tolist() if "estimators" in f else None,
+        }
+    rng_state = json.loads(rng_state, object_hook=_decode) if rng_state else None
+    return accumulator, iteration, rng_state, run
+
+
+def _encode(value):
+    if isinstance(value, np.ndarray):
+        return {"__ndarray__": value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, np.integer):
+        return int(value)
+    raise TypeError("cannot serialize %r" % type(value))
+
+
+def _decode(obj):
+    if "__ndarray__" in obj:
+        return np.array(obj["__ndarray__"], dtype=obj["dtype"])
+    return obj
+
+
+class CensusEBEstimator:
+    """CensusEB (or unit-context) estimator for :meth:`ModelSimulation.run`.
+
+    Equivalent to ``sae sim h3 Y x, area(area) mcrep() matin(census)`` with
+    the simulated population used as the survey, as in the book's
+    experiments. The design is fixed across iterations, so its Henderson III
+    cross-products are computed once and only the terms involving ``Y`` are
+    updated per population.
+
+    Parameters
+    ----------
+    X : ndarray
+        Covariates of every household, including the constant, in the
+        simulation's sorted order (see :meth:`ModelSimulation.sort`). For a
+        unit-context model these are area or PSU means.
+    index : AreaIndex
+        Area index of the simulation (``ModelSimulation.index``).
+    povline : float or PovertyLines
+        Poverty line, or grid of lines, on the scale of ``transform(Y)``.
+    transform : callable, optional
+        ``numpy.exp`` for ``lny``; ``None`` models and reports ``Y`` itself.
+    mcrep : int
+        Monte Carlo replicates.
+    weights : ndarray, optional
+        Household expansion factors, sorted.
+    sample : ndarray, optional
+        Sorted positions of the survey households; all by default.
+    alphas : sequence of int
+        FGT parameters.
+    """
+
+    def __init__(
+        self,
+        X,
+        index,
+        povline,
+        transform=np.exp,
+        mcrep=50,
+        weights=None,
+        sample=None,
+        alphas=ALPHAS,
+    ):
+        self.X = np.asarray(X, dtype=np.float64)
+        self.index = index
+        self.povline = povline
+        self.transform = transform
+        self.mcrep = mcrep
+        self.weights = weights
+        self.alphas = tuple(alphas)
+        self.sample = sample
+        if sample is None:
+            self.X_s, self.w_s, self.index_s = self.X, weights, index
+        else:
+            self.X_s = self.X[sample]
+            self.w_s = None if weights is None else weights[sample]
+            self.index_s = AreaIndex.from_area(index.expand(index.labels)[sample])
+        self.stats = h3_stats(np.zeros(self.X_s.shape[0]), self.X_s, self.index_s, self.w_s)
+
+    def fit(self, y):
+        """Fit the model to one population and return its :class:`EBSpec`."""
+        y_s = y if self.sample is None else y[self.sample]
+        fit = fit_h3(self.stats.with_y(y_s, self.X_s, self.index_s, self.w_s))
+        _, eta, var_eta = eb_effects(
+            y_s - self.X_s @ fit.beta, self.index_s, fit.sigma_eta2, fit.sigma_e2,
+            areas=self.index,
+        )
+        transform = self.transform if self.transform is not None else _identity
+        return EBSpec(self.X @ fit.beta, eta, var_eta, fit.sigma_e2, self.povline, transform)
+
+    def __call__(self, y, rng):
+        spec = self.fit(y)
+        out = censuseb(
+            spec.xb, self.index, spec.eta, spec.var_eta, spec.sigma_e2, spec.povline,
+            mcrep=self.mcrep, weights=self.weights, transform=spec.transform,
+            alphas=self.alphas, seed=rng, with_mean=True,
+        )
+        return self._finish(out)
+
+    def _finish(self, out):
+        del out["area"]
+        if self.transform is None:
+            out["Y"] = out.pop("mean")
+        return out
+
+
+class CensusEBBatch:
+    """Several :class:`CensusEBEstimator` run off one set of draws.
+
+    Replaces the four ``sae sim h3`` calls per iteration of the off-census
+    experiment (CensusEB and unit-context, with and without ``lny``). Every
+    model is fitted first, then :func:`~sae.censuseb.censuseb_many` makes a
+    single pass over the census with one block of random numbers shared by
+    all of them. The estimators are compared under common random numbers,
+    which reduces the Monte Carlo variance of their differences.
+
+    The estimators must share the simulation's index, ``mcrep``, weights and
+    ``alphas``. Pass the batch to :meth:`ModelSimulation.run` as one of the
+    estimators; its results are reported under each member's own name.
+
+    Parameters
+    ----------
+    estimators : mapping of str to CensusEBEstimator
+        Estimators to run, keyed by method name.
+    """
+
+    def __init__(self, estimators):
+        self.estimators = dict(estimators)
+        first = next(iter(self.estimators.values()))
+        for est in self.estimators.values():
+            same_weights = (est.weights is None) == (first.weights is None) and (
+                est.weights is None or np.array_equal(est.weights, first.weights)
+            )
+            if (est.mcrep, est.alphas) != (first.mcrep, first.alphas) or not same_weights:
+                raise ValueError("estimators in a batch must share mcrep, weights and alphas")
+        self.index = first.index
+        self.mcrep = first.mcrep
+        self.weights = first.weights
+        self.alphas = first.alphas
+
+    def __call__(self, y, rng):
+        specs = {name: est.fit(y) for name, est in self.estimators.items()}
+        out = censuseb_many(
+            specs, self.index, mcrep=self.mcrep, weights=self.weights,
+            alphas=self.alphas, seed=rng, with_mean=True,
+        )
+        return {name: est._finish(out[name]) for name, est in self.estimators.items()}
+
+
+def _identity(y):
+    return y
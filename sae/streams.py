@@ -0,0 +1,138 @@
+"""Counter-based random number streams.
+
+The book's simulations stage seeds with ``local seedstage `c(rngstate)'``
+and ``sort hhid`` "to ensure replicability": every draw depends on all the
+draws made before it and on the order of the data. :class:`RandomStreams`
+instead makes every random number a pure function of its coordinates
+
+.. math::
+
+    (\\text{seed}, \\text{experiment}, \\text{iteration}, \\text{replicate},
+    \\text{stream}, \\text{position})
+
+using the Philox counter-based generator. The leading coordinates are
+hashed by :class:`numpy.random.SeedSequence` into a 128-bit Philox key, and
+the position is the Philox counter, so any slice of any stream (say, the
+household errors of one area in one replicate) is computed directly,
+without generating what comes before it. Uniforms take exactly one 64-bit
+draw each and normals are obtained from pairs of uniforms by Box-Muller, so
+the value at a position does not depend on how a stream is split into
+calls, on the order in which workers run, or on where a resumed job starts.
+
+In a simulation the iteration coordinate numbers the populations and the
+replicate coordinate numbers the Monte Carlo replicates of the estimators
+within an iteration: the population itself is drawn from replicate ``0`` of
+streams :data:`AREA`, :data:`PSU` and :data:`HOUSEHOLD`, and CensusEB
+replicate :math:`r` reads replicate :math:`r` of streams :data:`MC_AREA`,
+:data:`MC_PSU` and :data:`MC_HOUSEHOLD` through :func:`replicate_normals`.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+# Stream identifiers used by the simulation engine.
+AREA, PSU, HOUSEHOLD, ESTIMATOR, MC_AREA, MC_PSU, MC_HOUSEHOLD = range(7)
+
+
+class RandomStreams:
+    """Keyed, position-addressable random numbers.
+
+    Parameters
+    ----------
+    seed : int, optional
+        Root seed; fresh entropy if omitted (see :attr:`seed`).
+    experiment : int
+        Experiment number, the first coordinate of every key.
+
+    Examples
+    --------
+    The errors of households 100 to 149 in replicate 3 of iteration 7 are
+    the same whether drawn alone or as part of the whole census::
+
+        streams = RandomStreams(20230512)
+        full = streams.normal((7, 3, HOUSEHOLD), 0, N)
+        part = streams.normal((7, 3, HOUSEHOLD), 100, 50)
+        assert (full[100:150] == part).all()
+    """
+
+    def __init__(self, seed=None, experiment=0):
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.experiment = int(experiment)
+
+    def __repr__(self):
+        return "RandomStreams(%d, experiment=%d)" % (self.seed, self.experiment)
+
+    def seed_sequence(self, key):
+        """:class:`numpy.random.SeedSequence` of a key tuple."""
+        return np.random.SeedSequence(self.seed, spawn_key=(self.experiment,) + tuple(key))
+
+    def generator(self, key):
+        """Ordinary :class:`numpy.random.Generator` seeded by a key tuple.
+
+        For consumers that need a generator (e.g. estimators); its draws
+        are reproducible but not position-addressable.
+        """
+        return np.random.Generator(np.random.Philox(self.seed_sequence(key)))
+
+    def raw(self, key, start, size):
+        """64-bit draws ``start, ..., start + size - 1`` of a stream."""
+        philox_key = self.seed_sequence(key).generate_state(2, np.uint64)
+        block, skip = divmod(int(start), 4)
+        bitgen = np.random.Philox(key=philox_key, counter=[block, 0, 0, 0])
+        return bitgen.random_raw(skip + int(size))[skip:]
+
+    def uniform(self, key, start, size):
+        """Uniforms on :math:`[0, 1)` at positions ``start:start + size``."""
+        return (self.raw(key, start, size) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+    def normal(self, key, start, size):
+        """Standard normals at positions ``start:start + size``.
+
+        Positions :math:`2k` and :math:`2k + 1` are the Box-Muller pair of
+        uniforms :math:`2k` and :math:`2k + 1`.
+        """
+        start, size = int(start), int(size)
+        lo = start - start % 2
+        hi = start + size + (start + size) % 2
+        u = self.uniform(key, lo, hi - lo)
+        radius = np.sqrt(-2.0 * np.log1p(-u[0::2]))
+        angle = 2.0 * np.pi * u[1::2]
+        out = np.empty(hi - lo)
+        out[0::2] = radius * np.cos(angle)
+        out[1::2] = radius * np.sin(angle)
+        return out[start - lo : start - lo + size]
+
+
+class IterationGenerator(np.random.Generator):
+    """Generator handed to the estimators of one simulation iteration.
+
+    It is the ordinary generator of stream ``(iteration, 0, ESTIMATOR)``,
+    and it also carries ``streams`` and ``iteration``, so that the Monte
+    Carlo replicates that CensusEB draws from it through
+    :func:`replicate_normals` are keyed by replicate number. Estimators of
+    the same iteration therefore share their Monte Carlo draws.
+    """
+
+    def __init__(self, streams, iteration):
+        self.streams = streams
+        self.iteration = int(iteration)
+        key = (self.iteration, 0, ESTIMATOR)
+        super().__init__(np.random.Philox(streams.seed_sequence(key)))
+
+
+def replicate_normals(rng, stream, n, start, size):
+    """Standard normals of Monte Carlo replicates ``start:start + size``.
+
+    Returns an ``(n, size)`` array. For an :class:`IterationGenerator`,
+    column :math:`j` holds positions ``0:n`` of stream ``(iteration, start
+    + j, stream)``, so replicate :math:`r` is the same however the
+    replicates are batched and can be regenerated alone. Any other
+    generator draws ``rng.standard_normal((n, size))``.
+    """
+    if not isinstance(rng, IterationGenerator):
+        return rng.standard_normal((n, size))
+    out = np.empty((n, size))
+    for j in range(size):
+        out[:, j] = rng.streams.normal((rng.iteration, start + j, stream), 0, n)
+    return out
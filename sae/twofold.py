@@ -0,0 +1,365 @@
+"""Two-fold nested-error model: REML fit and CensusEB predictors.
+
+Model of Marhuenda et al. (2017) for household :math:`h` in PSU :math:`p`
+of area :math:`c`,
+
+.. math::
+
+    y_{cph} = x_{cph}'\\beta + \\eta_c + \\eta_{cp} + e_{cph}, \\quad
+    \\eta_c \\sim N(0, \\sigma^2_\\eta), \\quad
+    \\eta_{cp} \\sim N(0, \\sigma^2_{\\eta p}), \\quad
+    e_{cph} \\sim N(0, \\sigma^2_e).
+
+Within an area the covariance is :math:`\\sigma^2_e (I + \\lambda_p ZZ' +
+\\lambda_c 11')` with :math:`Z` the PSU indicators and :math:`\\lambda =
+\\sigma^2 / \\sigma^2_e`. Applying Sherman-Morrison at the PSU and then at
+the area level, every term of the restricted likelihood depends on the data
+only through :math:`X'X`, :math:`X'y`, :math:`y'y` and the PSU sums of
+:math:`x` and :math:`y`, gathered once by :func:`twofold_stats`. The
+likelihood is then profiled in :math:`\\sigma^2_e` and maximized over the
+two variance ratios at :math:`O(Pp^2)` per evaluation for :math:`P` PSUs.
+
+Conditional on the sample the area effect is normal, and given the area
+effect the PSU effects of the area are independent normals, so CensusEB
+replicates draw :math:`\\eta_c^{(m)}` for every area and then
+:math:`\\eta_{cp}^{(m)} \\mid \\eta_c^{(m)}` for every PSU, at their own
+level. Both are added at the PSU level and broadcast to households through
+the offsets of a :class:`~sae.index.NestedIndex`; unlike ``replace eta_a =
+eta_a[_n-1]`` nothing runs row by row.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .censuseb import MAX_ELEMENTS
+from .fgt import ALPHAS, FGTAccumulator
+from .index import nested_index
+from .nested_error import _minimize
+from .streams import MC_AREA, MC_HOUSEHOLD, MC_PSU, replicate_normals
+
+
+class TwoFoldStats(NamedTuple):
+    """Sufficient statistics of the two-fold nested-error model."""
+
+    n: np.ndarray  # households by PSU, (P,)
+    psu_area: np.ndarray  # area position of every PSU, (P,)
+    xsum: np.ndarray  # PSU sums of x, (P, p)
+    ysum: np.ndarray  # PSU sums of y, (P,)
+    XtX: np.ndarray  # (p, p)
+    Xty: np.ndarray  # (p,)
+    yty: float
+    labels: np.ndarray  # area labels, (D,)
+
+    def subset(self, cols):
+        """Statistics for a subset of the columns of ``X``."""
+        cols = np.asarray(cols)
+        return self._replace(
+            xsum=self.xsum[:, cols],
+            XtX=self.XtX[np.ix_(cols, cols)],
+            Xty=self.Xty[cols],
+        )
+
+
+class TwoFoldFit(NamedTuple):
+    """Estimates of the two-fold nested-error model."""
+
+    beta: np.ndarray
+    sigma_eta2: float
+    sigma_psu2: float
+    sigma_e2: float
+    vcov: np.ndarray
+    loglik: float
+
+
+class TwoFoldEffects(NamedTuple):
+    """Conditional distribution of the area and PSU effects.
+
+    :math:`\\eta_c \\sim N(\\hat\\eta_c, V(\\eta_c))` and
+    :math:`\\eta_{cp} \\mid \\eta_c \\sim N(\\gamma_{cp}(\\bar u_{cp} - \\eta_c),
+    V(\\eta_{cp}))`. Non-sampled areas and PSUs have zero means and
+    :math:`\\gamma_{cp}`, and the unconditional variances.
+    """
+
+    eta: np.ndarray  # (D,)
+    var_eta: np.ndarray  # (D,)
+    gamma_psu: np.ndarray  # (P,)
+    ubar_psu: np.ndarray  # mean residual, (P,)
+    var_psu: np.ndarray  # (P,)
+
+
+def twofold_stats(y, X, area, psu=None):
+    """Gather the sufficient statistics of the model in one pass.
+
+    Parameters
+    ----------
+    y : ndarray
+        Dependent variable, length ``N``.
+    X : ndarray
+        Design matrix ``(N, p)``, including the constant.
+    area : ndarray or NestedIndex
+        Area identifier, or the nested index of the households.
+    psu : ndarray, optional
+        PSU identifier, unique within area; not needed if ``area`` is a
+        :class:`~sae.index.NestedIndex`.
+
+    Returns
+    -------
+    TwoFoldStats
+    """
+    y = np.asarray(y, dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    index = nested_index(area, psu)
+    return TwoFoldStats(
+        n=index.psu.counts.astype(np.float64),
+        psu_area=index.psu_area,
+        xsum=index.psu.sum(index.sort(X)),
+        ysum=index.psu.sum(index.sort(y)),
+        XtX=X.T @ X,
+        Xty=X.T @ y,
+        yty=float(y @ y),
+        labels=index.area.labels,
+    )
+
+
+def _profile(stats, lam_eta, lam_psu):
+    """GLS quantities for given variance ratios :math:`\\lambda_c, \\lambda_p`.
+
+    Returns the minus twice restricted log-likelihood (up to a constant),
+    the GLS coefficients, :math:`\\hat\\sigma^2_e` and :math:`X'H^{-1}X`.
+    """
+    n = stats.n
+    D = stats.labels.size
+    # PSU level: (I + lam_psu Z Z')^-1 = I - sum_p g_p 1_p 1_p'
+    g = lam_psu / (1.0 + lam_psu * n)
+    a = 1.0 / (1.0 + lam_psu * n)
+    A = stats.XtX - stats.xsum.T @ (stats.xsum * g[:, None])
+    b = stats.Xty - (stats.xsum * g[:, None]).T @ stats.ysum
+    c = stats.yty - (g * stats.ysum) @ stats.ysum
+    # Area level: rank-one update with 1'(I + lam_psu Z Z')^-1
+    tx = np.zeros((D, A.shape[0]))
+    np.add.at(tx, stats.psu_area, stats.xsum * a[:, None])
+    ty = np.bincount(stats.psu_area, a * stats.ysum, minlength=D)
+    s = np.bincount(stats.psu_area, a * n, minlength=D)
+    h = lam_eta / (1.0 + lam_eta * s)
+    A -= tx.T @ (tx * h[:, None])
+    b -= (tx * h[:, None]).T @ ty
+    c -= (h * ty) @ ty
+
+    L = np.linalg.cholesky(A)
+    z = np.linalg.solve(L, b)
+    beta = np.linalg.solve(L.T, z)
+    dof = n.sum() - A.shape[0]
+    sigma_e2 = (c - z @ z) / dof
+    logdet_V = np.log1p(lam_psu * n).sum() + np.log1p(lam_eta * s).sum()
+    logdet_A = 2.0 * np.log(np.diag(L)).sum()
+    m2ll = dof * np.log(sigma_e2) + logdet_V + logdet_A
+    return m2ll, beta, sigma_e2, A
+
+
+def _ratio(t):
+    return t / (1.0 - t)
+
+
+def fit_twofold(stats, cols=None, tol=1e-8):
+    """REML fit of the two-fold nested-error model from sufficient statistics.
+
+    The variance ratios are mapped to :math:`t = \\lambda / (1 + \\lambda) \\in
+    [0, 1)` and the profile likelihood is maximized by nested golden-section
+    searches, which include the boundaries :math:`\\sigma^2_\\eta = 0` and
+    :math:`\\sigma^2_{\\eta p} = 0`.
+
+    Parameters
+    ----------
+    stats : TwoFoldStats
+        Output of :func:`twofold_stats`.
+    cols : array_like, optional
+        Columns of ``X`` to include; all by default.
+    tol : float
+        Tolerance of the searches over :math:`t`.
+
+    Returns
+    -------
+    TwoFoldFit
+    """
+    if cols is not None:
+        stats = stats.subset(cols)
+    hi = 1.0 - 1e-8
+
+    def inner(t_eta):
+        lam_eta = _ratio(t_eta)
+
+        def m2ll(t_psu):
+            return _profile(stats, lam_eta, _ratio(t_psu))[0]
+
+        t_psu = _minimize(m2ll, 0.0, hi, tol=tol)
+        return m2ll(t_psu), t_psu
+
+    t_eta = _minimize(lambda t: inner(t)[0], 0.0, hi, tol=tol)
+    t_psu = inner(t_eta)[1]
+    lam_eta, lam_psu = _ratio(t_eta), _ratio(t_psu)
+    m2ll, beta, sigma_e2, A = _profile(stats, lam_eta, lam_psu)
+    dof = stats.n.sum() - A.shape[0]
+    loglik = -0.5 * (m2ll + dof * (1.0 + np.log(2.0 * np.pi)))
+    return TwoFoldFit(
+        beta=beta,
+        sigma_eta2=sigma_e2 * lam_eta,
+        sigma_psu2=sigma_e2 * lam_psu,
+        sigma_e2=sigma_e2,
+        vcov=sigma_e2 * np.linalg.inv(A),
+        loglik=loglik,
+    )
+
+
+def reml_twofold(y, X, area, psu=None):
+    """REML fit, ``mixed y X || area: || psu:, reml``."""
+    return fit_twofold(twofold_stats(y, X, area, psu))
+
+
+def twofold_effects(residual, area, psu, sigma_eta2, sigma_psu2, sigma_e2, census=None):
+    """Conditional distribution of the area and PSU effects given the sample.
+
+    With :math:`w_{cp} = 1 / (\\sigma^2_{\\eta p} + \\sigma^2_e / n_{cp})` and
+    :math:`\\bar u_{cp}` the PSU mean residual,
+
+    .. math::
+
+        V(\\eta_c) = \\frac{\\sigma^2_\\eta}{1 + \\sigma^2_\\eta \\sum_p w_{cp}},
+        \\quad \\hat\\eta_c = V(\\eta_c) \\sum_p w_{cp} \\bar u_{cp},
+
+    and :math:`\\eta_{cp} \\mid \\eta_c` has mean :math:`\\gamma_{cp}(\\bar
+    u_{cp} - \\eta_c)` and variance :math:`\\sigma^2_{\\eta p}(1 -
+    \\gamma_{cp})`, :math:`\\gamma_{cp} = \\sigma^2_{\\eta p} w_{cp}`.
+
+    Parameters
+    ----------
+    residual : ndarray
+        Sample residuals :math:`y - x'\\hat\\beta`.
+    area, psu : ndarray
+        Area and PSU identifiers of the sampled households; ``area`` may be
+        a :class:`~sae.index.NestedIndex` and ``psu`` None.
+    sigma_eta2, sigma_psu2, sigma_e2 : float
+        Estimated variance components.
+    census : NestedIndex, optional
+        Index of the census. If given, the output is aligned to its areas
+        and PSUs, and non-sampled ones get their unconditional distribution.
+
+    Returns
+    -------
+    TwoFoldEffects
+    """
+    index = nested_index(area, psu)
+    n = index.psu.counts
+    ubar = index.psu.mean(index.sort(residual))
+    w = 1.0 / (sigma_psu2 + sigma_e2 / n)
+    D = len(index.area)
+    wsum = np.bincount(index.psu_area, w, minlength=D)
+    var_eta = sigma_eta2 / (1.0 + sigma_eta2 * wsum)
+    eta = var_eta * np.bincount(index.psu_area, w * ubar, minlength=D)
+    gamma = sigma_psu2 * w
+    effects = TwoFoldEffects(eta, var_eta, gamma, ubar, sigma_psu2 * (1.0 - gamma))
+    if census is None:
+        return effects
+
+    D, P = len(census.area), len(census.psu)
+    out = TwoFoldEffects(
+        eta=np.zeros(D),
+        var_eta=np.full(D, float(sigma_eta2)),
+        gamma_psu=np.zeros(P),
+        ubar_psu=np.zeros(P),
+        var_psu=np.full(P, float(sigma_psu2)),
+    )
+    area_pos = census.area.lookup(index.area.labels)
+    found = area_pos >= 0
+    out.eta[area_pos[found]] = eta[found]
+    out.var_eta[area_pos[found]] = var_eta[found]
+
+    # PSUs are matched on (census area position, PSU label code).
+    codes = np.unique(np.r_[census.psu.labels, index.psu.labels], return_inverse=True)[1]
+    K = codes.max() + 1
+    census_key = census.psu_area * K + codes[:P]
+    sample_area = area_pos[index.psu_area]
+    sample_key = sample_area * K + codes[P:]
+    pos = np.minimum(np.searchsorted(census_key, sample_key), P - 1)
+    found = (sample_area >= 0) & (census_key[pos] == sample_key)
+    pos = pos[found]
+    out.gamma_psu[pos] = gamma[found]
+    out.ubar_psu[pos] = ubar[found]
+    out.var_psu[pos] = effects.var_psu[found]
+    return out
+
+
+def censuseb_twofold(
+    xb,
+    index,
+    effects,
+    sigma_e2,
+    povline,
+    mcrep=100,
+    weights=None,
+    transform=np.exp,
+    alphas=ALPHAS,
+    seed=None,
+    batch=None,
+    max_elements=MAX_ELEMENTS,
+    with_mean=False,
+):
+    """CensusEB area FGT estimates under the two-fold model.
+
+    Each replicate draws :math:`\\eta_c^{(m)}` for every area, then
+    :math:`\\eta_{cp}^{(m)} \\mid \\eta_c^{(m)}` for every PSU, and a household
+    error for every census household. Replicates are generated in blocks
+    and reduced by an :class:`~sae.fgt.FGTAccumulator` as in
+    :func:`~sae.censuseb.censuseb`.
+
+    Parameters
+    ----------
+    xb : ndarray
+        Census linear fit :math:`x'\\hat\\beta`, in the original census order.
+    index : NestedIndex
+        Area and PSU index of the census.
+    effects : TwoFoldEffects
+        Output of :func:`twofold_effects` aligned to ``index``.
+    sigma_e2 : float
+        Variance of the household error.
+    povline, mcrep, weights, transform, alphas, seed, batch, max_elements, with_mean
+        As in :func:`~sae.censuseb.censuseb`.
+
+    Returns
+    -------
+    dict
+        ``"area"`` and ``"fgt<a>"`` (and ``"mean"``) by area.
+    """
+    rng = np.random.default_rng(seed)
+    xb = np.asarray(index.sort(xb), dtype=np.float64)
+    if weights is not None:
+        weights = np.asarray(index.sort(weights), dtype=np.float64)
+    if np.ndim(povline) > 0:
+        povline = np.asarray(index.sort(povline), dtype=np.float64)
+    if batch is None:
+        batch = max_elements // max(xb.size, 1)
+    batch = int(max(1, min(mcrep, batch)))
+
+    sd_eta = np.sqrt(effects.var_eta)[:, None]
+    sd_psu = np.sqrt(effects.var_psu)[:, None]
+    gamma = effects.gamma_psu[:, None]
+    ubar = effects.ubar_psu[:, None]
+    sd_e = np.sqrt(sigma_e2)
+    D, P = len(index.area), len(index.psu)
+
+    acc = FGTAccumulator(index.area.starts, povline, weights, alphas, with_mean)
+    done = 0
+    while done < mcrep:
+        m = min(batch, mcrep - done)
+        eta = effects.eta[:, None] + sd_eta * replicate_normals(rng, MC_AREA, D, done, m)
+        eta = eta[index.psu_area]
+        eta += gamma * (ubar - eta) + sd_psu * replicate_normals(rng, MC_PSU, P, done, m)
+        y = replicate_normals(rng, MC_HOUSEHOLD, xb.size, done, m)
+        y *= sd_e
+        y += xb[:, None]
+        y += index.psu.expand(eta)
+        acc.update(transform(y))
+        done += m
+    return acc.result(index.area.labels)
@@ -0,0 +1,216 @@
+"""Design-based validation by repeated sampling from a census.
+
+Python counterpart of the design-based experiment of the off-census chapter
+(following Corral et al., 2021), where 500 LSMS-style samples are drawn from
+a census of 3.9 million households, every method is fitted to each sample,
+and the estimates are compared with the census values.
+
+:class:`TwoStageSampler` draws stratified two-stage samples (PSUs within
+strata, then households within PSUs) as sorted row positions into a
+:class:`~sae.census.CensusStore`; no household record is copied to draw a
+sample, and estimators read only the sampled rows of the memory-mapped
+columns they need. :func:`true_values` computes the census area indicators
+once and caches them next to the store. :func:`design_validation` fans the
+samples out over a process pool, whose workers return partial
+:class:`~sae.accumulators.BiasMSEAccumulator` objects that are merged.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from ._pool import run_replicates, spawn
+from .accumulators import BiasMSEAccumulator
+from .fgt import ALPHAS, PovertyLines, grouped_fgt
+from .index import nested_index
+
+
+class TwoStageSample(NamedTuple):
+    """One sample drawn by :class:`TwoStageSampler`."""
+
+    rows: np.ndarray  # census positions of the sampled households, sorted
+    weights: np.ndarray  # design weights
+    psu: np.ndarray  # PSU position of every sampled household
+
+
+class TwoStageSampler:
+    """Stratified two-stage sampling by row position.
+
+    In each stratum ``n_psu`` PSUs are selected by simple random sampling
+    without replacement, and ``n_hh`` households (all, if fewer) are then
+    selected without replacement in every selected PSU. The design weight
+    of a household is the product of the inverse selection probabilities of
+    both stages.
+
+    Parameters
+    ----------
+    strata : ndarray
+        Stratum of every census household, in census order (e.g.
+        ``store["stratum"]``).
+    psu : ndarray
+        PSU of every census household, unique within stratum.
+    n_psu : int or ndarray
+        PSUs selected per stratum, scalar or one value per sorted stratum
+        label. Strata with fewer PSUs have all of them selected.
+    n_hh : int
+        Households selected per PSU.
+    """
+
+    def __init__(self, strata, psu, n_psu, n_hh):
+        self.index = nested_index(strata, psu)
+        n_strata = len(self.index.area)
+        psu_per_stratum = np.bincount(self.index.psu_area, minlength=n_strata)
+        self.n_psu = np.minimum(np.broadcast_to(n_psu, n_strata), psu_per_stratum)
+        self.n_hh = int(n_hh)
+        self.first_psu = np.r_[0, np.cumsum(psu_per_stratum)[:-1]]
+        self.psu_weight = psu_per_stratum / np.maximum(self.n_psu, 1)
+
+    def draw(self, rng):
+        """Draw one sample; see :class:`TwoStageSample`."""
+        index = self.index
+        stratum = index.psu_area
+
+        # First stage: rank PSUs by a random key within their stratum.
+        order = np.lexsort((rng.random(stratum.size), stratum))
+        rank = np.arange(order.size) - self.first_psu[stratum[order]]
+        chosen = np.sort(order[rank < self.n_psu[stratum[order]]])
+
+        # Second stage: the same within each chosen PSU.
+        counts = index.psu.counts[chosen]
+        take = np.minimum(counts, self.n_hh)
+        seg = np.repeat(np.arange(chosen.size), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        order = np.lexsort((rng.random(seg.size), seg))
+        keep = order[(np.arange(seg.size) - first) < take[seg]]
+        seg = seg[keep]
+        sorted_rows = index.psu.starts[chosen][seg] + (keep - first[keep])
+
+        weights = self.psu_weight[stratum[chosen]][seg] * (counts / take)[seg]
+        rows = sorted_rows
+        if not index.area.is_sorted:
+            rows = index.area.order[rows]
+        order = np.argsort(rows)
+        return TwoStageSample(rows[order], weights[order], chosen[seg][order])
+
+
+def true_values(store, welfare, povline, weights=None, alphas=ALPHAS):
+    """Census area indicators, cached in the store directory.
+
+    Parameters
+    ----------
+    store : CensusStore
+        Census holding the welfare variable.
+    welfare : str
+        Name of the welfare variable, on the scale of the poverty line.
+    povline : float or PovertyLines
+        Poverty line, or a grid of lines.
+    weights : str, optional
+        Name of the household expansion factor (e.g. ``"hhsize"``).
+    alphas : sequence of int
+        FGT parameters.
+
+    Returns
+    -------
+    dict
+        ``"area"``, ``"fgt<a>"`` and ``"mean"`` by area. The result is
+        written to ``_truth_<welfare>.npz`` in the store and read back on
+        later calls with the same arguments, as long as the number of
+        households and the size and modification time of the welfare and
+        weight files are unchanged.
+    """
+    alphas = tuple(alphas)
+    line = povline if isinstance(povline, PovertyLines) else float(povline)
+    files = [welfare] if weights is None else [welfare, weights]
+    key = np.array([repr((welfare, line, weights, alphas, _fingerprint(store, files)))])
+    path = os.path.join(store.path, "_truth_%s.npz" % welfare)
+    if os.path.exists(path):
+        with np.load(path) as f:
+            if str(f["key"][0]) == key[0]:
+                return {name: f[name] for name in f.files if name != "key"}
+
+    y = np.asarray(store[welfare], dtype=np.float64)
+    w = None if weights is None else np.asarray(store[weights], dtype=np.float64)
+    index = store.index
+    stats = grouped_fgt(y, povline, index.starts, w, alphas)
+    out = {"area": np.asarray(index.labels)}
+    for k, a in enumerate(alphas):
+        out["fgt%d" % a] = stats[k]
+    out["mean"] = index.mean(y, w)
+    np.savez(path, key=key, **out)
+    return out
+
+
+def _fingerprint(store, names):
+    """Number of households, and size and mtime of the variables ``names``."""
+    files = []
+    for name in names:
+        st = os.stat(store[name].filename)
+        files.append((name, st.st_size, st.st_mtime_ns))
+    return (store.n, files)
+
+
+def _run_chunk(s, seeds):
+    """Bias and MSE accumulated over the samples of one chunk of seeds."""
+    acc = BiasMSEAccumulator()
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        sample = s["sampler"].draw(rng)
+        for name, estimator in s["estimators"].items():
+            for key, est in estimator(s["store"], sample, rng).items():
+                acc.update(name, key, est, s["truth"][key])
+    return acc
+
+
+def design_validation(
+    store,
+    sampler,
+    estimators,
+    truth,
+    n_samples=500,
+    seed=None,
+    workers=None,
+    accumulator=None,
+):
+    """Empirical design bias and MSE of several estimators.
+
+    Parameters
+    ----------
+    store : CensusStore
+        Census to sample from; passed to the workers by path.
+    sampler : TwoStageSampler
+        Sampling design, built on the census order of ``store``.
+    estimators : mapping of str to callable
+        ``estimator(store, sample, rng)`` receives the census and a
+        :class:`TwoStageSample`, reads the sampled rows (e.g.
+        ``store["x1"][sample.rows]``) and returns a dict of estimates for
+        every census area keyed like ``truth`` (``"fgt0"``, ..., ``"mean"``).
+        Model selection, such as lasso, belongs inside the estimator, so it
+        is repeated on every sample. Estimators must be picklable when
+        ``workers > 1``.
+    truth : dict
+        True values by area, e.g. from :func:`true_values`.
+    n_samples : int
+        Number of samples.
+    seed : int or numpy.random.SeedSequence, optional
+        Root seed; sample :math:`s` always uses the same child stream.
+    workers : int, optional
+        Number of worker processes. Defaults to ``os.cpu_count()``; ``1``
+        runs in the current process.
+    accumulator : BiasMSEAccumulator, optional
+        Accumulator to update in place, e.g. one holding earlier samples.
+
+    Returns
+    -------
+    dict
+        ``"area"`` and ``"<method>_bias_<indicator>"``,
+        ``"<method>_mse_<indicator>"`` and their Monte Carlo standard errors,
+        as returned by :meth:`BiasMSEAccumulator.result`.
+    """
+    state = {"store": store, "sampler": sampler, "estimators": dict(estimators), "truth": truth}
+    acc = BiasMSEAccumulator() if accumulator is None else accumulator
+    for part in run_replicates(_run_chunk, state, spawn(seed, n_samples), workers):
+        acc.merge(part)
+    return acc.result(store.labels)
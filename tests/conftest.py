@@ -0,0 +1,79 @@
+"""Synthetic data shared by the test modules.
+
+Every fixture returns a factory taking a ``seed`` (and a few sizes), so a
+test can build several independent data sets.
+"""
+
+import numpy as np
+import pytest
+
+from sae import ModelSimulation
+
+
+@pytest.fixture
+def census_areas():
+    """Census sorted by area: ``rng, area, xb`` with log-welfare means ``xb``."""
+
+    def make(seed=0, areas=5, per_area=30):
+        rng = np.random.default_rng(seed)
+        area = np.repeat(np.arange(areas), per_area)
+        return rng, area, 1.0 + 0.3 * rng.normal(size=area.size)
+
+    return make
+
+
+@pytest.fixture
+def unit_sample():
+    """Unit-level sample of a nested-error model: ``rng, y, X, area``.
+
+    ``X`` holds the constant and ``len(coef) - 1`` standard normal
+    covariates; area effects have standard deviation ``sigma_eta`` and
+    household errors are standard normal.
+    """
+
+    def make(seed=0, n=600, areas=25, coef=(1.0, 0.5, -0.3), sigma_eta=0.5):
+        rng = np.random.default_rng(seed)
+        area = rng.integers(0, areas, n)
+        X = np.column_stack([np.ones(n), rng.normal(size=(n, len(coef) - 1))])
+        y = X @ np.asarray(coef) + rng.normal(0.0, sigma_eta, areas)[area] + rng.normal(size=n)
+        return rng, y, X, area
+
+    return make
+
+
+@pytest.fixture
+def simulation(census_areas):
+    """Two-fold model simulation with two PSUs per area: ``sim, area, xb``.
+
+    ``labels`` renames the areas ``0, 1, ...``, e.g. to make them unsorted.
+    """
+
+    def make(seed=0, areas=5, per_area=20, labels=None):
+        _, area, xb = census_areas(seed, areas, per_area)
+        if labels is not None:
+            area = np.asarray(labels)[area]
+        psu = np.tile(np.repeat([0, 1], per_area // 2), areas)
+        sim = ModelSimulation(xb, area, 0.05, 0.3, psu=psu, sigma_psu2=0.02)
+        return sim, area, xb
+
+    return make
+
+
+@pytest.fixture
+def survey_sample():
+    """Stratified cluster sample: ``rng, strata, psu, domain, w``.
+
+    PSU labels are reused across strata, as in most survey files.
+    """
+
+    def make(seed=0, n=400, strata=6, psus=5, domains=15):
+        rng = np.random.default_rng(seed)
+        return (
+            rng,
+            rng.integers(0, strata, n),
+            rng.integers(0, psus, n),
+            rng.integers(0, domains, n),
+            rng.uniform(1, 4, n),
+        )
+
+    return make
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from sae import BiasMSEAccumulator
+
+
+@pytest.fixture
+def errors():
+    """``n`` replicates of estimates of four areas and their true values."""
+
+    def make(seed=0, n=30):
+        rng = np.random.default_rng(seed)
+        truth = rng.normal(size=(n, 4))
+        return rng.normal(0.1, 0.5, (n, 4)) + truth, truth
+
+    return make
+
+
+def test_matches_numpy_moments(errors):
+    est, truth = errors()
+    acc = BiasMSEAccumulator()
+    for e, t in zip(est, truth):
+        acc.update("m", "fgt0", e, t)
+    d = est - truth
+    np.testing.assert_allclose(acc.bias("m", "fgt0"), d.mean(0))
+    np.testing.assert_allclose(acc.mse("m", "fgt0"), (d * d).mean(0))
+    np.testing.assert_allclose(acc.se_bias("m", "fgt0"), d.std(0, ddof=1) / np.sqrt(30))
+    np.testing.assert_allclose(acc.se_mse("m", "fgt0"), (d * d).std(0, ddof=1) / np.sqrt(30))
+    out = acc.result(np.arange(4))
+    assert sorted(out) == [
+        "area", "m_bias_fgt0", "m_bias_fgt0_se", "m_mse_fgt0", "m_mse_fgt0_se"
+    ]
+
+
+def test_merge_equals_sequential_updates(errors):
+    est, truth = errors(1)
+    full, a, b = BiasMSEAccumulator(), BiasMSEAccumulator(), BiasMSEAccumulator()
+    for i, (e, t) in enumerate(zip(est, truth)):
+        full.update("m", "mean", e, t)
+        (a if i < 11 else b).update("m", "mean", e, t)
+    b.update("other", "mean", est[0], truth[0])
+    a.merge(b)
+    assert a.n == {("m", "mean"): 30, ("other", "mean"): 1}
+    np.testing.assert_allclose(a.moments["m", "mean"], full.moments["m", "mean"])
+
+
+def test_save_and_load(errors, tmp_path):
+    est, truth = errors(2)
+    acc = BiasMSEAccumulator()
+    acc.update("m", "fgt0", est[:, :2], truth[:, :2])
+    acc.update("m", "mean", est[0], truth[0])
+    acc.save(tmp_path / "acc.npz")
+    back = BiasMSEAccumulator.load(tmp_path / "acc.npz")
+    assert back.keys() == acc.keys() and back.n == acc.n
+    for key in acc.keys():
+        np.testing.assert_array_equal(back.moments[key], acc.moments[key])
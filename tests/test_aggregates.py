@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from sae import GroupColumn, census_aggregates, import_census
+
+
+@pytest.fixture
+def census():
+    """Census columns of ``n`` households in three states."""
+
+    def make(seed=0, n=500):
+        rng = np.random.default_rng(seed)
+        return {
+            "state": rng.integers(0, 3, n),
+            "psu": rng.integers(0, 4, n),  # unique within state only
+            "x": rng.normal(size=n),
+            "kind": rng.choice(["a", "b", "c"], n),
+            "hhsize": rng.integers(1, 7, n).astype(float),
+        }
+
+    return make
+
+
+@pytest.mark.parametrize("weights", [None, "hhsize"])
+def test_matches_groupby(census, weights):
+    data = census()
+    agg = census_aggregates(data, ["state", "psu"], ["x"], ["kind"], weights=weights)
+    w = np.ones(500) if weights is None else data["hhsize"]
+    keys = agg.keys["psu"]
+    assert keys["state"].size == 12
+    for g, (s, p) in enumerate(zip(keys["state"], keys["psu"])):
+        rows = (data["state"] == s) & (data["psu"] == p)
+        assert agg.count("psu")[g] == rows.sum()
+        mean = np.average(data["x"][rows], weights=w[rows])
+        assert agg.mean("psu", "x")[g] == pytest.approx(mean)
+        for k, cat in enumerate(agg.categories["kind"]):
+            share = np.average(data["kind"][rows] == cat, weights=w[rows])
+            assert agg.share("psu", "kind")[g, k] == pytest.approx(share)
+    for g, s in enumerate(agg.keys["state"]["state"]):
+        rows = data["state"] == s
+        assert agg.total_weight("state")[g] == pytest.approx(w[rows].sum())
+        mean = np.average(data["x"][rows], weights=w[rows])
+        assert agg.mean("state", ["x"])[g, 0] == pytest.approx(mean)
+
+
+def test_household_columns(census):
+    data = census(1)
+    agg = census_aggregates(data, ["state", "psu"], ["x"], ["kind"])
+    cols = agg.columns("psu")
+    assert sorted(cols) == ["meanpsu_kind_a", "meanpsu_kind_b", "meanpsu_kind_c", "meanpsu_x"]
+    col = cols["meanpsu_x"]
+    assert isinstance(col, GroupColumn) and len(col) == 500
+    full = np.asarray(col)
+    for i in (0, 17, 499):
+        rows = (data["state"] == data["state"][i]) & (data["psu"] == data["psu"][i])
+        assert full[i] == pytest.approx(data["x"][rows].mean())
+    np.testing.assert_array_equal(col[[3, 9]], full[[3, 9]])
+    state = np.asarray(agg.columns("state", prefix="s_")["s_x"])
+    assert state[0] == pytest.approx(data["x"][data["state"] == data["state"][0]].mean())
+
+
+def test_store_input(census, tmp_path):
+    data = census(2)
+    columns = {k: v for k, v in data.items() if k != "kind"}
+    store = import_census(tmp_path / "c", data["state"], columns)
+    from_store = census_aggregates(store, ["state", "psu"], ["x"])
+    sorted_data = {k: np.asarray(store[k]) for k in ("state", "psu", "x")}
+    from_dict = census_aggregates(sorted_data, ["state", "psu"], ["x"])
+    np.testing.assert_allclose(from_store.mean("psu", "x"), from_dict.mean("psu", "x"))
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from sae import HistGradientBoosting, area_means, bin_features, boosting_mse
+
+
+@pytest.fixture
+def step_data():
+    """Features ``X`` and a response with a step in the first feature."""
+
+    def make(seed=0, n=300):
+        rng = np.random.default_rng(seed)
+        X = rng.normal(size=(n, 4))
+        y = np.where(X[:, 0] > 0.3, 1.0, 0.0) + 0.5 * X[:, 1] + rng.normal(0.0, 0.1, n)
+        return rng, X, y
+
+    return make
+
+
+def test_bins():
+    X = np.column_stack([np.repeat([3.0, 1.0, 2.0], 4), np.arange(12.0)])
+    binned = bin_features(X, max_bins=4)
+    np.testing.assert_array_equal(binned.edges[0], [1.5, 2.5])
+    np.testing.assert_array_equal(binned.codes[:, 0], np.repeat([2, 0, 1], 4))
+    assert binned.codes.dtype == np.uint8
+    assert binned.codes[:, 1].max() == 3
+    np.testing.assert_array_equal(np.bincount(binned.codes[:, 1]), [3, 3, 3, 3])
+    np.testing.assert_array_equal(binned.bin([[0.0, 100.0]]), [[0, 3]])
+    with pytest.raises(ValueError):
+        bin_features(X, max_bins=257)
+
+
+def test_stump_matches_best_split(step_data):
+    _, X, y = step_data()
+    features = bin_features(X, max_bins=16)
+    model = HistGradientBoosting(
+        learning_rate=1.0, max_iter=1, max_depth=1, min_samples_leaf=5, early_stopping=False
+    ).fit(features, y)
+
+    best = (np.inf, None)
+    codes = features.codes
+    for j in range(codes.shape[1]):
+        for b in range(codes[:, j].max()):
+            left = codes[:, j] <= b
+            if min(left.sum(), (~left).sum()) < 5:
+                continue
+            pred = np.where(left, y[left].mean(), y[~left].mean())
+            sse = ((y - pred) ** 2).sum()
+            if sse < best[0]:
+                best = (sse, pred)
+    np.testing.assert_allclose(model.predict(features), best[1])
+
+
+def test_threads_and_rows(step_data):
+    rng, X, y = step_data(1)
+    features = bin_features(X)
+    rows = np.sort(rng.choice(y.size, 200, replace=False))
+    w = rng.uniform(1, 2, 200)
+    kwargs = dict(max_iter=20, seed=0)
+    one = HistGradientBoosting(n_threads=1, **kwargs).fit(features, y[rows], w, rows)
+    many = HistGradientBoosting(n_threads=3, **kwargs).fit(features, y[rows], w, rows)
+    np.testing.assert_allclose(one.predict(features), many.predict(features))
+    np.testing.assert_allclose(one.predict(features, rows[:5]), one.predict(features)[rows[:5]])
+
+
+def test_early_stopping_keeps_best_iteration(step_data):
+    _, X, y = step_data(2, n=500)
+    model = HistGradientBoosting(max_iter=300, n_iter_no_change=5, seed=1).fit(bin_features(X), y)
+    best = int(np.argmin(model.validation_loss_))
+    assert model.n_iter_ == best + 1 < 300
+    assert len(model.validation_loss_) <= model.n_iter_ + 5
+
+
+def test_boosting_mse(step_data):
+    rng, X, y = step_data(3, n=200)
+    features = bin_features(X)
+    area = np.repeat(np.arange(20), 10)
+    size = rng.integers(50, 100, 200)
+    rows = np.sort(rng.choice(200, 80, replace=False))
+    model = HistGradientBoosting(max_iter=10, n_threads=1, seed=0)
+    model.fit(features, y[rows], rows=rows)
+    labels, means = area_means(model.predict(features), area, size)
+    np.testing.assert_allclose(
+        means[3], np.average(model.predict(features)[30:40], weights=size[30:40])
+    )
+    kwargs = dict(size=size, bsrep=4, seed=5)
+    one = boosting_mse(model, features, rows, y[rows], area, workers=1, **kwargs)
+    two = boosting_mse(model, features, rows, y[rows], area, workers=2, **kwargs)
+    np.testing.assert_array_equal(one["area"], labels)
+    np.testing.assert_allclose(two["mse"], one["mse"])
+    assert np.all(one["mse"] > 0.0)
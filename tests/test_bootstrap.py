@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from sae import bootstrap_mse, import_census
+
+
+@pytest.fixture
+def problem(census_areas):
+    """Census covariates ``x`` and ``X = [1, x]``, and the rows of a sample."""
+    rng, area, x = census_areas(areas=4, per_area=25)
+    X = np.column_stack([np.ones(area.size), x])
+    return area, x, X, np.sort(rng.choice(area.size, 40, replace=False))
+
+
+def _mse(X, area, X_s, area_s, **kwargs):
+    kwargs = dict(dict(bsrep=3, mcrep=4, seed=2, workers=1), **kwargs)
+    return bootstrap_mse(X, area, X_s, area_s, np.array([1.0, 0.4]), 0.05, 0.2, 2.7, **kwargs)
+
+
+def test_workers_do_not_change_results(problem):
+    area, _, X, s = problem
+    one = _mse(X, area, X[s], area[s])
+    two = _mse(X, area, X[s], area[s], workers=2)
+    for key in ("mse_fgt0", "mse_fgt1", "mse_fgt2"):
+        np.testing.assert_allclose(one[key], two[key], rtol=1e-12)
+        assert np.all(one[key] >= 0.0)
+
+
+def test_census_design_matches_array(problem, tmp_path):
+    area, x, X, s = problem
+    store = import_census(tmp_path / "census", area, {"x": x})
+    from_store = _mse(store.design(["x"]), store.index, X[s], area[s])
+    from_array = _mse(X, area, X[s], area[s])
+    np.testing.assert_allclose(from_store["mse_fgt0"], from_array["mse_fgt0"])
+
+
+def test_rejects_sampled_area_missing_from_census(problem):
+    area, _, X, s = problem
+    area_s = area[s].copy()
+    area_s[0] = 9
+    with pytest.raises(ValueError, match="not in the census"):
+        _mse(X, area, X[s], area_s)
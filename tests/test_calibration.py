@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from sae import calibrate, direct_estimates, greg_estimates
+
+
+@pytest.fixture
+def sample():
+    """Calibration inputs ``rng, X, d, domain`` with four domains."""
+
+    def make(seed=0, n=300):
+        rng = np.random.default_rng(seed)
+        X = np.column_stack([np.ones(n), rng.uniform(0, 2, n), rng.integers(0, 2, n)])
+        d = rng.uniform(5, 15, n)
+        domain = rng.integers(0, 4, n)
+        return rng, X, d, domain
+
+    return make
+
+
+def test_linear_calibration_is_greg_weights(sample):
+    _, X, d, _ = sample()
+    totals = X.T @ d * np.array([1.05, 0.97, 1.1])
+    fit = calibrate(X, d, totals)
+    assert fit.converged.all()
+    lam = np.linalg.solve((X * d[:, None]).T @ X, totals - X.T @ d)
+    np.testing.assert_allclose(fit.weights, d * (1.0 + X @ lam))
+    np.testing.assert_allclose(fit.weights @ X, totals)
+
+
+@pytest.mark.parametrize("method, bounds", [("raking", None), ("truncated", (0.8, 1.3))])
+def test_nonlinear_calibration_hits_totals(sample, method, bounds):
+    _, X, d, _ = sample(1)
+    totals = X.T @ d * np.array([1.05, 0.97, 1.1])
+    fit = calibrate(X, d, totals, method=method, bounds=bounds)
+    assert fit.converged.all()
+    np.testing.assert_allclose(fit.weights @ X, totals, rtol=1e-9)
+    if method == "raking":
+        np.testing.assert_allclose(fit.g, np.exp(X @ fit.lam[0]))
+    else:
+        # Both bounds bind, and no ratio leaves them.
+        assert fit.g.min() == 0.8 and fit.g.max() == 1.3
+
+
+def test_domains_are_calibrated_separately(sample):
+    _, X, d, domain = sample(2)
+    totals = np.array([X[domain == k].T @ d[domain == k] * 1.1 for k in range(4)])
+    fit = calibrate(X, d, totals, domain=domain, method="raking")
+    for k in range(4):
+        rows = domain == k
+        alone = calibrate(X[rows], d[rows], totals[k], method="raking")
+        np.testing.assert_allclose(fit.weights[rows], alone.weights)
+
+
+def test_infeasible_bounds_are_flagged(sample):
+    _, X, d, _ = sample(3)
+    totals = 2.0 * X.T @ d
+    fit = calibrate(X, d, totals, method="truncated", bounds=(0.9, 1.1), max_iter=20)
+    assert not fit.converged.all()
+    with pytest.raises(ValueError):
+        calibrate(X, d, X.T @ d, method="truncated")
+
+
+def test_greg_estimates(sample):
+    rng, X, d, domain = sample(4)
+    strata, psu = rng.integers(0, 3, d.size), rng.integers(0, 6, d.size)
+    y = X @ [1.0, 2.0, -0.5] + rng.normal(size=d.size)
+    X_mean = rng.uniform(0.5, 1.5, (4, 3))
+    X_mean[:, 0] = 1.0
+    N = np.array([900.0, 1100.0, 1000.0, 800.0])
+    out = greg_estimates(y, X, domain, d, X_mean, N, strata, psu)
+    beta = np.linalg.solve((X * d[:, None]).T @ X, (X * d[:, None]).T @ y)
+    e = y - X @ beta
+    for k in range(4):
+        rows = domain == k
+        total = N[k] * X_mean[k] @ beta + d[rows] @ e[rows]
+        assert out["total"][k] == pytest.approx(total)
+        assert out["mean"][k] == pytest.approx(total / N[k])
+    lin = direct_estimates(e, domain, d, strata, psu)
+    np.testing.assert_allclose(out["total_var"], lin["total_var"])
+    np.testing.assert_allclose(out["mean_var"], lin["total_var"] / N**2)
@@ -0,0 +1,80 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from sae import CensusStore, import_census
+
+
+@pytest.fixture
+def census(tmp_path):
+    rng = np.random.default_rng(0)
+    area = rng.integers(0, 5, 50)
+    uniqid = rng.permutation(50)
+    x = rng.normal(size=(50, 2))
+    store = import_census(
+        tmp_path / "census", area, {"x1": x[:, 0], "x2": x[:, 1].astype(np.float32)}, uniqid
+    )
+    return store, area, uniqid, x
+
+
+def test_round_trip_sorted_by_area_and_id(census):
+    store, area, uniqid, x = census
+    order = np.lexsort((uniqid, area))
+    assert len(store) == 50 and "x1" in store and "y" not in store
+    np.testing.assert_array_equal(store.area, area[order])
+    np.testing.assert_array_equal(store["_uniqid"], uniqid[order])
+    np.testing.assert_array_equal(store["x1"], x[order, 0])
+    assert store["x2"].dtype == np.float32
+    np.testing.assert_array_equal(store.labels, np.unique(area))
+    np.testing.assert_array_equal(store.index.counts, np.bincount(area))
+    with pytest.raises(KeyError):
+        store["y"]
+
+
+def test_design_matmul_in_chunks(census):
+    store, area, uniqid, x = census
+    design = store.design(["x1", "x2"])
+    design.chunk = 7
+    beta = np.array([0.5, 2.0, -1.0])
+    dense = np.asarray(design)
+    assert dense.shape == design.shape == (50, 3)
+    np.testing.assert_allclose(design @ beta, dense @ beta)
+    no_constant = store.design(["x2"], constant=False)
+    np.testing.assert_allclose(no_constant @ np.array([3.0]), 3.0 * store["x2"])
+
+
+@pytest.mark.parametrize("beta", [[1.0, 2.0], [1.0, 2.0, 3.0, 4.0], [[1.0, 2.0, 3.0]]])
+def test_design_rejects_wrong_coefficients(census, beta):
+    with pytest.raises(ValueError):
+        census[0].design(["x1", "x2"]) @ np.array(beta)
+
+
+def test_pickles_by_path(census):
+    store = census[0]
+    assert len(pickle.dumps(store)) < 1000
+    design = pickle.loads(pickle.dumps(store.design(["x1"])))
+    assert isinstance(design.store, CensusStore)
+    np.testing.assert_allclose(design @ np.array([0.0, 1.0]), store["x1"])
+
+
+def test_rejects_variables_of_wrong_length(tmp_path):
+    with pytest.raises(ValueError):
+        import_census(tmp_path / "c", np.arange(3), {"x": np.arange(4)})
+
+
+def test_reimport_requires_overwrite(census, tmp_path):
+    path = tmp_path / "census"
+    with pytest.raises(FileExistsError):
+        import_census(path, np.zeros(3), {"y": np.ones(3)})
+    store = import_census(path, np.zeros(3), {"y": np.ones(3)}, overwrite=True)
+    # Variables of the old census are gone, not read back with the new one.
+    assert store.variables == ["y"] and sorted(os.listdir(path)) == [
+        "_area.npy", "_labels.npy", "_offsets.npy", "meta.json", "y.npy"
+    ]
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "notes.txt").write_text("keep")
+    with pytest.raises(FileExistsError):
+        import_census(tmp_path / "other", np.zeros(3), {"y": np.ones(3)}, overwrite=True)
+    assert (tmp_path / "other" / "notes.txt").exists()
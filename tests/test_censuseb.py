@@ -0,0 +1,60 @@
+import numpy as np
+from scipy.stats import norm
+
+from sae import censuseb, eb_effects, grouped_fgt
+from sae.index import AreaIndex
+
+
+def test_eb_effects_matches_per_area_formula():
+    rng = np.random.default_rng(1)
+    area = rng.integers(0, 6, 80)
+    resid = rng.normal(size=80)
+    labels, eta, var_eta = eb_effects(resid, area, 0.2, 0.5)
+    for d, label in enumerate(labels):
+        u = resid[area == label]
+        gamma = 0.2 / (0.2 + 0.5 / u.size)
+        assert np.isclose(eta[d], gamma * u.mean())
+        assert np.isclose(var_eta[d], 0.2 * (1.0 - gamma))
+
+
+def test_eb_effects_aligns_to_census_areas():
+    area = np.array([1, 1, 3])
+    resid = np.array([0.5, 0.1, -0.2])
+    labels, eta, var_eta = eb_effects(resid, area, 0.2, 0.5, areas=[0, 1, 2, 3])
+    np.testing.assert_array_equal(labels, [0, 1, 2, 3])
+    assert eta[0] == eta[2] == 0.0
+    assert var_eta[0] == var_eta[2] == 0.2
+    assert eta[1] > 0 and eta[3] < 0
+
+
+def test_without_noise_equals_fgt_of_fitted_welfare(census_areas):
+    _, area, xb = census_areas()
+    eta = np.linspace(-0.2, 0.2, 5)
+    index = AreaIndex.from_area(area)
+    out = censuseb(xb, area, eta, np.zeros(5), 0.0, 3.0, mcrep=3, seed=0)
+    truth = grouped_fgt(np.exp(xb + index.expand(eta)), 3.0, index.starts)
+    for k, a in enumerate((0, 1, 2)):
+        np.testing.assert_allclose(out["fgt%d" % a], truth[k])
+
+
+def test_headcount_converges_to_normal_probability(census_areas):
+    _, area, xb = census_areas()
+    eta = np.linspace(-0.2, 0.2, 5)
+    var_eta = np.full(5, 0.01)
+    out = censuseb(xb, area, eta, var_eta, 0.09, 3.0, mcrep=4000, seed=1, batch=500)
+    index = AreaIndex.from_area(area)
+    p = norm.cdf((np.log(3.0) - xb - index.expand(eta)) / np.sqrt(0.1))
+    np.testing.assert_allclose(out["fgt0"], index.mean(p), atol=0.01)
+
+
+def test_unsorted_census_gives_same_estimates(census_areas):
+    rng, area, xb = census_areas()
+    # Interleave the areas, keeping households in order within each area.
+    perm = np.argsort(np.tile(np.arange(30), 5), kind="stable")
+    weights = rng.uniform(1, 5, area.size)
+    args = (np.zeros(5), np.full(5, 0.02), 0.09, 3.0)
+    kwargs = dict(mcrep=20, seed=4, batch=7, with_mean=True)
+    base = censuseb(xb, area, *args, weights=weights, **kwargs)
+    shuffled = censuseb(xb[perm], area[perm], *args, weights=weights[perm], **kwargs)
+    for key in base:
+        np.testing.assert_allclose(shuffled[key], base[key])
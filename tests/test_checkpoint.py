@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from sae import BiasMSEAccumulator, PovertyLines, RandomStreams
+
+
+@pytest.fixture
+def sim(simulation):
+    return simulation(areas=6, per_area=40)[0]
+
+
+def _noisy_truth(sim, povline):
+    def estimator(y, rng):
+        return sim.truth(y + rng.normal(0.0, 0.2, y.size), povline)
+
+    return estimator
+
+
+def _run(sim, povline, seed, n_sim, **kwargs):
+    return sim.run({"noisy": _noisy_truth(sim, povline)}, n_sim, povline, seed=seed, **kwargs)
+
+
+def _interrupt(sim, povline, seed, path, stop):
+    """Run until iteration ``stop`` and crash, leaving the last checkpoint."""
+
+    def estimator(y, rng, count=[0]):
+        if count[0] == stop:
+            raise KeyboardInterrupt
+        count[0] += 1
+        return _noisy_truth(sim, povline)(y, rng)
+
+    with pytest.raises(KeyboardInterrupt):
+        sim.run({"noisy": estimator}, 6, povline, seed=seed, checkpoint=path, every=2)
+
+
+@pytest.mark.parametrize("seed", [11, RandomStreams(11)])
+@pytest.mark.parametrize("povline", [2.5, PovertyLines([2.0, 3.0, 4.0])])
+def test_resume_is_bit_identical(sim, tmp_path, seed, povline):
+    full = _run(sim, povline, seed, 6)
+    path = tmp_path / "run.npz"
+    _interrupt(sim, povline, seed, path, stop=3)
+    resumed = _run(sim, povline, seed, 6, checkpoint=path, every=2)
+    assert resumed.keys() == full.keys()
+    for key in full:
+        np.testing.assert_array_equal(resumed[key], full[key])
+
+
+def test_grid_state_round_trip():
+    acc = BiasMSEAccumulator()
+    acc.update("m", "fgt0", np.ones((3, 2)), np.zeros((3, 2)))
+    acc.update("m", "mean", np.ones(3), np.zeros(3))
+    back = BiasMSEAccumulator.from_state(acc.state())
+    assert back.n == acc.n
+    for key in acc.keys():
+        np.testing.assert_array_equal(back.moments[key], acc.moments[key])
+
+
+def test_resume_replaces_passed_accumulator(sim, tmp_path):
+    path = tmp_path / "run.npz"
+    acc = BiasMSEAccumulator()
+    estimator = _noisy_truth(sim, 2.5)
+    state = {"calls": 0}
+
+    def crashing(y, rng):
+        if state["calls"] == 3:
+            raise KeyboardInterrupt
+        state["calls"] += 1
+        return estimator(y, rng)
+
+    with pytest.raises(KeyboardInterrupt):
+        sim.run({"noisy": crashing}, 4, 2.5, seed=5, accumulator=acc, checkpoint=path, every=2)
+    sim.run({"noisy": estimator}, 4, 2.5, seed=5, accumulator=acc, checkpoint=path, every=2)
+    assert set(acc.n.values()) == {4}
+
+
+@pytest.mark.parametrize(
+    "n_sim, seed, povline",
+    [
+        (5, 11, 2.5),
+        (4, 12, 2.5),
+        (4, RandomStreams(11), 2.5),
+        (4, 11, 3.0),
+        (4, 11, PovertyLines([2.5, 3.0])),
+    ],
+)
+def test_resume_rejects_other_run(sim, tmp_path, n_sim, seed, povline):
+    path = tmp_path / "run.npz"
+    _run(sim, 2.5, 11, 4, checkpoint=path, every=2)
+    with pytest.raises(ValueError):
+        _run(sim, povline, seed, n_sim, checkpoint=path, every=2)
+
+
+def test_resume_rejects_other_estimators(sim, tmp_path):
+    path = tmp_path / "run.npz"
+    estimators = {"noisy": _noisy_truth(sim, 2.5)}
+    sim.run(estimators, 4, 2.5, seed=11, checkpoint=path, every=2)
+    with pytest.raises(ValueError, match="estimators"):
+        sim.run(dict(estimators, other=estimators["noisy"]), 4, 2.5, seed=11, checkpoint=path)
+    with pytest.raises(ValueError, match="estimators"):
+        sim.run({"renamed": estimators["noisy"]}, 4, 2.5, seed=11, checkpoint=path)
+    sim.run(estimators, 4, 2.5, seed=11, checkpoint=path)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from sae import direct_estimates
+
+
+@pytest.fixture
+def sample(survey_sample):
+    """Survey sample whose last stratum has a single PSU."""
+
+    def make(seed=0):
+        rng, strata, psu, domain, w = survey_sample(seed)
+        psu[strata == 5] = 0
+        return rng, strata, psu, domain, w
+
+    return make
+
+
+def _brute_force_var(z, strata, psu, fpc):
+    """Linearized variance of the total of the scores ``z``, stratum by stratum."""
+    var = 0.0
+    for h in np.unique(strata):
+        in_h = strata == h
+        totals = np.array([z[in_h & (psu == p)].sum() for p in np.unique(psu[in_h])])
+        n_h = totals.size
+        if n_h > 1:
+            f = 0.0 if fpc is None else fpc[in_h][0]
+            var += (1.0 - f) * n_h / (n_h - 1) * ((totals - totals.mean()) ** 2).sum()
+    return var
+
+
+@pytest.mark.parametrize("with_fpc", [False, True])
+def test_matches_per_domain_loop(with_fpc, sample):
+    rng, strata, psu, domain, w = sample()
+    y = rng.normal(size=(domain.size, 2))
+    fpc = (0.05 * strata + 0.01) if with_fpc else None
+    out = direct_estimates(y, domain, w, strata, psu, fpc)
+    np.testing.assert_array_equal(out["domain"], np.unique(domain))
+    for k, d in enumerate(out["domain"]):
+        rows = domain == d
+        assert out["n"][k] == rows.sum()
+        assert out["N_hat"][k] == pytest.approx(w[rows].sum())
+        for j in range(2):
+            total = (w * y[:, j])[rows].sum()
+            mean = total / w[rows].sum()
+            assert out["total"][k, j] == pytest.approx(total)
+            assert out["mean"][k, j] == pytest.approx(mean)
+            z_total = np.where(rows, w * y[:, j], 0.0)
+            z_mean = np.where(rows, w * (y[:, j] - mean) / w[rows].sum(), 0.0)
+            total_var = _brute_force_var(z_total, strata, psu, fpc)
+            assert out["total_var"][k, j] == pytest.approx(total_var)
+            mean_var = _brute_force_var(z_mean, strata, psu, fpc)
+            assert out["mean_var"][k, j] == pytest.approx(mean_var)
+
+
+def test_defaults_and_known_sizes(sample):
+    rng, _, _, domain, w = sample(1)
+    y = rng.normal(size=domain.size)
+    out = direct_estimates(y, domain, w, N=np.full(15, 1000.0))
+    for k, d in enumerate(out["domain"]):
+        rows = domain == d
+        # Every household is its own PSU in a single stratum.
+        z = np.where(rows, w * y, 0.0)
+        total_var = z.size / (z.size - 1) * ((z - z.mean()) ** 2).sum()
+        assert out["total_var"][k] == pytest.approx(total_var)
+    np.testing.assert_allclose(out["ht_mean"], out["total"] / 1000.0)
+    np.testing.assert_allclose(out["ht_mean_var"], out["total_var"] / 1e6)
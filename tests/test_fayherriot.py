@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from scipy import optimize
+
+from sae import fh_data, fh_eblup, fhsae, fit_fh, fit_fh_batch
+
+
+@pytest.fixture
+def inputs():
+    """Area-level inputs ``y, X, psi`` of ``M`` areas, two without a sample."""
+
+    def make(seed=0, M=60, sigma_u2=0.4):
+        rng = np.random.default_rng(seed)
+        X = np.column_stack([np.ones(M), rng.normal(size=(M, 3))])
+        psi = rng.uniform(0.1, 1.0, M)
+        y = X @ [1.0, 0.5, -0.3, 0.0] + rng.normal(0, np.sqrt(sigma_u2), M)
+        y += rng.normal(0, np.sqrt(psi))
+        y[[4, 17]] = np.nan  # areas without a sample
+        return y, X, psi
+
+    return make
+
+
+@pytest.fixture
+def areas(inputs):
+    """The inputs as :func:`sae.fh_data`."""
+
+    def make(seed=0, **kwargs):
+        return fh_data(*inputs(seed, **kwargs))
+
+    return make
+
+
+def _loglik(A, y, X, psi, reml):
+    """Dense (restricted) log-likelihood of the Fay-Herriot model."""
+    V = np.diag(A + psi)
+    Vinv = np.linalg.inv(V)
+    XtV = X.T @ Vinv
+    beta = np.linalg.solve(XtV @ X, XtV @ y)
+    r = y - X @ beta
+    ll = -0.5 * (y.size * np.log(2 * np.pi) + np.linalg.slogdet(V)[1] + r @ Vinv @ r)
+    if reml:
+        ll -= 0.5 * (np.linalg.slogdet(XtV @ X)[1] - X.shape[1] * np.log(2 * np.pi))
+    return ll
+
+
+@pytest.mark.parametrize("method", ["ml", "reml"])
+def test_likelihood_fits_match_scipy(areas, method):
+    data = areas()
+    fit = fit_fh(data, method=method)
+    assert fit.converged and fit.sigma_u2 > 0
+    reml = method == "reml"
+    opt = optimize.minimize_scalar(
+        lambda A: -_loglik(A, data.y, data.X, data.psi, reml),
+        bounds=(0.0, 5.0),
+        method="bounded",
+        options={"xatol": 1e-10},
+    )
+    assert fit.sigma_u2 == pytest.approx(opt.x, rel=1e-6)
+    assert fit.loglik == pytest.approx(_loglik(fit.sigma_u2, data.y, data.X, data.psi, reml))
+    W = np.diag(1.0 / (fit.sigma_u2 + data.psi))
+    vcov = np.linalg.inv(data.X.T @ W @ data.X)
+    np.testing.assert_allclose(fit.vcov, vcov)
+    np.testing.assert_allclose(fit.beta, vcov @ data.X.T @ W @ data.y)
+
+
+def test_moment_estimator_matches_brentq(areas):
+    data = areas(1)
+    D, p = data.X.shape
+
+    def moment(A):
+        W = np.diag(1.0 / (A + data.psi))
+        beta = np.linalg.solve(data.X.T @ W @ data.X, data.X.T @ W @ data.y)
+        r = data.y - data.X @ beta
+        return r @ W @ r - (D - p)
+
+    fit = fit_fh(data, method="fh")
+    root = optimize.brentq(moment, 0.0, 10.0, xtol=1e-12)
+    assert fit.sigma_u2 == pytest.approx(root, rel=1e-8)
+
+
+def test_boundary_estimate(areas):
+    data = areas(2, sigma_u2=0.0)
+    data = data._replace(y=data.X @ [1.0, 0.5, -0.3, 0.0])  # no residual variation at all
+    for method in ("fh", "ml", "reml"):
+        fit = fit_fh(data, method=method)
+        assert fit.sigma_u2 == 0.0 and fit.converged
+        np.testing.assert_array_equal(fit.gamma, 0.0)
+
+
+@pytest.mark.parametrize("method", ["fh", "ml", "reml"])
+def test_batch_matches_single_fits(areas, method):
+    data = areas(3)
+    subsets = [[0], [0, 1], [0, 2, 3], [0, 1, 2, 3], [3, 0]]
+    batch = fit_fh_batch(data, subsets, method=method)
+    for cols, fit in zip(subsets, batch):
+        sub = data._replace(X=data.X[:, cols], X_all=data.X_all[:, cols])
+        one = fit_fh(sub, method=method)
+        assert fit.sigma_u2 == pytest.approx(one.sigma_u2, rel=1e-9, abs=1e-12)
+        np.testing.assert_allclose(fit.beta, one.beta, rtol=1e-9)
+        np.testing.assert_allclose(fit.vcov, one.vcov, rtol=1e-9)
+        assert fit.loglik == pytest.approx(one.loglik)
+    with pytest.raises(ValueError):
+        fit_fh_batch(data, subsets, method="mom")
+
+
+def test_eblup(inputs):
+    y, X, psi = inputs(4)
+    data = fh_data(y, X, psi)
+    fit = fit_fh(data)
+    np.testing.assert_array_equal(fhsae(y, X, psi).beta, fit.beta)
+    out = fh_eblup(data, fit)
+    synthetic = data.X_all @ fit.beta
+    gamma = fit.sigma_u2 / (fit.sigma_u2 + data.psi)
+    np.testing.assert_allclose(out["synthetic"], synthetic)
+    eblup = gamma * data.y + (1 - gamma) * synthetic[data.observed]
+    np.testing.assert_allclose(out["eblup"][data.observed], eblup)
+    np.testing.assert_array_equal(out["eblup"][~data.observed], synthetic[~data.observed])
+    np.testing.assert_array_equal(out["gamma"][~data.observed], 0.0)
+    np.testing.assert_array_equal(out["area"], np.arange(60))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from sae import PovertyLines, fgt_contributions, grouped_fgt, grouped_fgt_lines
+
+
+def _brute_force(welfare, z, area, weights, alpha):
+    out = []
+    for d in np.unique(area):
+        e, w = welfare[area == d], weights[area == d]
+        out.append(np.sum(w * (e < z) * np.clip(1.0 - e / z, 0.0, None) ** alpha) / w.sum())
+    return np.array(out)
+
+
+def test_contributions_match_definition():
+    welfare = np.array([1.0, 2.0, 3.0, 4.0])
+    out = fgt_contributions(welfare, 3.0)
+    np.testing.assert_array_equal(out[0], [1, 1, 0, 0])
+    np.testing.assert_allclose(out[1], [2 / 3, 1 / 3, 0, 0])
+    np.testing.assert_allclose(out[2], [4 / 9, 1 / 9, 0, 0])
+
+
+@pytest.mark.parametrize("replicates", [False, True])
+def test_lines_match_brute_force(replicates):
+    rng = np.random.default_rng(0)
+    area = np.sort(rng.integers(0, 5, 200))
+    starts = np.flatnonzero(np.r_[True, area[1:] != area[:-1]])
+    weights = rng.uniform(1, 3, area.size)
+    welfare = np.round(np.exp(rng.normal(1.0, 0.6, (area.size, 3))), 1)
+    lines = np.array([3.0, 1.5, 2.7, 5.0])  # unsorted, and tied with welfare
+    if not replicates:
+        welfare = welfare[:, 0]
+    out = grouped_fgt_lines(welfare, lines, starts, weights)
+    cols = welfare.reshape(area.size, -1)
+    for k, a in enumerate((0, 1, 2)):
+        for j, z in enumerate(lines):
+            for m, col in enumerate(cols.T):
+                got = out[k, :, j, m] if replicates else out[k, :, j]
+                np.testing.assert_allclose(got, _brute_force(col, z, area, weights, a))
+
+
+def test_grouped_fgt_dispatches_poverty_lines():
+    rng = np.random.default_rng(1)
+    welfare = np.exp(rng.normal(size=(50, 2)))
+    starts = np.array([0, 20, 35])
+    grid = grouped_fgt(welfare, PovertyLines([0.5, 1.0]), starts)
+    for j, z in enumerate([0.5, 1.0]):
+        np.testing.assert_allclose(grid[:, :, j], grouped_fgt(welfare, z, starts))
+
+
+def test_rejects_fractional_alpha():
+    with pytest.raises(ValueError):
+        grouped_fgt_lines(np.ones(3), [1.0], [0], alphas=(0.5,))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from sae import FGTAccumulator, PovertyLines, grouped_fgt
+from sae.index import AreaIndex
+
+
+@pytest.fixture
+def welfare(census_areas):
+    """Area index and nine simulated welfare vectors of a census."""
+    rng, area, xb = census_areas(areas=4, per_area=15)
+    return rng, AreaIndex.from_area(area), np.exp(xb[:, None] + rng.normal(0.0, 0.5, (60, 9)))
+
+
+def test_batches_match_full_block(welfare):
+    rng, index, Y = welfare
+    weights = rng.uniform(1, 4, index.n)
+    acc = FGTAccumulator(index.starts, 3.0, weights, with_mean=True)
+    for lo, hi in [(0, 1), (1, 5), (5, 9)]:
+        acc.update(Y[:, lo:hi] if hi - lo > 1 else Y[:, lo])
+    stats = grouped_fgt(Y, 3.0, index.starts, weights)
+    assert acc.n == 9
+    np.testing.assert_allclose(acc.mean()[:3], stats.mean(axis=-1))
+    np.testing.assert_allclose(acc.var()[:3], stats.var(axis=-1, ddof=1))
+    means = index.mean(Y, weights)
+    np.testing.assert_allclose(acc.result()["mean"], means.mean(axis=-1))
+
+
+def test_result_keys_and_grid_shape(welfare):
+    _, index, Y = welfare
+    acc = FGTAccumulator(index.starts, PovertyLines([2.0, 3.0]), alphas=(0, 1), with_mean=True)
+    out = acc.update(Y).result(index.labels)
+    assert list(out) == ["area", "fgt0", "fgt1", "mean"]
+    assert out["fgt0"].shape == (4, 2)
+    assert out["mean"].shape == (4,)
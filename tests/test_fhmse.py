@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from sae import fh_bootstrap_mse, fh_data, fh_mse, fit_fh
+
+
+@pytest.fixture
+def areas():
+    """Fay-Herriot data of ``M`` areas, two without a sample."""
+
+    def make(seed=0, M=40):
+        rng = np.random.default_rng(seed)
+        X = np.column_stack([np.ones(M), rng.normal(size=(M, 2))])
+        psi = rng.uniform(0.2, 1.0, M)
+        y = X @ [1.0, 0.5, -0.3] + rng.normal(0, 0.7, M) + rng.normal(0, np.sqrt(psi))
+        y[[3, 11]] = np.nan  # areas without a sample
+        return fh_data(y, X, psi)
+
+    return make
+
+
+def _prasad_rao(data, fit):
+    """Second-order MSE of every observed area, one area at a time."""
+    A, psi, X = fit.sigma_u2, data.psi, data.X
+    V = A + psi
+    vcov = np.linalg.inv((X / V[:, None]).T @ X)
+    D = psi.size
+    if fit.method == "fh":
+        var_A = 2.0 * D / (1 / V).sum() ** 2
+        bias = 2.0 * (D * (1 / V**2).sum() - (1 / V).sum() ** 2) / (1 / V).sum() ** 3
+    else:
+        var_A = 2.0 / (1 / V**2).sum()
+        bias = 0.0
+        if fit.method == "ml":
+            bias = -np.trace(vcov @ (X / V[:, None] ** 2).T @ X) / (1 / V**2).sum()
+    mse = []
+    for d in range(D):
+        g1 = A * psi[d] / V[d]
+        g2 = (psi[d] / V[d]) ** 2 * X[d] @ vcov @ X[d]
+        g3 = psi[d] ** 2 / V[d] ** 3 * var_A
+        mse.append(g1 + g2 + 2 * g3 - psi[d] ** 2 / V[d] ** 2 * bias)
+    return np.array(mse)
+
+
+@pytest.mark.parametrize("method", ["fh", "ml", "reml"])
+def test_analytic_mse(areas, method):
+    data = areas()
+    fit = fit_fh(data, method=method)
+    out = fh_mse(data, fit)
+    np.testing.assert_allclose(out["mse"][data.observed], _prasad_rao(data, fit))
+    x = data.X_all[~data.observed]
+    synthetic = fit.sigma_u2 + np.einsum("dp,pq,dq->d", x, fit.vcov, x)
+    np.testing.assert_allclose(out["mse"][~data.observed], synthetic)
+
+    sub = fit_fh(data, [0, 2], method=method)
+    narrow = data._replace(X=data.X[:, [0, 2]], X_all=data.X_all[:, [0, 2]])
+    np.testing.assert_allclose(fh_mse(data, sub, [0, 2])["mse"], fh_mse(narrow, sub)["mse"])
+
+
+def test_bootstrap_is_reproducible(areas):
+    data = areas(1)
+    fit = fit_fh(data, method="fh")
+    one = fh_bootstrap_mse(data, fit, bsrep=60, seed=5, workers=1, batch=100)
+    # Neither the batch size nor the number of workers changes the draws.
+    np.testing.assert_allclose(
+        fh_bootstrap_mse(data, fit, bsrep=60, seed=5, workers=1, batch=7)["mse"], one["mse"]
+    )
+    two = fh_bootstrap_mse(data, fit, bsrep=60, seed=5, workers=2, batch=7)
+    np.testing.assert_allclose(two["mse"], one["mse"], rtol=1e-12)
+    np.testing.assert_array_equal(one["area"], data.labels)
+
+
+def test_bootstrap_agrees_with_analytic(areas):
+    data = areas(2)
+    fit = fit_fh(data)
+    boot = fh_bootstrap_mse(data, fit, bsrep=2000, seed=0, workers=1)["mse"]
+    analytic = fh_mse(data, fit)["mse"]
+    assert np.all(boot > 0)
+    assert np.median(np.abs(boot / analytic - 1.0)) < 0.1
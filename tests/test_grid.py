@@ -0,0 +1,40 @@
+import numpy as np
+
+from sae import PovertyLines, censuseb
+
+
+def test_percentile_lines():
+    rng = np.random.default_rng(0)
+    welfare = rng.permutation(np.arange(1.0, 101.0))
+    np.testing.assert_array_equal(PovertyLines.percentiles(welfare).values, np.arange(1.0, 100.0))
+    weights = np.where(welfare <= 50, 3.0, 1.0)  # 150 of 200 below 50
+    lines = PovertyLines.percentiles(welfare, weights, q=[25, 75, 90])
+    for z, q in zip(lines.values, [25, 75, 90]):
+        below = weights[welfare <= z].sum() / weights.sum()
+        assert below >= q / 100 > weights[welfare < z].sum() / weights.sum()
+
+
+def test_censuseb_grid_matches_single_lines(census_areas):
+    _, area, xb = census_areas(1, areas=4, per_area=25)
+    args = (area, np.zeros(4), np.full(4, 0.02), 0.2)
+    lines = [3.5, 2.0, 3.0]
+    grid = censuseb(xb, *args, PovertyLines(lines), mcrep=10, seed=2)
+    assert grid["fgt0"].shape == (4, 3)
+    for j, z in enumerate(lines):
+        one = censuseb(xb, *args, z, mcrep=10, seed=2)
+        for a in (0, 1, 2):
+            np.testing.assert_allclose(grid["fgt%d" % a][:, j], one["fgt%d" % a])
+
+
+def test_simulation_curves(simulation):
+    sim, _, _ = simulation(3)
+    lines = PovertyLines([2.0, 2.5, 3.0, 4.0])
+
+    def shifted(y, rng):
+        return sim.truth(y + 0.1, lines)
+
+    out = sim.run({"m": shifted}, 3, lines, seed=4)
+    assert out["m_bias_fgt0"].shape == (5, 4)
+    assert out["m_bias_mean"].shape == (5,)
+    # Welfare shifted up lowers every headcount.
+    assert np.all(out["m_bias_fgt0"] <= 0.0)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from sae import fit_h3, h3, h3_stats
+
+
+@pytest.fixture
+def weighted_sample(unit_sample):
+    """Nested-error sample with survey weights: ``rng, y, X, area, w``."""
+
+    def make(seed=0):
+        rng, y, X, area = unit_sample(seed, n=300, areas=12, sigma_eta=0.6)
+        return rng, y, X, area, rng.uniform(0.5, 3.0, 300)
+
+    return make
+
+
+def _dense_h3(y, X, area, w):
+    """Henderson III and GLS written with explicit N x N matrices."""
+    N = y.size
+    w = w * (N / w.sum())
+    W = np.diag(w)
+    Z = (area[:, None] == np.unique(area)[None, :]).astype(float)
+    S = Z.T @ w
+    # Within-area (weighted demeaning) regression.
+    Q = np.eye(N) - Z @ np.diag(1.0 / S) @ Z.T @ W
+    Xt, yt = Q @ X, Q @ y
+    rank = np.linalg.matrix_rank(Xt.T @ W @ Xt)
+    beta_w = np.linalg.pinv(Xt.T @ W @ Xt) @ Xt.T @ W @ yt
+    u = yt - Xt @ beta_w
+    sigma_e2 = u @ W @ u / (N - Z.shape[1] - rank)
+    # Moments of the weighted OLS residuals.
+    M = W - W @ X @ np.linalg.inv(X.T @ W @ X) @ X.T @ W
+    sigma_eta2 = max((y @ M @ y - sigma_e2 * np.trace(M)) / np.trace(M @ Z @ Z.T), 0.0)
+    # GLS.
+    gamma = sigma_eta2 / (sigma_eta2 + sigma_e2 * (Z.T @ w**2) / S**2)
+    Omega = W - W @ Z @ np.diag(gamma / S) @ Z.T @ W
+    G = X.T @ Omega @ X
+    return np.linalg.solve(G, X.T @ Omega @ y), sigma_eta2, sigma_e2, sigma_e2 * np.linalg.inv(G)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_matches_dense_computation(weighted, weighted_sample):
+    _, y, X, area, w = weighted_sample()
+    fit = h3(y, X, area, w if weighted else None)
+    beta, sigma_eta2, sigma_e2, vcov = _dense_h3(y, X, area, w if weighted else np.ones(y.size))
+    np.testing.assert_allclose(fit.beta, beta)
+    assert fit.sigma_eta2 == pytest.approx(sigma_eta2)
+    assert fit.sigma_e2 == pytest.approx(sigma_e2)
+    np.testing.assert_allclose(fit.vcov, vcov)
+
+
+def test_cached_refits(weighted_sample):
+    rng, y, X, area, w = weighted_sample(1)
+    stats = h3_stats(y, X, area, w)
+    np.testing.assert_allclose(fit_h3(stats, [0, 2]).beta, h3(y, X[:, [0, 2]], area, w).beta)
+    y2 = y + rng.normal(size=y.size)
+    np.testing.assert_allclose(
+        fit_h3(stats.with_y(y2, X, area, w)).beta, h3(y2, X, area, w).beta
+    )
@@ -0,0 +1,42 @@
+import numpy as np
+
+from sae import AreaIndex, nested_index
+
+
+def test_reductions_match_groupby():
+    rng = np.random.default_rng(0)
+    area = rng.choice([3, 7, 11, 20], 40)
+    x = rng.normal(size=(40, 2))
+    w = rng.uniform(1, 2, 40)
+    index = AreaIndex.from_area(area)
+    assert not index.is_sorted and index.n == 40
+    np.testing.assert_array_equal(index.labels, [3, 7, 11, 20])
+    xs, ws = index.sort(x), index.sort(w)
+    for d, label in enumerate(index.labels):
+        rows = area == label
+        np.testing.assert_allclose(index.sum(xs)[d], x[rows].sum(0))
+        mean = np.average(x[rows], axis=0, weights=w[rows])
+        np.testing.assert_allclose(index.mean(xs, ws)[d], mean)
+        np.testing.assert_allclose(index.mean(xs[:, 0])[d], x[rows, 0].mean())
+    np.testing.assert_array_equal(index.expand(index.labels), np.sort(area))
+
+
+def test_sorted_input_is_not_copied():
+    area = np.array([1, 1, 2, 5, 5, 5])
+    index = AreaIndex.from_area(area)
+    assert index.is_sorted
+    x = np.arange(6.0)
+    assert np.shares_memory(index.sort(x), x)
+    np.testing.assert_array_equal(index.starts, [0, 2, 3])
+    np.testing.assert_array_equal(index.lookup([5, 4, 1, 9]), [2, -1, 0, -1])
+
+
+def test_nested_index():
+    area = np.array([2, 1, 2, 1, 2, 1])
+    psu = np.array([0, 1, 1, 0, 0, 1])
+    index = nested_index(area, psu)
+    assert nested_index(index) is index
+    np.testing.assert_array_equal(index.sort(area), [1, 1, 1, 2, 2, 2])
+    np.testing.assert_array_equal(index.sort(psu), [0, 1, 1, 0, 0, 1])
+    np.testing.assert_array_equal(index.psu.counts, [1, 2, 2, 1])
+    np.testing.assert_array_equal(index.psu_area, [0, 0, 1, 1])
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import statsmodels.api as sm
+
+from sae import fit_reml, reml, sufficient_stats
+
+
+def test_matches_statsmodels_mixedlm(unit_sample):
+    _, y, X, area = unit_sample()
+    fit = reml(y, X, area)
+    ref = sm.MixedLM(y, X, groups=area).fit(reml=True, method="powell")
+    np.testing.assert_allclose(fit.beta, ref.fe_params, rtol=1e-5)
+    np.testing.assert_allclose(fit.sigma_e2, ref.scale, rtol=1e-5)
+    np.testing.assert_allclose(fit.sigma_eta2, ref.cov_re[0, 0], rtol=1e-4)
+    np.testing.assert_allclose(fit.loglik, ref.llf, rtol=1e-8)
+
+
+def test_vcov_is_dense_gls_covariance(unit_sample):
+    _, y, X, area = unit_sample()
+    fit = reml(y, X, area)
+    V = fit.sigma_e2 * np.eye(y.size) + fit.sigma_eta2 * (area[:, None] == area[None, :])
+    np.testing.assert_allclose(fit.vcov, np.linalg.inv(X.T @ np.linalg.solve(V, X)))
+
+
+def test_subset_refit_matches_fit_on_columns(unit_sample):
+    _, y, X, area = unit_sample(1)
+    stats = sufficient_stats(y, X, area)
+    sub = fit_reml(stats, [0, 2])
+    full = reml(y, X[:, [0, 2]], area)
+    np.testing.assert_allclose(sub.beta, full.beta)
+    assert sub.sigma_eta2 == pytest.approx(full.sigma_eta2)
+
+
+def test_no_area_effect_hits_boundary():
+    rng = np.random.default_rng(2)
+    area = np.repeat(np.arange(10), 30)
+    X = np.ones((300, 1))
+    y = np.tile(rng.normal(size=30), 10)  # identical areas
+    fit = reml(y, X, area)
+    assert fit.sigma_eta2 == 0.0
+    assert fit.sigma_e2 == pytest.approx(y.var(ddof=1))
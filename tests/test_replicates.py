@@ -0,0 +1,138 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from sae import ReplicateDesign, direct_estimates, replicate_estimates
+
+
+@pytest.fixture
+def sample(survey_sample):
+    """Survey sample with eight strata and ten domains."""
+
+    def make(seed=0, psus=4):
+        return survey_sample(seed, n=300, strata=8, psus=psus, domains=10)
+
+    return make
+
+
+def _jackknife_weights(strata, psu, w):
+    """Replicate weights of the delete-one-PSU jackknife, ``(n, R)``, and coefficients."""
+    cols, coef = [], []
+    for h in np.unique(strata):
+        labels = np.unique(psu[strata == h])
+        n_h = labels.size
+        if n_h < 2:
+            continue
+        for q in labels:
+            factor = np.where(strata == h, n_h / (n_h - 1.0), 1.0)
+            factor[(strata == h) & (psu == q)] = 0.0
+            cols.append(w * factor)
+            coef.append((n_h - 1.0) / n_h)
+    return np.column_stack(cols), np.array(coef)
+
+
+def _brute_force(weights, coef, y, domain, w, average=False):
+    """Replication variances of domain totals and means, one domain at a time.
+
+    Replicates without weight in a domain are left out of its mean variance,
+    which is rescaled to the replicates used when ``average``.
+    """
+    labels = np.unique(domain)
+    total_var, mean_var = [], []
+    for d in labels:
+        rows = domain == d
+        total, mean = (w * y)[rows].sum(), (w * y)[rows].sum() / w[rows].sum()
+        rep_total = weights[rows].T @ y[rows]
+        rep_N = weights[rows].sum(0)
+        used = rep_N > 0
+        rep_mean = rep_total[used] / rep_N[used]
+        scale = coef.size / used.sum() if average else 1.0
+        total_var.append(coef @ (rep_total - total) ** 2)
+        mean_var.append(scale * coef[used] @ (rep_mean - mean) ** 2)
+    return np.array(total_var), np.array(mean_var)
+
+
+def test_jackknife_matches_replicate_weights(sample):
+    rng, strata, psu, domain, w = sample()
+    psu[strata == 7] = 0  # a singleton stratum gets no replicate
+    y = rng.normal(size=strata.size)
+    design = ReplicateDesign.jackknife(strata, psu)
+    weights, coef = _jackknife_weights(strata, psu, w)
+    assert design.n_replicates == coef.size and design.factors is None
+    out = replicate_estimates(design, y, domain, w)
+    total_var, mean_var = _brute_force(weights, coef, y, domain, w)
+    np.testing.assert_allclose(out["total_var"], total_var)
+    np.testing.assert_allclose(out["mean_var"], mean_var)
+
+    labels, total, reps = design.replicate_totals(w * y, domain)
+    for k, d in enumerate(labels):
+        np.testing.assert_allclose(reps[k], weights[domain == d].T @ y[domain == d])
+    np.testing.assert_allclose(design.variance(total, reps), total_var)
+
+
+def test_jackknife_total_variance_is_linearized(sample):
+    rng, strata, psu, domain, w = sample(1)
+    y = rng.normal(size=(strata.size, 2))
+    rep = replicate_estimates(ReplicateDesign.jackknife(strata, psu), y, domain, w)
+    lin = direct_estimates(y, domain, w, strata, psu)
+    np.testing.assert_allclose(rep["total"], lin["total"])
+    np.testing.assert_allclose(rep["total_var"], lin["total_var"])
+    np.testing.assert_allclose(rep["mean"], lin["mean"])
+
+
+@pytest.mark.parametrize("method", ["brr", "bootstrap"])
+def test_dense_factors_match_replicate_weights(sample, method):
+    rng, strata, psu, domain, w = sample(2, psus=2)
+    y = rng.normal(size=strata.size)
+    if method == "brr":
+        design = ReplicateDesign.brr(strata, psu, fay=0.3)
+    else:
+        design = ReplicateDesign.bootstrap(strata, psu, n_rep=30, seed=4)
+    weights = w[:, None] * design.factors[design.unit]
+    out = replicate_estimates(design, y, domain, w)
+    total_var, mean_var = _brute_force(weights, design.coef, y, domain, w)
+    np.testing.assert_allclose(out["total_var"], total_var)
+    np.testing.assert_allclose(out["mean_var"], mean_var)
+
+
+@pytest.mark.parametrize("method", ["jackknife", "brr", "bootstrap"])
+def test_replicates_without_the_domain_are_left_out(sample, method):
+    rng, strata, psu, domain, w = sample(3, psus=2)
+    domain[(strata == 0) & (psu == 0)] = 10  # a domain inside one PSU
+    y = rng.normal(size=strata.size)
+    if method == "jackknife":
+        design = ReplicateDesign.jackknife(strata, psu)
+        weights, coef = _jackknife_weights(strata, psu, w)
+    else:
+        if method == "brr":
+            design = ReplicateDesign.brr(strata, psu)
+        else:
+            design = ReplicateDesign.bootstrap(strata, psu, n_rep=30, seed=4)
+        weights, coef = w[:, None] * design.factors[design.unit], design.coef
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        out = replicate_estimates(design, y, domain, w)
+    used = (weights[domain == 10].sum(0) > 0).sum()
+    if method == "jackknife":
+        assert used == design.n_replicates - 1
+    assert out["n_replicates"][10] == used < design.n_replicates
+    np.testing.assert_array_equal(out["n_replicates"][:10], design.n_replicates)
+    total_var, mean_var = _brute_force(
+        weights, coef, y, domain, w, average=method != "jackknife"
+    )
+    np.testing.assert_allclose(out["total_var"], total_var)
+    # The replicates that keep the domain scale all of it alike: zero variance.
+    np.testing.assert_allclose(out["mean_var"], mean_var, atol=1e-15)
+
+
+def test_brr_is_balanced():
+    strata = np.repeat(np.arange(5), 4)
+    psu = np.tile([0, 0, 1, 1], 5)
+    design = ReplicateDesign.brr(strata, psu)
+    assert design.n_replicates == 8
+    kept = design.factors[0::2] > 1  # first PSU of every stratum
+    assert np.all(kept.sum(1) == 4)
+    np.testing.assert_array_equal(design.factors[0::2] + design.factors[1::2], 2.0)
+    with pytest.raises(ValueError):
+        ReplicateDesign.brr(np.zeros(6), np.arange(6) % 3)
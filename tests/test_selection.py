@@ -0,0 +1,55 @@
+from math import erfc, sqrt
+
+import numpy as np
+import pytest
+
+from sae import backward_elimination, fit_h3, fit_reml, h3_stats, sufficient_stats
+from sae.selection import THRESHOLDS, _drop
+
+
+COEF = (1.0, 0.4, 0.0, 0.15, 0.0, -0.3, 0.05)
+
+
+def _stata_loop(stats, cols, fit):
+    """The book's loop, refitting for every candidate and threshold."""
+    current = list(cols)
+    for z in THRESHOLDS:
+        res = fit(stats, [0] + current)
+        t = np.abs(res.beta) / np.sqrt(np.diag(res.vcov))
+        if erfc(t.min() / sqrt(2.0)) < z:
+            break
+        for x in list(current):
+            res = fit(stats, [0] + current)
+            k = 1 + current.index(x)
+            if erfc(abs(res.beta[k]) / sqrt(res.vcov[k, k]) / sqrt(2.0)) > z:
+                current.remove(x)
+    return current
+
+
+@pytest.mark.parametrize("fit, make_stats", [(fit_h3, h3_stats), (fit_reml, sufficient_stats)])
+def test_matches_stata_loop(fit, make_stats, unit_sample):
+    _, y, X, area = unit_sample(n=400, areas=20, coef=COEF, sigma_eta=0.4)
+    stats = make_stats(y, X, area)
+    cols = list(range(1, 7))
+    selected, res = backward_elimination(stats, cols, fit=fit)
+    assert selected == _stata_loop(stats, cols, fit)
+    assert 0 < len(selected) < 6
+    np.testing.assert_allclose(res.beta, fit(stats, [0] + selected).beta)
+
+
+def test_fixed_variance_removal_is_a_downdate():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(50, 4))
+    y = rng.normal(size=50)
+    vcov = 2.0 * np.linalg.inv(X.T @ X)
+    beta, V = _drop(np.linalg.solve(X.T @ X, X.T @ y), vcov, 1)
+    keep = [0, 2, 3]
+    np.testing.assert_allclose(beta, np.linalg.lstsq(X[:, keep], y, rcond=None)[0])
+    np.testing.assert_allclose(V, 2.0 * np.linalg.inv(X[:, keep].T @ X[:, keep]))
+
+
+def test_fixed_variance_refits_selected_columns(unit_sample):
+    _, y, X, area = unit_sample(2, n=400, areas=20, coef=COEF, sigma_eta=0.4)
+    stats = h3_stats(y, X, area)
+    selected, res = backward_elimination(stats, range(1, 7), update_variance=False)
+    np.testing.assert_allclose(res.beta, fit_h3(stats, [0] + selected).beta)
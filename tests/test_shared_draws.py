@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from sae import CensusEBBatch, CensusEBEstimator, EBSpec, censuseb, censuseb_many
+from sae.index import AreaIndex
+
+
+@pytest.fixture
+def models(census_areas):
+    """A log and a level model of the same census."""
+    rng, area, xb = census_areas(areas=4, per_area=25)
+    eta = rng.normal(0.0, 0.1, 4)
+    var_eta = np.full(4, 0.01)
+    specs = {
+        "log": EBSpec(xb, eta, var_eta, 0.2, 3.0),
+        "level": EBSpec(np.exp(xb), eta, var_eta, 0.5, 3.0, transform=lambda y: y),
+    }
+    return area, specs
+
+
+def test_each_model_matches_its_own_run(models):
+    area, specs = models
+    many = censuseb_many(specs, area, mcrep=12, seed=5, batch=5, with_mean=True)
+    for name, s in specs.items():
+        one = censuseb(
+            s.xb, area, s.eta, s.var_eta, s.sigma_e2, s.povline, mcrep=12, seed=5, batch=5,
+            transform=s.transform, with_mean=True,
+        )
+        for key in one:
+            np.testing.assert_allclose(many[name][key], one[key])
+
+
+def test_batch_matches_separate_estimators(simulation):
+    sim, _, _ = simulation(1)
+    rng = np.random.default_rng(1)
+    X = np.column_stack([np.ones(100), sim.xb])
+    Xa = np.column_stack([np.ones(100), sim.index.expand(sim.index.mean(sim.xb))])
+    members = {
+        "ceb": CensusEBEstimator(X, sim.index, 2.7, mcrep=8),
+        "uc": CensusEBEstimator(Xa, sim.index, 2.7, mcrep=8),
+    }
+    y = sim.population(rng)
+    batch = CensusEBBatch(members)(y, np.random.default_rng(2))
+    for name, est in members.items():
+        alone = est(y, np.random.default_rng(2))
+        for key in alone:
+            np.testing.assert_allclose(batch[name][key], alone[key])
+
+
+def test_batch_rejects_mismatched_estimators():
+    index = AreaIndex.from_area(np.repeat(np.arange(2), 5))
+    X = np.ones((10, 1))
+    with pytest.raises(ValueError):
+        CensusEBBatch(
+            {"a": CensusEBEstimator(X, index, 1.0, mcrep=4),
+             "b": CensusEBEstimator(X, index, 1.0, mcrep=5)}
+        )
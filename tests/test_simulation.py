@@ -0,0 +1,54 @@
+import numpy as np
+
+from sae import ModelSimulation, RandomStreams, grouped_fgt
+
+
+def test_population_is_sorted_by_area(simulation):
+    sim, area, xb = simulation(areas=3, labels=[4, 1, 3])
+    np.testing.assert_array_equal(sim.index.labels, [1, 3, 4])
+    np.testing.assert_array_equal(sim.sort(area), np.sort(area))
+    np.testing.assert_array_equal(sim.xb, sim.sort(xb))
+    flat = ModelSimulation(xb, area, 0.0, 0.0)
+    np.testing.assert_array_equal(flat.population(np.random.default_rng(0)), flat.xb)
+
+
+def test_truth(simulation):
+    sim, _, _ = simulation(areas=3, labels=[4, 1, 3])
+    y = sim.population(np.random.default_rng(1))
+    true = sim.truth(y, 2.5)
+    stats = grouped_fgt(np.exp(y), 2.5, sim.index.starts)
+    np.testing.assert_allclose(true["fgt1"], stats[1])
+    np.testing.assert_allclose(true["mean"], sim.index.mean(np.exp(y)))
+    np.testing.assert_allclose(true["Y"], sim.index.mean(y))
+
+
+def test_run_matches_explicit_loop(simulation):
+    sim, _, _ = simulation(areas=3, labels=[4, 1, 3])
+
+    def estimator(y, rng):
+        return {"fgt0": sim.truth(y + rng.normal(0.0, 0.2, y.size), 2.5)["fgt0"]}
+
+    out = sim.run({"m": estimator}, 5, 2.5, seed=3)
+    rng = np.random.default_rng(3)
+    errors = []
+    for _ in range(5):
+        y = sim.population(rng)
+        true = sim.truth(y, 2.5)["fgt0"]
+        errors.append(estimator(y, rng)["fgt0"] - true)
+    errors = np.array(errors)
+    np.testing.assert_array_equal(out["area"], sim.index.labels)
+    np.testing.assert_allclose(out["m_bias_fgt0"], errors.mean(0))
+    np.testing.assert_allclose(out["m_mse_fgt0"], (errors**2).mean(0))
+    np.testing.assert_allclose(out["m_bias_fgt0_se"], errors.std(0, ddof=1) / np.sqrt(5))
+
+
+def test_population_subset_from_streams(simulation):
+    sim, _, _ = simulation(areas=3, labels=[4, 1, 3])
+    streams = RandomStreams(7)
+    full = sim.population_at(streams, 2)
+    part = sim.population_at(streams, 2, areas=[2, 0])
+    idx = sim.index
+    np.testing.assert_array_equal(
+        part, np.r_[full[idx.starts[2] :], full[: idx.starts[1]]]
+    )
+    assert not np.array_equal(full, sim.population_at(streams, 3))
@@ -0,0 +1,96 @@
+import numpy as np
+from scipy import stats
+
+from sae import (
+    AreaIndex,
+    RandomStreams,
+    TwoFoldEffects,
+    censuseb,
+    censuseb_twofold,
+    grouped_fgt,
+    nested_index,
+)
+from sae.streams import (
+    AREA,
+    ESTIMATOR,
+    HOUSEHOLD,
+    MC_AREA,
+    MC_HOUSEHOLD,
+    IterationGenerator,
+    replicate_normals,
+)
+
+
+def test_slices_do_not_depend_on_calls():
+    streams = RandomStreams(20230512)
+    key = (7, 3, HOUSEHOLD)
+    full = streams.normal(key, 0, 1001)
+    for start, size in [(0, 1), (1, 1), (100, 50), (333, 400), (999, 2)]:
+        np.testing.assert_array_equal(streams.normal(key, start, size), full[start : start + size])
+    u = streams.uniform(key, 0, 64)
+    np.testing.assert_array_equal(streams.uniform(key, 5, 10), u[5:15])
+
+
+def test_keys_and_experiments_are_independent():
+    a = RandomStreams(1)
+    assert not np.array_equal(a.normal((0, 0, AREA), 0, 8), a.normal((0, 0, HOUSEHOLD), 0, 8))
+    assert not np.array_equal(a.normal((0, 0, AREA), 0, 8), a.normal((1, 0, AREA), 0, 8))
+    b = RandomStreams(1, experiment=1)
+    assert not np.array_equal(a.normal((0, 0, AREA), 0, 8), b.normal((0, 0, AREA), 0, 8))
+    np.testing.assert_array_equal(
+        a.generator((0, 0, 9)).random(4), RandomStreams(1).generator((0, 0, 9)).random(4)
+    )
+
+
+def test_draws_are_standard_normal():
+    z = RandomStreams(3).normal((0, 0, 0), 0, 20000)
+    assert stats.kstest(z, "norm").pvalue > 1e-3
+    u = RandomStreams(3).uniform((0, 0, 1), 0, 20000)
+    assert u.min() >= 0.0 and u.max() < 1.0
+    assert stats.kstest(u, "uniform").pvalue > 1e-3
+
+
+def test_replicates_are_keyed_by_position():
+    streams = RandomStreams(5)
+    rng = IterationGenerator(streams, 4)
+    z = replicate_normals(rng, MC_HOUSEHOLD, 10, 3, 2)
+    np.testing.assert_array_equal(z[:, 1], streams.normal((4, 4, MC_HOUSEHOLD), 0, 10))
+    np.testing.assert_array_equal(rng.random(3), streams.generator((4, 0, ESTIMATOR)).random(3))
+    plain = replicate_normals(np.random.default_rng(1), MC_AREA, 4, 0, 3)
+    np.testing.assert_array_equal(plain, np.random.default_rng(1).standard_normal((4, 3)))
+
+
+def test_censuseb_replicates_can_be_regenerated(census_areas):
+    _, area, xb = census_areas(areas=4, per_area=10)
+    eta, var_eta = np.linspace(-0.1, 0.1, 4), np.full(4, 0.02)
+    streams = RandomStreams(8)
+    args = (xb, area, eta, var_eta, 0.2, 3.0)
+    out = censuseb(*args, mcrep=5, seed=IterationGenerator(streams, 2), batch=2)
+    index = AreaIndex.from_area(area)
+    stats = []
+    for r in range(5):
+        z_eta = streams.normal((2, r, MC_AREA), 0, 4)
+        z_e = streams.normal((2, r, MC_HOUSEHOLD), 0, xb.size)
+        y = xb + index.expand(eta + np.sqrt(var_eta) * z_eta) + np.sqrt(0.2) * z_e
+        stats.append(grouped_fgt(np.exp(y), 3.0, index.starts))
+    np.testing.assert_allclose(out["fgt1"], np.mean(stats, 0)[1])
+    one = censuseb(*args, mcrep=5, seed=IterationGenerator(streams, 2), batch=5)
+    np.testing.assert_allclose(one["fgt1"], out["fgt1"])
+
+
+def test_twofold_replicates_do_not_depend_on_batches(census_areas):
+    _, area, xb = census_areas(areas=3, per_area=8)
+    psu = np.tile(np.repeat([0, 1], 4), 3)
+    index = nested_index(area, psu)
+    effects = TwoFoldEffects(
+        eta=np.zeros(3), var_eta=np.full(3, 0.05), gamma_psu=np.full(6, 0.5),
+        ubar_psu=np.zeros(6), var_psu=np.full(6, 0.02),
+    )
+    streams = RandomStreams(9)
+    runs = [
+        censuseb_twofold(
+            xb, index, effects, 0.1, 3.0, mcrep=6, batch=b, seed=IterationGenerator(streams, 0)
+        )
+        for b in (1, 4)
+    ]
+    np.testing.assert_allclose(runs[0]["fgt0"], runs[1]["fgt0"])
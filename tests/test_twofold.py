@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from scipy.optimize import minimize
+
+from sae import (
+    censuseb_twofold,
+    grouped_fgt,
+    nested_index,
+    reml_twofold,
+    twofold_effects,
+)
+
+
+@pytest.fixture
+def twofold_sample(census_areas):
+    """Sample of 8 areas with 3 PSUs each: ``y, X, area, psu``."""
+
+    def make(seed=0):
+        rng, area, x = census_areas(seed, areas=8, per_area=24)
+        psu = np.tile(np.repeat(np.arange(3), 8), 8)
+        X = np.column_stack([np.ones(area.size), x])
+        effects = rng.normal(0.0, 0.6, 8)[area] + rng.normal(0.0, 0.4, 24)[area * 3 + psu]
+        y = X @ [1.0, 0.5] + effects + rng.normal(0.0, 0.7, area.size)
+        return y, X, area, psu
+
+    return make
+
+
+def _covariance(area, psu, sigma_eta2, sigma_psu2, sigma_e2):
+    same_area = area[:, None] == area[None, :]
+    same_psu = same_area & (psu[:, None] == psu[None, :])
+    return sigma_e2 * np.eye(area.size) + sigma_eta2 * same_area + sigma_psu2 * same_psu
+
+
+def _dense_reml(y, X, V):
+    """Restricted log-likelihood from the dense covariance matrix."""
+    Vi = np.linalg.inv(V)
+    A = X.T @ Vi @ X
+    r = y - X @ np.linalg.solve(A, X.T @ Vi @ y)
+    return -0.5 * (
+        np.linalg.slogdet(V)[1] + np.linalg.slogdet(A)[1] + r @ Vi @ r
+        + (y.size - X.shape[1]) * np.log(2.0 * np.pi)
+    )
+
+
+def test_matches_dense_reml(twofold_sample):
+    y, X, area, psu = twofold_sample()
+    fit = reml_twofold(y, X, area, psu)
+    V = _covariance(area, psu, fit.sigma_eta2, fit.sigma_psu2, fit.sigma_e2)
+    assert fit.loglik == pytest.approx(_dense_reml(y, X, V), rel=1e-10)
+    Vi = np.linalg.inv(V)
+    np.testing.assert_allclose(fit.vcov, np.linalg.inv(X.T @ Vi @ X))
+    np.testing.assert_allclose(fit.beta, fit.vcov @ X.T @ Vi @ y)
+
+    ref = minimize(
+        lambda s: -_dense_reml(y, X, _covariance(area, psu, *np.exp(s))),
+        np.log([0.3, 0.1, 0.5]),
+        method="Nelder-Mead",
+        options={"xatol": 1e-8, "fatol": 1e-10, "maxiter": 4000},
+    )
+    assert fit.loglik >= -ref.fun - 1e-7
+    np.testing.assert_allclose(
+        [fit.sigma_eta2, fit.sigma_psu2, fit.sigma_e2], np.exp(ref.x), rtol=1e-3
+    )
+
+
+def test_effects_match_dense_blup(twofold_sample):
+    y, X, area, psu = twofold_sample(1)
+    fit = reml_twofold(y, X, area, psu)
+    resid = y - X @ fit.beta
+    eff = twofold_effects(resid, area, psu, fit.sigma_eta2, fit.sigma_psu2, fit.sigma_e2)
+    V = _covariance(area, psu, fit.sigma_eta2, fit.sigma_psu2, fit.sigma_e2)
+    Vi_r = np.linalg.solve(V, resid)
+    for c in range(8):
+        z = (area == c).astype(float)
+        assert eff.eta[c] == pytest.approx(fit.sigma_eta2 * z @ Vi_r)
+        var = fit.sigma_eta2 - fit.sigma_eta2**2 * z @ np.linalg.solve(V, z)
+        assert eff.var_eta[c] == pytest.approx(var)
+        for p in range(3):
+            zp = z * (psu == p)
+            k = 3 * c + p
+            mean = eff.gamma_psu[k] * (eff.ubar_psu[k] - eff.eta[c])
+            assert mean == pytest.approx(fit.sigma_psu2 * zp @ Vi_r)
+
+
+def test_census_alignment_and_fixed_effects(twofold_sample):
+    y, X, area, psu = twofold_sample(2)
+    keep = area < 6
+    census = nested_index(area, psu)
+    eff = twofold_effects(y[keep], area[keep], psu[keep], 0.3, 0.1, 0.5, census=census)
+    assert eff.eta.shape == (8,) and eff.gamma_psu.shape == (24,)
+    assert np.all(eff.eta[6:] == 0.0) and np.all(eff.var_eta[6:] == 0.3)
+    assert np.all(eff.gamma_psu[18:] == 0.0) and np.all(eff.var_psu[18:] == 0.1)
+
+    # Without any randomness left, CensusEB is the FGT of the fitted welfare.
+    fixed = eff._replace(var_eta=0.0 * eff.var_eta, var_psu=0.0 * eff.var_psu)
+    xb = X @ [1.0, 0.5]
+    out = censuseb_twofold(xb, census, fixed, 0.0, 3.0, mcrep=2)
+    u = fixed.eta[census.psu_area]
+    u = u + fixed.gamma_psu * (fixed.ubar_psu - u)
+    welfare = np.exp(census.sort(xb) + census.psu.expand(u))
+    np.testing.assert_allclose(out["fgt0"], grouped_fgt(welfare, 3.0, census.area.starts)[0])
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+from sae import CensusStore, import_census
+from sae.validation import TwoStageSampler, design_validation, true_values
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    N = 3000
+    stratum = rng.integers(0, 3, N)
+    return import_census(
+        tmp_path / "census",
+        stratum * 10 + rng.integers(0, 2, N),
+        {
+            "welfare": np.exp(rng.normal(1.0, 0.5, N)),
+            "size": rng.integers(1, 6, N).astype(float),
+            "stratum": stratum,
+            "psu": rng.integers(0, 12, N),
+        },
+    )
+
+
+def _hajek_mean(store, sample, rng):
+    """Area means of welfare from the sample, plus a little estimator noise."""
+    area = store.area[sample.rows]
+    y = store["welfare"][sample.rows]
+    labels = np.asarray(store.labels)
+    pos = np.searchsorted(labels, area)
+    num = np.bincount(pos, sample.weights * y, labels.size)
+    den = np.bincount(pos, sample.weights, labels.size)
+    return {"mean": num / den + rng.normal(0.0, 0.01, labels.size)}
+
+
+def test_two_stage_sample(store):
+    sampler = TwoStageSampler(store["stratum"], store["psu"], 4, 6)
+    sample = sampler.draw(np.random.default_rng(1))
+    assert np.all(np.diff(sample.rows) > 0)
+    stratum, psu = store["stratum"][sample.rows], store["psu"][sample.rows]
+    for h in range(3):
+        chosen = np.unique(psu[stratum == h])
+        assert chosen.size == 4
+        for p in chosen:
+            in_psu = (store["stratum"] == h) & (store["psu"] == p)
+            taken = (stratum == h) & (psu == p)
+            assert taken.sum() == min(6, in_psu.sum())
+            expected = 12 / 4 * in_psu.sum() / taken.sum()
+            np.testing.assert_allclose(sample.weights[taken], expected)
+
+
+def test_true_values_are_cached(store):
+    first = true_values(store, "welfare", 3.0, weights="size")
+    y, w = np.asarray(store["welfare"]), np.asarray(store["size"])
+    for d, label in enumerate(store.labels):
+        rows = store.area == label
+        np.testing.assert_allclose(first["mean"][d], np.average(y[rows], weights=w[rows]))
+        np.testing.assert_allclose(first["fgt0"][d], np.average(y[rows] < 3.0, weights=w[rows]))
+    again = true_values(store, "welfare", 3.0, weights="size")
+    np.testing.assert_array_equal(again["fgt1"], first["fgt1"])
+    other = true_values(store, "welfare", 2.0, weights="size")
+    assert not np.array_equal(other["fgt0"], first["fgt0"])
+
+
+def test_true_values_follow_the_census(tmp_path):
+    path = tmp_path / "census"
+    store = import_census(path, [0, 1], {"welfare": np.ones(2)})
+    np.testing.assert_array_equal(true_values(store, "welfare", 2.0)["fgt0"], [1.0, 1.0])
+    store = import_census(path, [0, 1], {"welfare": np.full(2, 5.0)}, overwrite=True)
+    np.testing.assert_array_equal(true_values(store, "welfare", 2.0)["fgt0"], [0.0, 0.0])
+
+    # A variable rewritten in place, with the same size, invalidates the cache.
+    np.save(path / "welfare.npy", np.ones(2))
+    stat = os.stat(path / "welfare.npy")
+    os.utime(path / "welfare.npy", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    store = CensusStore(path)
+    np.testing.assert_array_equal(true_values(store, "welfare", 2.0)["fgt0"], [1.0, 1.0])
+
+
+def test_design_validation(store):
+    sampler = TwoStageSampler(store["stratum"], store["psu"], 4, 6)
+    truth = true_values(store, "welfare", 3.0)
+    kwargs = dict(n_samples=6, seed=3)
+    one = design_validation(store, sampler, {"hajek": _hajek_mean}, truth, workers=1, **kwargs)
+    two = design_validation(store, sampler, {"hajek": _hajek_mean}, truth, workers=2, **kwargs)
+    for key in one:
+        np.testing.assert_allclose(two[key], one[key])
+
+    errors = []
+    for seed in np.random.SeedSequence(3).spawn(6):
+        rng = np.random.default_rng(seed)
+        sample = sampler.draw(rng)
+        errors.append(_hajek_mean(store, sample, rng)["mean"] - truth["mean"])
+    np.testing.assert_allclose(one["hajek_bias_mean"], np.mean(errors, 0))
+    np.testing.assert_allclose(one["hajek_mse_mean"], np.mean(np.square(errors), 0))
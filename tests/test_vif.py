@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from sae import stepwise_vif
+
+
+def _auxiliary_vif(X, w, active):
+    """VIF of every active column from one weighted regression per column."""
+    vif = {}
+    sw = np.sqrt(w)
+    for j in active:
+        others = [k for k in active if k != j]
+        Z = np.column_stack([np.ones(X.shape[0])] + [X[:, k] for k in others])
+        coef = np.linalg.lstsq(Z * sw[:, None], X[:, j] * sw, rcond=None)[0]
+        resid = X[:, j] - Z @ coef
+        centered = X[:, j] - np.average(X[:, j], weights=w)
+        vif[j] = (w @ centered**2) / (w @ resid**2)
+    return vif
+
+
+def _stepwise(X, w, threshold):
+    active = list(range(X.shape[1]))
+    while active:
+        vif = _auxiliary_vif(X, w, active)
+        worst = max(active, key=lambda j: vif[j])
+        if vif[worst] <= threshold:
+            break
+        active.remove(worst)
+    return active
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+@pytest.mark.parametrize("threshold", [1.5, 3.0, 10.0])
+def test_matches_auxiliary_regressions(weighted, threshold):
+    rng = np.random.default_rng(0)
+    Z = rng.normal(size=(300, 4))
+    X = np.column_stack(
+        [Z, Z[:, 0] + 0.3 * rng.normal(size=300), Z[:, 1] - Z[:, 2] + 0.5 * rng.normal(size=300)]
+    )
+    w = rng.uniform(0.5, 2.0, 300) if weighted else np.ones(300)
+    got = stepwise_vif(X, w if weighted else None, threshold)
+    assert got == _stepwise(X, w, threshold)
+
+
+def test_exactly_collinear_column_is_dropped():
+    rng = np.random.default_rng(1)
+    Z = rng.normal(size=(100, 2))
+    X = np.column_stack([Z, Z.sum(1), rng.normal(size=100)])
+    assert stepwise_vif(X) == [0, 1, 3]